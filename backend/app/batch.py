@@ -0,0 +1,241 @@
+"""
+Score a dataset of (image, question) pairs offline and write the answers as JSONL
+
+The manifest is a JSONL file (one object per line) or a CSV file with an `image`
+column (path, relative to --image-dir), a `question` column and an optional `id`
+column; rows without an id are identified by their position in the manifest.
+Rows are grouped by image so each image is decoded and encoded once for all of
+its questions. Images are decoded by DataLoader worker processes.
+
+Results are appended to the output file as each batch finishes. Rerunning with
+the same output file skips rows that already have a result, so an interrupted
+run resumes where it stopped.
+
+Usage:
+    python -m app.batch MANIFEST --output results.jsonl [--image-dir DIR] [--workers 4]
+"""
+import os
+import csv
+import json
+import time
+import argparse
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Set
+
+import torch
+from torch.utils.data import DataLoader, Dataset
+
+from app.services.model_service import ModelService
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def read_manifest(path: str) -> List[Dict]:
+    """
+    Read the manifest rows
+
+    Args:
+        path (str): Path to a .csv file, or a JSONL file otherwise
+
+    Returns:
+        List[Dict]: Rows with id, image and question keys
+    """
+    with open(path, newline="") as f:
+        if path.lower().endswith(".csv"):
+            records = list(csv.DictReader(f))
+        else:
+            records = [json.loads(line) for line in f if line.strip()]
+
+    rows = []
+    for index, record in enumerate(records):
+        image = record.get("image") or record.get("image_path")
+        if not image or not record.get("question"):
+            raise ValueError(f"Manifest row {index} needs an image and a question")
+        row_id = record.get("id")
+        rows.append({
+            "id": str(row_id) if row_id not in (None, "") else str(index),
+            "image": image,
+            "question": record["question"],
+        })
+    return rows
+
+def read_completed(output_path: str) -> Set[str]:
+    """
+    Read the IDs of rows already scored in an output file
+
+    A truncated last line, left by an interrupted run, is removed from the file.
+
+    Args:
+        output_path (str): Path to the output JSONL file
+
+    Returns:
+        Set[str]: IDs of rows with a result
+    """
+    if not os.path.exists(output_path):
+        return set()
+
+    completed = set()
+    valid_bytes = 0
+    with open(output_path, "rb") as f:
+        for line in f:
+            try:
+                completed.add(json.loads(line)["id"])
+            except (ValueError, KeyError):
+                break
+            valid_bytes += len(line)
+
+    if valid_bytes < os.path.getsize(output_path):
+        logger.warning(f"Discarding incomplete results at the end of {output_path}")
+        with open(output_path, "r+b") as f:
+            f.truncate(valid_bytes)
+    return completed
+
+class ImageDataset(Dataset):
+    """Decodes and resizes each distinct image of the manifest once"""
+
+    def __init__(self, image_paths: List[str], preprocessor):
+        self.image_paths = image_paths
+        self.preprocessor = preprocessor
+
+    def __len__(self):
+        return len(self.image_paths)
+
+    def __getitem__(self, index):
+        try:
+            return index, self.preprocessor.load_image(self.image_paths[index]), None
+        except Exception as e:
+            return index, None, str(e)
+
+def collate_images(items):
+    """Keep decoded images as uint8 arrays, they are normalized as one batch in the main process"""
+    return items
+
+def score(
+    model_service: ModelService,
+    rows: List[Dict],
+    output_path: str,
+    image_dir: str = "",
+    image_batch_size: int = 32,
+    question_batch_size: int = 256,
+    num_workers: int = 4
+) -> Dict[str, float]:
+    """
+    Score manifest rows, appending results to the output file
+
+    Args:
+        model_service (ModelService): The loaded model service
+        rows (List[Dict]): Rows still to score
+        output_path (str): Path to the output JSONL file
+        image_dir (str): Directory image paths are relative to
+        image_batch_size (int): Images encoded per forward pass
+        question_batch_size (int): Maximum questions encoded and classified per forward pass
+        num_workers (int): DataLoader processes decoding images, 0 decodes in the main process
+
+    Returns:
+        Dict[str, float]: Images and questions scored, elapsed seconds and throughput
+    """
+    # Group rows by image so each image is encoded once for all its questions
+    groups: Dict[str, List[Dict]] = OrderedDict()
+    for row in rows:
+        groups.setdefault(row["image"], []).append(row)
+    images = list(groups)
+
+    dataset = ImageDataset([os.path.join(image_dir, image) for image in images], model_service.preprocessor)
+    loader = DataLoader(
+        dataset,
+        batch_size=image_batch_size,
+        num_workers=num_workers,
+        collate_fn=collate_images,
+        persistent_workers=False
+    )
+
+    num_images = 0
+    num_questions = 0
+    start = time.perf_counter()
+    with open(output_path, "a") as out:
+        for batch in loader:
+            decoded = [(index, array) for index, array, _ in batch if array is not None]
+            for index, _, error in batch:
+                if error is not None:
+                    logger.warning(f"Could not decode {images[index]}: {error}")
+                    for row in groups[images[index]]:
+                        out.write(json.dumps({**row, "error": error}) + "\n")
+
+            if decoded:
+                pixel_values = model_service.preprocessor.to_pixel_values([array for _, array in decoded])
+                vision_embeds = model_service.encode_pixel_values(pixel_values)
+
+                # Pair every question with the row of its image's embedding
+                pairs = [
+                    (position, row)
+                    for position, (index, _) in enumerate(decoded)
+                    for row in groups[images[index]]
+                ]
+                for offset in range(0, len(pairs), question_batch_size):
+                    chunk = pairs[offset:offset + question_batch_size]
+                    positions = torch.tensor([position for position, _ in chunk], device=vision_embeds.device)
+                    text_embeds = model_service.encode_questions([row["question"] for _, row in chunk], use_cache=False)
+                    results = model_service.predict_from_embeddings(vision_embeds[positions], text_embeds)
+                    for (_, row), result in zip(chunk, results):
+                        out.write(json.dumps({**row, **result}) + "\n")
+
+                num_images += len(decoded)
+                num_questions += len(pairs)
+
+            # Each finished batch is a checkpoint
+            out.flush()
+            elapsed = time.perf_counter() - start
+            logger.info(
+                f"Scored {num_images}/{len(images)} images, {num_questions} questions "
+                f"({num_images / elapsed:.1f} images/s, {num_questions / elapsed:.1f} questions/s)"
+            )
+
+    elapsed = time.perf_counter() - start
+    return {
+        "images": num_images,
+        "questions": num_questions,
+        "seconds": elapsed,
+        "images_per_sec": num_images / elapsed if elapsed else 0.0,
+        "questions_per_sec": num_questions / elapsed if elapsed else 0.0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a dataset of image/question pairs offline")
+    parser.add_argument("manifest", help="JSONL or CSV manifest with image, question and optional id columns")
+    parser.add_argument("--output", required=True, help="Output JSONL file, resumed if it exists")
+    parser.add_argument("--image-dir", default="", help="Directory image paths are relative to")
+    parser.add_argument("--image-batch-size", type=int, default=32)
+    parser.add_argument("--question-batch-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=4, help="Image decoding processes")
+    args = parser.parse_args()
+
+    model_service = ModelService()
+    if not model_service.load_model():
+        raise SystemExit("Failed to load the model")
+
+    rows = read_manifest(args.manifest)
+    completed = read_completed(args.output)
+    remaining = [row for row in rows if row["id"] not in completed]
+    if completed:
+        logger.info(f"Resuming: {len(rows) - len(remaining)} of {len(rows)} rows already scored")
+
+    stats = score(
+        model_service,
+        remaining,
+        args.output,
+        image_dir=args.image_dir,
+        image_batch_size=args.image_batch_size,
+        question_batch_size=args.question_batch_size,
+        num_workers=args.workers
+    )
+    logger.info(
+        f"Done: {stats['images']} images and {stats['questions']} questions in {stats['seconds']:.1f}s "
+        f"({stats['images_per_sec']:.1f} images/s, {stats['questions_per_sec']:.1f} questions/s)"
+    )
+
+if __name__ == "__main__":
+    main()
@@ -17,6 +17,7 @@ class Settings(BaseSettings):
     
     # Model settings
     MODEL_PATH: str = os.getenv("MODEL_PATH", "./models/vqa_model_best.pt")
+    MODEL_ARTIFACT_DIR: str = os.getenv("MODEL_ARTIFACT_DIR", "./models/artifact")  # Used if present
     TEXT_MODEL: str = os.getenv("TEXT_MODEL", "bert-base-uncased")
     VISION_MODEL: str = os.getenv("VISION_MODEL", "google/vit-base-patch16-384")
     HUGGINGFACE_TOKEN: str = os.getenv("HUGGINGFACE_TOKEN", "")
@@ -25,12 +26,74 @@ class Settings(BaseSettings):
     HF_MODEL_REPO: str = os.getenv("HF_MODEL_REPO", "dixisouls/VQA")
     HF_MODEL_FILENAME: str = os.getenv("HF_MODEL_FILENAME", "model.pt")
     
+    # Inference settings
+    INFERENCE_PRECISION: str = os.getenv("INFERENCE_PRECISION", "fp32")  # fp32, int8 or bf16
+    INFERENCE_BACKEND: str = os.getenv("INFERENCE_BACKEND", "eager")  # eager, torchscript or onnx
+    EXPORT_DIR: str = os.getenv("EXPORT_DIR", "./models/exports")  # Exported graphs for the backends
+    
+    # Tokenization settings
+    MAX_QUESTION_LENGTH: int = int(os.getenv("MAX_QUESTION_LENGTH", "128"))  # Tokens
+    QUESTION_LENGTH_BUCKET: int = int(os.getenv("QUESTION_LENGTH_BUCKET", "0"))  # Tokens, 0 = off
+    
+    # Inference cache settings
+    VISION_CACHE_SIZE: int = int(os.getenv("VISION_CACHE_SIZE", "256"))  # Sessions
+    QUESTION_CACHE_SIZE: int = int(os.getenv("QUESTION_CACHE_SIZE", "1024"))  # Distinct questions
+    
+    # Result cache settings (answers keyed by image content hash + question)
+    RESULT_CACHE_SIZE: int = int(os.getenv("RESULT_CACHE_SIZE", "4096"))  # Results
+    RESULT_CACHE_TTL: int = int(os.getenv("RESULT_CACHE_TTL", str(60 * 60 * 24)))  # Seconds, 0 = no expiry
+    RESULT_CACHE_BACKEND: str = os.getenv("RESULT_CACHE_BACKEND", "memory")  # memory or sqlite
+    RESULT_CACHE_PATH: str = os.getenv("RESULT_CACHE_PATH", "./cache/results.sqlite3")
+    
+    # Batching settings
+    BATCH_MAX_SIZE: int = int(os.getenv("BATCH_MAX_SIZE", "16"))
+    BATCH_MAX_WAIT_MS: float = float(os.getenv("BATCH_MAX_WAIT_MS", "10"))
+    
+    # Inference worker pool settings
+    INFERENCE_WORKERS: int = int(os.getenv("INFERENCE_WORKERS", "1"))  # Concurrent batches
+    INFERENCE_THREADS: int = int(os.getenv("INFERENCE_THREADS", "0"))  # Torch threads per process, 0 = auto
+    INTEROP_THREADS: int = int(os.getenv("INTEROP_THREADS", "1"))  # Torch inter-op threads per process, 0 = default
+    SERVER_WORKERS: int = int(os.getenv("SERVER_WORKERS", os.getenv("WEB_CONCURRENCY", "1")))  # Processes started by app.serve or uvicorn
+    INFERENCE_QUEUE_SIZE: int = int(os.getenv("INFERENCE_QUEUE_SIZE", "64"))  # Pending requests
+    INFERENCE_RETRY_AFTER: int = int(os.getenv("INFERENCE_RETRY_AFTER", "1"))  # Seconds
+    PREPROCESS_WORKERS: int = int(os.getenv("PREPROCESS_WORKERS", "4"))  # Image decoding threads
+    
+    # Fast tier: the same weights at a reduced resolution and/or depth, enabled if any is set
+    FAST_IMAGE_SIZE: int = int(os.getenv("FAST_IMAGE_SIZE", "0"))  # Input size in pixels, 0 = full size
+    FAST_VISION_LAYERS: int = int(os.getenv("FAST_VISION_LAYERS", "0"))  # Vision encoder layers, 0 = all
+    FAST_TEXT_LAYERS: int = int(os.getenv("FAST_TEXT_LAYERS", "0"))  # Text encoder layers, 0 = all
+    DEFAULT_QUALITY: str = os.getenv("DEFAULT_QUALITY", "accurate")  # Tier for requests not choosing one
+    FAST_TIER_QUEUE_THRESHOLD: int = int(os.getenv("FAST_TIER_QUEUE_THRESHOLD", "0"))  # Queue depth routing to fast, 0 = off
+    
+    # Token pruning: skip encoder work the CLS embeddings don't need
+    TOKEN_PRUNE_RATIO: float = float(os.getenv("TOKEN_PRUNE_RATIO", "0"))  # Patch tokens dropped per pruning layer, 0 = off
+    TOKEN_PRUNE_LAYERS: str = os.getenv("TOKEN_PRUNE_LAYERS", "")  # Comma-separated vision layers, empty = auto
+    CLS_ONLY_FINAL_LAYER: bool = os.getenv("CLS_ONLY_FINAL_LAYER", "false").lower() == "true"  # Exact, CLS row only
+    
     # API settings
-    MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10MB
+    MAX_UPLOAD_SIZE: int = int(os.getenv("MAX_UPLOAD_SIZE", str(10 * 1024 * 1024)))  # 10MB
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024  # Bytes read per chunk when streaming uploads to disk
+    
+    # Early exit: skip the answer classifier for confidently unanswerable questions
+    EARLY_EXIT_THRESHOLD: float = float(os.getenv("EARLY_EXIT_THRESHOLD", "0"))  # Unanswerable confidence, 0 = disabled
+    EARLY_EXIT_ANSWER: str = os.getenv("EARLY_EXIT_ANSWER", "unanswerable")  # Answer given on early exit
+    
+    # Top-k answer settings
+    MAX_TOP_K: int = int(os.getenv("MAX_TOP_K", "10"))  # Maximum answers returned per question
+    
+    # Multi-question settings
+    MAX_BATCH_QUESTIONS: int = int(os.getenv("MAX_BATCH_QUESTIONS", "32"))  # Questions per ask_batch call
+    
+    # Upload preprocessing settings
+    UPLOAD_PREPROCESS: bool = os.getenv("UPLOAD_PREPROCESS", "true").lower() == "true"  # Resize images once at upload
     
     # Storage settings
     UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "./uploads")
+    UPLOAD_QUOTA_BYTES: int = int(os.getenv("UPLOAD_QUOTA_BYTES", "0"))  # Stored images, 0 = unlimited
     MAX_SESSION_AGE: int = 60 * 30  # 30 minutes
+    SESSION_STORE_BACKEND: str = os.getenv("SESSION_STORE_BACKEND", "memory")  # memory or sqlite
+    SESSION_STORE_PATH: str = os.getenv("SESSION_STORE_PATH", "./cache/sessions.sqlite3")
+    SESSION_SWEEP_INTERVAL: int = int(os.getenv("SESSION_SWEEP_INTERVAL", "60"))  # Seconds between sweeps
     
     # CORS settings
     ALLOW_ORIGINS: list[str] = ["*"]
@@ -0,0 +1,72 @@
+"""
+Convert a training checkpoint into a self-contained model artifact
+
+The artifact directory holds the weights as safetensors (memory-mapped at load
+time), the VQA and encoder configs, the answer vocabulary, and the tokenizer and
+image processor files, so the server can start without the Hugging Face cache.
+
+Usage:
+    python -m app.convert [--checkpoint MODEL_PATH] [--output MODEL_ARTIFACT_DIR]
+"""
+import os
+import json
+import argparse
+import logging
+
+import torch
+from transformers import AutoConfig, AutoTokenizer, ViTImageProcessor
+from safetensors.torch import save_file
+
+from app.config import settings
+from app.services.model_service import ARTIFACT_CONFIG, ARTIFACT_VOCAB, ARTIFACT_WEIGHTS
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def convert_checkpoint(checkpoint_path: str, output_dir: str):
+    """
+    Convert a training checkpoint into a model artifact
+
+    Args:
+        checkpoint_path (str): Path to the checkpoint saved by the training script
+        output_dir (str): Directory to write the artifact to
+    """
+    checkpoint = torch.load(checkpoint_path, map_location="cpu")
+    config = checkpoint['config']
+    if 'answer_vocab' not in checkpoint:
+        raise ValueError("No vocabulary found in model checkpoint")
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Weights, made contiguous and unshared as safetensors requires
+    state_dict = {k: v.detach().clone().contiguous() for k, v in checkpoint['model_state_dict'].items()}
+    save_file(state_dict, os.path.join(output_dir, ARTIFACT_WEIGHTS))
+
+    # VQA config plus the full encoder configs, so no download is needed to build the model
+    with open(os.path.join(output_dir, ARTIFACT_CONFIG), "w") as f:
+        json.dump({
+            "config": config,
+            "vision_config": AutoConfig.from_pretrained(config['vision_model']).to_dict(),
+            "text_config": AutoConfig.from_pretrained(config['text_model']).to_dict(),
+        }, f, indent=2)
+    with open(os.path.join(output_dir, ARTIFACT_VOCAB), "w") as f:
+        json.dump(checkpoint['answer_vocab'], f)
+
+    # Preprocessor files
+    ViTImageProcessor.from_pretrained(config['vision_model']).save_pretrained(output_dir)
+    AutoTokenizer.from_pretrained(config['text_model']).save_pretrained(output_dir)
+
+    logger.info(f"Converted {checkpoint_path} to {output_dir}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a training checkpoint into a model artifact")
+    parser.add_argument("--checkpoint", default=settings.MODEL_PATH)
+    parser.add_argument("--output", default=settings.MODEL_ARTIFACT_DIR)
+    args = parser.parse_args()
+    convert_checkpoint(args.checkpoint, args.output)
+
+if __name__ == "__main__":
+    main()
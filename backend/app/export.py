@@ -0,0 +1,33 @@
+"""
+Export the VQA model for the TorchScript or ONNX Runtime inference backends
+
+Usage:
+    python -m app.export --backend torchscript|onnx [--export-dir DIR]
+"""
+import argparse
+import logging
+
+from app.config import settings
+from app.services.model_service import ModelService
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the VQA model for an inference backend")
+    parser.add_argument("--backend", choices=["torchscript", "onnx"], required=True)
+    parser.add_argument("--export-dir", default=settings.EXPORT_DIR, help="Root directory for exported graphs")
+    args = parser.parse_args()
+
+    # Loading the model with a non-eager backend exports it if the export is missing or stale
+    settings.INFERENCE_BACKEND = args.backend
+    settings.EXPORT_DIR = args.export_dir
+    if not ModelService().load_model():
+        raise SystemExit("Failed to load and export the model")
+    logger.info(f"Model exported for the {args.backend} backend under {args.export_dir}")
+
+if __name__ == "__main__":
+    main()
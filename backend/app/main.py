@@ -2,14 +2,23 @@
 Main FastAPI application entry point
 """
 import os
+import asyncio
 import logging
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
 
+from app.config import settings
 from app.routers import vqa
 from app.services.model_service import ModelService
+from app.services.batch_service import BatchScheduler
+from app.services.result_cache import create_result_cache
+from app.utils.single_flight import SingleFlight
+from app.utils.upload_limits import UploadSizeLimitMiddleware
+from app.utils.metrics import (
+    REGISTRY, CONTENT_TYPE, Counter, Gauge, RequestMetricsMiddleware, process_rss_bytes
+)
 
 # Configure logging
 logging.basicConfig(
@@ -21,14 +30,34 @@ logger = logging.getLogger(__name__)
 # Initialize model service in a lifespan context manager
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Load model on startup
-    logger.info("Loading VQA model...")
-    app.state.model_service = ModelService()
-    app.state.model_service.load_model()
+    # Load model on startup, unless it was preloaded before forking the workers (app.serve)
+    if getattr(app.state, "model_service", None) is None:
+        logger.info("Loading VQA model...")
+        app.state.model_service = ModelService()
+        app.state.model_service.load_model()
+    # Drop cached image embeddings when a session releases its image
+    vqa.session_service.add_removal_callback(app.state.model_service.evict_image)
     logger.info("VQA model loaded successfully")
+    # Memoize answers by image content and question
+    namespace = app.state.model_service.model_id or ""
+    if app.state.model_service.early_exit_threshold > 0:
+        # Early-exited answers differ from full predictions, so cache them separately
+        namespace += f":early_exit={app.state.model_service.early_exit_threshold:g}"
+    app.state.result_cache = create_result_cache(namespace=namespace)
+    # Share predictions between identical questions asked at the same time
+    app.state.single_flight = SingleFlight()
+    # Start the micro-batching scheduler in front of the model
+    app.state.batch_scheduler = BatchScheduler(app.state.model_service)
+    await app.state.batch_scheduler.start()
+    # Remove images left behind by sessions of previous runs
+    await asyncio.to_thread(vqa.session_service.reconcile_uploads)
+    # Remove expired sessions and their images in the background
+    session_sweeper = asyncio.create_task(vqa.session_service.run_sweeper(settings.SESSION_SWEEP_INTERVAL))
     yield
+    session_sweeper.cancel()
     # Clean up resources on shutdown
     logger.info("Shutting down...")
+    await app.state.batch_scheduler.stop()
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -38,6 +67,14 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Reject oversized uploads while the body is still arriving, added before CORS so
+# the 413 still gets CORS headers and browsers can read it
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_size=settings.MAX_UPLOAD_SIZE,
+    paths=["/api/vqa/upload"]
+)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -47,6 +84,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Count and time requests by route for /metrics
+app.add_middleware(RequestMetricsMiddleware)
+
 # Mount static files directory if it exists
 static_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "static")
 if os.path.exists(static_dir):
@@ -63,6 +103,52 @@ async def health_check():
         raise HTTPException(status_code=503, detail="Model not loaded")
     return {"status": "healthy", "model_loaded": True}
 
+def _cache_stats():
+    """Stats of the vision, question and result caches, by cache name"""
+    model_service = getattr(app.state, "model_service", None)
+    result_cache = getattr(app.state, "result_cache", None)
+    if model_service is None or result_cache is None:
+        return {}
+    return {
+        "vision": model_service.vision_cache.stats(),
+        "question": model_service.question_cache.stats(),
+        "result": result_cache.stats(),
+    }
+
+def _scheduler_value(attribute):
+    """Read an attribute of the batch scheduler, None before it has started"""
+    scheduler = getattr(app.state, "batch_scheduler", None)
+    return getattr(scheduler, attribute) if scheduler is not None else None
+
+# Values read when /metrics is scraped; counters and latency histograms are
+# defined next to the code they instrument
+Gauge("vqa_active_sessions", "Open sessions", fn=lambda: len(vqa.session_service.store))
+Gauge(
+    "vqa_upload_dir_bytes", "Size of the stored images on disk, each shared image counted once",
+    fn=vqa.session_service.blobs.usage_bytes
+)
+Gauge("vqa_process_resident_memory_bytes", "Resident memory of this worker process", fn=process_rss_bytes)
+Gauge("vqa_inference_queue_depth", "Questions waiting for a batch", fn=lambda: _scheduler_value("queue_depth"))
+Gauge("vqa_inference_active_batches", "Batches running on the model", fn=lambda: _scheduler_value("active_batches"))
+Counter(
+    "vqa_cache_hits_total", "Cache hits by cache", ("cache",),
+    fn=lambda: {(name,): stats["hits"] for name, stats in _cache_stats().items()}
+)
+Counter(
+    "vqa_cache_misses_total", "Cache misses by cache", ("cache",),
+    fn=lambda: {(name,): stats["misses"] for name, stats in _cache_stats().items()}
+)
+Counter(
+    "vqa_coalesced_requests_total", "Questions that waited on an identical question already being answered",
+    fn=lambda: app.state.single_flight.coalesced if hasattr(app.state, "single_flight") else None
+)
+
+# Prometheus metrics endpoint
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Metrics of this worker process in the Prometheus text format (run in a thread, collecting reads the disk)"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
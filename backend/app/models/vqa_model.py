@@ -2,25 +2,35 @@
 Model implementation for VQA
 """
 import os
+import copy
 import json
+import math
 import torch
 import torch.nn as nn
-from transformers import AutoTokenizer, AutoModel, AutoConfig, ViTImageProcessor, ViTModel
+from transformers import AutoTokenizer, AutoModel, AutoConfig, BertModel, ViTImageProcessor, ViTModel
 
 class VQAModel(nn.Module):
     """Vision-Language model for Visual Question Answering"""
-    def __init__(self, config, num_answers):
+    def __init__(self, config, num_answers, vision_config=None, text_config=None):
         super(VQAModel, self).__init__()
         self.config = config
         self.num_answers = num_answers
         
-        # Vision encoder
-        self.vision_config = AutoConfig.from_pretrained(config['vision_model'])
-        self.vision_encoder = ViTModel.from_pretrained(config['vision_model'])
+        # Vision encoder (pretrained weights unless built from a config)
+        if vision_config is None:
+            self.vision_config = AutoConfig.from_pretrained(config['vision_model'])
+            self.vision_encoder = ViTModel.from_pretrained(config['vision_model'])
+        else:
+            self.vision_config = vision_config
+            self.vision_encoder = ViTModel(vision_config)
         
-        # Text encoder
-        self.text_config = AutoConfig.from_pretrained(config['text_model'])
-        self.text_encoder = AutoModel.from_pretrained(config['text_model'])
+        # Text encoder (pretrained weights unless built from a config)
+        if text_config is None:
+            self.text_config = AutoConfig.from_pretrained(config['text_model'])
+            self.text_encoder = AutoModel.from_pretrained(config['text_model'])
+        else:
+            self.text_config = text_config
+            self.text_encoder = AutoModel.from_config(text_config)
         
         # Projection layers
         self.vision_projection = nn.Linear(
@@ -56,28 +66,293 @@ class VQAModel(nn.Module):
             nn.Linear(config['hidden_size'] // 2, 2)  # Binary classification
         )
         
-    def forward(self, image_encodings, question_encodings):
-        """Forward pass of the model"""
-        # Process image
-        vision_outputs = self.vision_encoder(**image_encodings)
-        vision_embeds = vision_outputs.last_hidden_state[:, 0]  # CLS token
-        vision_embeds = self.vision_projection(vision_embeds)
+        # Inference shortcuts, see set_token_pruning
+        self.token_prune_ratio = 0.0
+        self.token_prune_layers = None
+        self.cls_only_final_layer = False
         
-        # Process text
-        text_outputs = self.text_encoder(**question_encodings)
-        text_embeds = text_outputs.last_hidden_state[:, 0]  # CLS token
-        text_embeds = self.text_projection(text_embeds)
+    @classmethod
+    def from_config(cls, config, num_answers, vision_config, text_config):
+        """
+        Build the model from encoder configs without downloading pretrained weights
         
-        # Combine modalities
+        The encoders are randomly initialized, so this is meant to be followed by
+        loading a trained state dict.
+        
+        Args:
+            config (dict): VQA model configuration
+            num_answers (int): Size of the answer vocabulary
+            vision_config (PretrainedConfig or dict): Vision encoder configuration
+            text_config (PretrainedConfig or dict): Text encoder configuration
+            
+        Returns:
+            VQAModel: The model
+        """
+        if isinstance(vision_config, dict):
+            vision_config = AutoConfig.for_model(**vision_config)
+        if isinstance(text_config, dict):
+            text_config = AutoConfig.for_model(**text_config)
+        return cls(config, num_answers, vision_config=vision_config, text_config=text_config)
+    
+    def reduced(self, image_size=None, vision_layers=None, text_layers=None):
+        """
+        Build a cheaper variant of the model sharing its weights
+        
+        The variant can take smaller images, with the position embeddings interpolated
+        once to the new patch grid, and can run only the first layers of each encoder.
+        
+        Args:
+            image_size (int, optional): Input image size, None to keep the encoder's
+            vision_layers (int, optional): Number of vision encoder layers to run, None for all
+            text_layers (int, optional): Number of text encoder layers to run, None for all
+            
+        Returns:
+            VQAModel: The reduced model
+        """
+        variant = _shallow_copy(self)
+        if image_size and image_size != self.vision_config.image_size:
+            variant.vision_encoder = _resize_vit(self.vision_encoder, image_size)
+        if vision_layers:
+            variant.vision_encoder = _truncate_encoder(variant.vision_encoder, vision_layers)
+        if text_layers:
+            variant.text_encoder = _truncate_encoder(self.text_encoder, text_layers)
+        return variant
+    
+    def set_token_pruning(self, ratio=0.0, layers=None, cls_only_final_layer=False):
+        """
+        Configure inference shortcuts that skip work the CLS embeddings don't need
+        
+        Only the CLS token of each encoder's output is used. With a prune ratio, the
+        patch tokens the CLS token attends to least are dropped after the given vision
+        encoder layers, so later layers process fewer tokens. This changes the
+        embeddings slightly. With cls_only_final_layer, the last layer of each encoder
+        computes only the CLS token's output, which gives the same embeddings.
+        
+        Args:
+            ratio (float): Fraction of the remaining patch tokens dropped at each pruning layer, 0 to disable
+            layers (List[int], optional): Vision encoder layers (0-based) after which to prune,
+                None for a quarter, half and three quarters of the depth
+            cls_only_final_layer (bool): Compute only the CLS token in the last layer of each encoder
+        """
+        if not 0 <= ratio < 1:
+            raise ValueError(f"Token prune ratio must be in [0, 1), got {ratio}")
+        self.token_prune_ratio = ratio
+        self.token_prune_layers = sorted(set(layers)) if layers is not None else None
+        self.cls_only_final_layer = cls_only_final_layer
+    
+    def encode_image(self, image_encodings):
+        """Encode images into projected vision embeddings (CLS token)"""
+        if self.token_prune_ratio > 0 or self.cls_only_final_layer:
+            vision_embeds = _encode_vit_cls(
+                self.vision_encoder,
+                image_encodings['pixel_values'],
+                self.token_prune_ratio,
+                self.token_prune_layers,
+                self.cls_only_final_layer
+            )
+        else:
+            vision_outputs = self.vision_encoder(**image_encodings)
+            vision_embeds = vision_outputs.last_hidden_state[:, 0]  # CLS token
+        return self.vision_projection(vision_embeds)
+    
+    def encode_question(self, question_encodings):
+        """Encode questions into projected text embeddings (CLS token)"""
+        if self.cls_only_final_layer and _supports_cls_only(self.text_encoder):
+            text_embeds = _encode_bert_cls(self.text_encoder, **question_encodings)
+        else:
+            text_outputs = self.text_encoder(**question_encodings)
+            text_embeds = text_outputs.last_hidden_state[:, 0]  # CLS token
+        return self.text_projection(text_embeds)
+    
+    def fuse(self, vision_embeds, text_embeds):
+        """Fuse projected image and question embeddings"""
         multimodal_features = torch.cat([vision_embeds, text_embeds], dim=1)
-        fused_features = self.fusion(multimodal_features)
+        return self.fusion(multimodal_features)
+    
+    def classify_answerable(self, fused_features):
+        """Predict whether the questions are answerable from fused features"""
+        return self.answerable_classifier(fused_features)
+    
+    def classify_answer(self, fused_features):
+        """Predict answer logits from fused features"""
+        return self.classifier(fused_features)
+    
+    def classify(self, vision_embeds, text_embeds):
+        """Fuse projected embeddings and run the prediction heads"""
+        # Combine modalities
+        fused_features = self.fuse(vision_embeds, text_embeds)
         
         # Predict answers and answerable
-        answer_logits = self.classifier(fused_features)
-        answerable_logits = self.answerable_classifier(fused_features)
+        answer_logits = self.classify_answer(fused_features)
+        answerable_logits = self.classify_answerable(fused_features)
         
         return {
             'answer_logits': answer_logits,
             'answerable_logits': answerable_logits,
             'fused_features': fused_features
-        }
\ No newline at end of file
+        }
+        
+    def forward(self, image_encodings, question_encodings):
+        """Forward pass of the model"""
+        vision_embeds = self.encode_image(image_encodings)
+        text_embeds = self.encode_question(question_encodings)
+        return self.classify(vision_embeds, text_embeds)
+
+def _shallow_copy(module):
+    """Copy a module so its submodules can be replaced, sharing all parameters and buffers"""
+    module_copy = copy.copy(module)
+    module_copy._modules = module._modules.copy()
+    return module_copy
+
+def _truncate_encoder(encoder, num_layers):
+    """Copy a Hugging Face encoder model running only its first num_layers layers, sharing weights"""
+    layers = encoder.encoder.layer
+    if not 0 < num_layers <= len(layers):
+        raise ValueError(f"Cannot truncate a {len(layers)}-layer encoder to {num_layers} layers")
+    truncated = _shallow_copy(encoder)
+    truncated.encoder = _shallow_copy(encoder.encoder)
+    truncated.encoder.layer = nn.ModuleList(layers[:num_layers])
+    return truncated
+
+def _resize_vit(vision_encoder, image_size):
+    """Copy a ViT encoder taking image_size inputs, with bicubically interpolated position embeddings"""
+    embeddings = vision_encoder.embeddings
+    patch_embeddings = embeddings.patch_embeddings
+    patch_size = patch_embeddings.patch_size[0]
+    if image_size % patch_size:
+        raise ValueError(f"Image size {image_size} is not a multiple of the patch size {patch_size}")
+    
+    # Position embeddings are the CLS token's, then one per patch on a square grid
+    position_embeddings = embeddings.position_embeddings.detach()
+    grid_size = int((position_embeddings.shape[1] - 1) ** 0.5)
+    new_grid_size = image_size // patch_size
+    patch_positions = position_embeddings[:, 1:].reshape(1, grid_size, grid_size, -1).permute(0, 3, 1, 2)
+    # Same scale factor as ViTEmbeddings.interpolate_pos_encoding, so results match interpolating per call
+    scale_factor = (new_grid_size + 0.1) / grid_size
+    patch_positions = nn.functional.interpolate(
+        patch_positions.float(), scale_factor=(scale_factor, scale_factor), mode='bicubic', align_corners=False
+    ).to(position_embeddings.dtype)
+    patch_positions = patch_positions.permute(0, 2, 3, 1).reshape(1, new_grid_size * new_grid_size, -1)
+    
+    resized = _shallow_copy(vision_encoder)
+    resized.embeddings = _shallow_copy(embeddings)
+    resized.embeddings.patch_embeddings = copy.copy(patch_embeddings)
+    resized.embeddings.patch_embeddings.image_size = (image_size, image_size)
+    resized.embeddings.patch_embeddings.num_patches = new_grid_size * new_grid_size
+    resized.embeddings._parameters = embeddings._parameters.copy()
+    resized.embeddings.position_embeddings = nn.Parameter(
+        torch.cat([position_embeddings[:, :1], patch_positions], dim=1), requires_grad=False
+    )
+    return resized
+
+def default_prune_layers(num_layers):
+    """Vision encoder layers to prune after by default: at a quarter, half and three quarters of the depth"""
+    return sorted({num_layers // 4, num_layers // 2, 3 * num_layers // 4} - {num_layers - 1})
+
+def _cls_attention(self_attention, query_states, hidden_states, attention_mask=None):
+    """Multi-head attention context for the query rows only, attending over all hidden states"""
+    query = self_attention.transpose_for_scores(self_attention.query(query_states))
+    key = self_attention.transpose_for_scores(self_attention.key(hidden_states))
+    value = self_attention.transpose_for_scores(self_attention.value(hidden_states))
+    
+    scores = torch.matmul(query, key.transpose(-1, -2)) / math.sqrt(self_attention.attention_head_size)
+    if attention_mask is not None:
+        scores = scores + attention_mask
+    probs = nn.functional.softmax(scores, dim=-1)
+    
+    context = torch.matmul(probs, value).permute(0, 2, 1, 3)
+    return context.reshape(context.shape[0], context.shape[1], self_attention.all_head_size)
+
+def _vit_cls_layer(layer, hidden_states):
+    """Run a ViT layer for the CLS token only (keys and values still come from every token)"""
+    normed = layer.layernorm_before(hidden_states)
+    cls_states = hidden_states[:, :1]
+    attention_output = layer.attention.output(
+        _cls_attention(layer.attention.attention, normed[:, :1], normed), cls_states
+    )
+    cls_states = attention_output + cls_states
+    return layer.output(layer.intermediate(layer.layernorm_after(cls_states)), cls_states)
+
+def _bert_cls_layer(layer, hidden_states, attention_mask):
+    """Run a BERT layer for the CLS token only (keys and values still come from every token)"""
+    attention_output = layer.attention.output(
+        _cls_attention(layer.attention.self, hidden_states[:, :1], hidden_states, attention_mask),
+        hidden_states[:, :1]
+    )
+    return layer.output(layer.intermediate(attention_output), attention_output)
+
+def _prune_tokens(hidden_states, attention_probs, ratio):
+    """Keep the CLS token and the patch tokens it attends to most, averaged over heads"""
+    # A constant when tracing: exported graphs take a fixed image size
+    num_patches = int(hidden_states.shape[1]) - 1
+    num_kept = max(1, int(round(num_patches * (1 - ratio))))
+    if num_kept >= num_patches:
+        return hidden_states
+    importance = attention_probs[:, :, 0, 1:].mean(dim=1)
+    kept = importance.topk(num_kept, dim=1).indices
+    patches = hidden_states[:, 1:].gather(1, kept.unsqueeze(-1).expand(-1, -1, hidden_states.shape[-1]))
+    return torch.cat([hidden_states[:, :1], patches], dim=1)
+
+def _encode_vit_cls(vision_encoder, pixel_values, ratio, prune_layers, cls_only_final_layer):
+    """
+    Compute the ViT's final CLS hidden state, pruning patch tokens and/or the last layer's other outputs
+    
+    Args:
+        vision_encoder (ViTModel): Vision encoder
+        pixel_values (torch.Tensor): Normalized images of shape (batch_size, 3, height, width)
+        ratio (float): Fraction of patch tokens dropped at each pruning layer, 0 to disable
+        prune_layers (List[int], optional): Layers after which to prune, None for the default
+        cls_only_final_layer (bool): Compute only the CLS token in the last layer
+        
+    Returns:
+        torch.Tensor: CLS hidden states of shape (batch_size, hidden_size)
+    """
+    expected_dtype = vision_encoder.embeddings.patch_embeddings.projection.weight.dtype
+    hidden_states = vision_encoder.embeddings(pixel_values.to(expected_dtype))
+    
+    layers = vision_encoder.encoder.layer
+    if ratio <= 0:
+        prune_layers = ()
+    elif prune_layers is None:
+        prune_layers = default_prune_layers(len(layers))
+    num_full_layers = len(layers) - 1 if cls_only_final_layer else len(layers)
+    for i, layer in enumerate(layers[:num_full_layers]):
+        if i in prune_layers:
+            hidden_states, attention_probs = layer(hidden_states, output_attentions=True)
+            hidden_states = _prune_tokens(hidden_states, attention_probs, ratio)
+        else:
+            hidden_states = layer(hidden_states)[0]
+    if cls_only_final_layer:
+        hidden_states = _vit_cls_layer(layers[-1], hidden_states)
+    
+    return vision_encoder.layernorm(hidden_states[:, 0])
+
+def _supports_cls_only(text_encoder):
+    """Whether _encode_bert_cls can run the text encoder (BERT with absolute position embeddings)"""
+    return (
+        isinstance(text_encoder, BertModel)
+        and getattr(text_encoder.config, 'position_embedding_type', 'absolute') == 'absolute'
+    )
+
+def _encode_bert_cls(text_encoder, input_ids, attention_mask=None, token_type_ids=None):
+    """
+    Compute BERT's final CLS hidden state, running the last layer for the CLS token only
+    
+    Args:
+        text_encoder (BertModel): Text encoder
+        input_ids (torch.Tensor): Token IDs of shape (batch_size, seq_len)
+        attention_mask (torch.Tensor, optional): Padding mask of shape (batch_size, seq_len)
+        token_type_ids (torch.Tensor, optional): Segment IDs of shape (batch_size, seq_len)
+        
+    Returns:
+        torch.Tensor: CLS hidden states of shape (batch_size, hidden_size)
+    """
+    if attention_mask is None:
+        attention_mask = torch.ones_like(input_ids)
+    extended_mask = text_encoder.get_extended_attention_mask(attention_mask, input_ids.shape)
+    hidden_states = text_encoder.embeddings(input_ids=input_ids, token_type_ids=token_type_ids)
+    
+    layers = text_encoder.encoder.layer
+    for layer in layers[:-1]:
+        hidden_states = layer(hidden_states, attention_mask=extended_mask)[0]
+    return _bert_cls_layer(layers[-1], hidden_states, extended_mask)[:, 0]
@@ -1,14 +1,21 @@
 """
 API router for VQA endpoints
 """
+import json
+import asyncio
 import logging
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks, Request
+from typing import List, Literal, Optional
+from fastapi import (
+    APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks, Request,
+    WebSocket, WebSocketDisconnect
+)
 from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
-from app.services.session_service import SessionService
+from app.config import settings
+from app.services.session_service import SessionService, InvalidImageError, UploadTooLargeError
 from app.services.model_service import ModelService
+from app.services.batch_service import QueueFullError
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +30,13 @@ class QuestionRequest(BaseModel):
     """Model for question request"""
     session_id: str
     question: str
+    top_k: int = Field(1, ge=1, le=settings.MAX_TOP_K)
+    quality: Optional[Literal["fast", "accurate"]] = None  # Model tier, chosen by load if omitted
+
+class TopAnswer(BaseModel):
+    """Model for one of the most likely answers"""
+    answer: str
+    confidence: float
 
 class AnswerResponse(BaseModel):
     """Model for answer response"""
@@ -30,6 +44,19 @@ class AnswerResponse(BaseModel):
     answer_confidence: float
     is_answerable: bool
     answerable_confidence: float
+    top_answers: Optional[List[TopAnswer]] = None  # Only when more than one answer was requested
+    quality: Optional[str] = None  # Model tier that answered
+
+class BatchQuestionRequest(BaseModel):
+    """Model for a request with several questions about one image"""
+    session_id: str
+    questions: List[str]
+    top_k: int = Field(1, ge=1, le=settings.MAX_TOP_K)
+    quality: Optional[Literal["fast", "accurate"]] = None  # Model tier, chosen by load if omitted
+
+class BatchAnswerResponse(BaseModel):
+    """Model for the answers to several questions, in the order asked"""
+    answers: List[AnswerResponse]
 
 class SessionHistoryItem(BaseModel):
     """Model for session history item"""
@@ -45,6 +72,41 @@ class SessionResponse(BaseModel):
 # Dependency for services
 session_service = SessionService()
 
+# Error for questions about a session whose image was released by completing it
+NO_IMAGE_DETAIL = "Session is completed and its image is no longer available"
+
+# Error for WebSocket messages that can't be parsed or validated
+INVALID_MESSAGE_DETAIL = (
+    "Invalid message: expected JSON with a non-empty question, top_k between 1 and "
+    f"{settings.MAX_TOP_K}, and quality fast or accurate"
+)
+
+def select_tier(app, quality: Optional[str]) -> ModelService:
+    """
+    Pick the model tier answering a request
+    
+    Requests not choosing a quality are answered by the fast tier while the inference
+    queue is at least FAST_TIER_QUEUE_THRESHOLD deep, and by DEFAULT_QUALITY otherwise.
+    
+    Args:
+        app: The FastAPI application
+        quality (str, optional): "fast", "accurate" or None
+        
+    Returns:
+        ModelService: The tier, the full model if there is no fast tier
+    """
+    if quality is None:
+        threshold = settings.FAST_TIER_QUEUE_THRESHOLD
+        if threshold > 0 and app.state.batch_scheduler.queue_depth >= threshold:
+            quality = "fast"
+        else:
+            quality = settings.DEFAULT_QUALITY
+    return app.state.model_service.get_tier(quality)
+
+def _cache_tier(tier: ModelService) -> Optional[str]:
+    """Result cache tier of a model tier, None for the full model the cache is namespaced by"""
+    return tier.model_id if tier.quality != "accurate" else None
+
 @router.post("/upload", response_model=dict)
 async def upload_image(
     request: Request,
@@ -65,16 +127,22 @@ async def upload_image(
         raise HTTPException(status_code=400, detail="File must be an image")
     
     try:
-        # Create a new session
-        session_id = session_service.create_session(file)
+        # Create a new session, preprocessing the image once for all its questions
+        model_service = request.app.state.model_service
+        preprocess = model_service.preprocess_image if settings.UPLOAD_PREPROCESS else None
+        session_id = await session_service.create_session(file, preprocess)
         
         return {"session_id": session_id}
     
+    except InvalidImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         logger.error(f"Error uploading image: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/ask", response_model=AnswerResponse)
+@router.post("/ask", response_model=AnswerResponse, response_model_exclude_none=True)
 async def ask_question(
     request: Request,
     question_request: QuestionRequest
@@ -88,28 +156,295 @@ async def ask_question(
     Returns:
         AnswerResponse: The answer
     """
-    # Get the model service from app state
+    # Get the services from app state
     model_service = request.app.state.model_service
+    batch_scheduler = request.app.state.batch_scheduler
+    result_cache = request.app.state.result_cache
     
     # Get the session
-    session = session_service.get_session(question_request.session_id)
+    session = await asyncio.to_thread(session_service.get_session, question_request.session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found or expired")
+    if not session.image_path:
+        # Completed sessions keep their history but no longer have an image to ask about
+        raise HTTPException(status_code=409, detail=NO_IMAGE_DETAIL)
     
     try:
-        # Make prediction
-        result = model_service.predict(session.image_path, question_request.question)
+        tier = select_tier(request.app, question_request.quality)
+        
+        # Reuse the answer if this image content was already asked this question
+        question_key = model_service.normalize_question(question_request.question)
+        result = None
+        if session.image_hash:
+            result = await result_cache.aget(session.image_hash, question_key, question_request.top_k, _cache_tier(tier))
+        
+        if result is None:
+            async def predict():
+                # Make prediction (batched with concurrent requests)
+                result = await batch_scheduler.submit(
+                    session.image_path,
+                    question_request.question,
+                    cache_key=session.session_id,
+                    top_k=question_request.top_k,
+                    model_service=tier
+                )
+                if session.image_hash:
+                    await result_cache.aput(
+                        session.image_hash, question_key, result, question_request.top_k, _cache_tier(tier)
+                    )
+                return result
+            
+            # Identical questions about the same image content already in flight share one prediction
+            flight_key = (
+                session.image_hash or session.session_id, question_key, question_request.top_k, tier.model_id
+            )
+            result = await request.app.state.single_flight.run(flight_key, predict)
+        result = {**result, "quality": tier.quality}
         
         # Add to session history
-        session.add_question(question_request.question, result)
+        await asyncio.to_thread(session_service.add_question, session, question_request.question, result)
         
         return result
     
+    except QueueFullError as e:
+        logger.warning(f"Rejecting question: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy, please retry shortly",
+            headers={"Retry-After": str(settings.INFERENCE_RETRY_AFTER)}
+        )
     except Exception as e:
         logger.error(f"Error processing question: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/session/{session_id}", response_model=SessionResponse)
+@router.post("/ask_batch", response_model=BatchAnswerResponse, response_model_exclude_none=True)
+async def ask_questions(
+    request: Request,
+    batch_request: BatchQuestionRequest
+):
+    """
+    Ask several questions about the uploaded image in one call
+    
+    The image is encoded once and the questions are answered in a single batch.
+    
+    Args:
+        batch_request (BatchQuestionRequest): The questions request
+        
+    Returns:
+        BatchAnswerResponse: The answers, in the order of the questions
+    """
+    if not batch_request.questions:
+        raise HTTPException(status_code=400, detail="At least one question is required")
+    if len(batch_request.questions) > settings.MAX_BATCH_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.MAX_BATCH_QUESTIONS} questions can be asked at once"
+        )
+    
+    # Get the services from app state
+    model_service = request.app.state.model_service
+    batch_scheduler = request.app.state.batch_scheduler
+    result_cache = request.app.state.result_cache
+    
+    # Get the session
+    session = await asyncio.to_thread(session_service.get_session, batch_request.session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    if not session.image_path:
+        # Completed sessions keep their history but no longer have an image to ask about
+        raise HTTPException(status_code=409, detail=NO_IMAGE_DETAIL)
+    
+    try:
+        tier = select_tier(request.app, batch_request.quality)
+        
+        # Answer each distinct question once, reusing cached answers
+        question_keys = [model_service.normalize_question(question) for question in batch_request.questions]
+        results = {}
+        for question, question_key in zip(batch_request.questions, question_keys):
+            if question_key in results:
+                continue
+            results[question_key] = (
+                await result_cache.aget(session.image_hash, question_key, batch_request.top_k, _cache_tier(tier))
+                if session.image_hash else None
+            )
+        
+        missing = {
+            question_key: question
+            for question, question_key in zip(batch_request.questions, question_keys)
+            if results[question_key] is None
+        }
+        if missing:
+            predictions = await batch_scheduler.submit_many(
+                session.image_path,
+                list(missing.values()),
+                cache_key=session.session_id,
+                top_k=batch_request.top_k,
+                model_service=tier
+            )
+            for question_key, result in zip(missing, predictions):
+                results[question_key] = result
+                if session.image_hash:
+                    await result_cache.aput(session.image_hash, question_key, result, batch_request.top_k, _cache_tier(tier))
+        
+        # Add to session history
+        answers = [{**results[question_key], "quality": tier.quality} for question_key in question_keys]
+        def add_history():
+            for question, result in zip(batch_request.questions, answers):
+                session_service.add_question(session, question, result)
+        await asyncio.to_thread(add_history)
+        
+        return {"answers": answers}
+    
+    except QueueFullError as e:
+        logger.warning(f"Rejecting questions: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy, please retry shortly",
+            headers={"Retry-After": str(settings.INFERENCE_RETRY_AFTER)}
+        )
+    except Exception as e:
+        logger.error(f"Error processing questions: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.websocket("/ws/{session_id}")
+async def stream_answers(websocket: WebSocket, session_id: str):
+    """
+    Answer questions about the uploaded image over a WebSocket, reporting each stage as it finishes
+    
+    The client sends messages like {"question": "...", "top_k": 3, "quality": "fast"} on
+    one connection (top_k and quality are optional).
+    For each question the server sends an "answerable" message with the answerable
+    verdict as soon as it is known, then an "answer" message with the top answers.
+    
+    Args:
+        websocket (WebSocket): The WebSocket connection
+        session_id (str): The session ID
+    """
+    if not await asyncio.to_thread(session_service.get_session, session_id):
+        await websocket.close(code=4404, reason="Session not found or expired")
+        return
+    
+    await websocket.accept()
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+                question = message["question"]
+                top_k = int(message.get("top_k", 1))
+                quality = message.get("quality")
+                if not isinstance(question, str) or not question.strip():
+                    raise ValueError("question must be a non-empty string")
+                if not 1 <= top_k <= settings.MAX_TOP_K:
+                    raise ValueError(f"top_k must be between 1 and {settings.MAX_TOP_K}")
+                if quality not in (None, "fast", "accurate"):
+                    raise ValueError("quality must be fast or accurate")
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                logger.warning(f"Invalid WebSocket message for session {session_id}: {e}")
+                await websocket.send_json({"type": "error", "detail": INVALID_MESSAGE_DETAIL})
+                continue
+            
+            session = await asyncio.to_thread(session_service.get_session, session_id)
+            if not session:
+                await websocket.send_json({"type": "error", "detail": "Session not found or expired"})
+                await websocket.close(code=4404)
+                return
+            if not session.image_path:
+                await websocket.send_json({"type": "error", "detail": NO_IMAGE_DETAIL})
+                continue
+            
+            try:
+                await _stream_answer(websocket, session, question, top_k, quality)
+            except QueueFullError as e:
+                logger.warning(f"Rejecting question: {e}")
+                await websocket.send_json({"type": "error", "detail": "Server is busy, please retry shortly"})
+            except Exception as e:
+                logger.error(f"Error processing question: {e}")
+                await websocket.send_json({"type": "error", "detail": str(e)})
+    except WebSocketDisconnect:
+        logger.info(f"WebSocket for session {session_id} disconnected")
+
+async def _stream_answer(websocket: WebSocket, session, question: str, top_k: int, quality: Optional[str] = None):
+    """
+    Answer one question, sending the answerable verdict and then the top answers
+    
+    Args:
+        websocket (WebSocket): The WebSocket connection
+        session (Session): The session
+        question (str): The question
+        top_k (int): Number of answers to send
+        quality (str, optional): Model tier, chosen by load if None
+    """
+    model_service = select_tier(websocket.app, quality)
+    batch_scheduler = websocket.app.state.batch_scheduler
+    result_cache = websocket.app.state.result_cache
+    
+    question_key = model_service.normalize_question(question)
+    result = None
+    if session.image_hash:
+        result = await result_cache.aget(session.image_hash, question_key, top_k, _cache_tier(model_service))
+    
+    if result is not None:
+        verdict = {
+            "is_answerable": result["is_answerable"],
+            "answerable_confidence": result["answerable_confidence"]
+        }
+        await websocket.send_json({"type": "answerable", "question": question, **verdict})
+        top_answers = result.get("top_answers") or [
+            {"answer": result["answer"], "confidence": result["answer_confidence"]}
+        ]
+    else:
+        verdict, state = await batch_scheduler.run(
+            model_service.predict_answerable,
+            session.image_path,
+            question,
+            session.session_id
+        )
+        await websocket.send_json({"type": "answerable", "question": question, **verdict})
+        
+        top_answers = await batch_scheduler.run(model_service.predict_answers, state, top_k)
+        result = {
+            "answer": top_answers[0]["answer"],
+            "answer_confidence": top_answers[0]["confidence"],
+            **verdict
+        }
+        if top_k > 1:
+            result["top_answers"] = top_answers
+        if session.image_hash:
+            await result_cache.aput(session.image_hash, question_key, result, top_k, _cache_tier(model_service))
+    result = {**result, "quality": model_service.quality}
+    
+    # Add to session history
+    await asyncio.to_thread(session_service.add_question, session, question, result)
+    
+    await websocket.send_json({"type": "answer", "question": question, **result, "top_answers": top_answers})
+
+@router.get("/stats")
+async def get_stats(request: Request):
+    """
+    Get inference statistics
+    
+    Returns:
+        dict: Batching, cache, request coalescing and early exit statistics, and the fast tier's if configured
+    """
+    model_service = request.app.state.model_service
+    stats = {
+        "batching": request.app.state.batch_scheduler.get_stats(),
+        "vision_cache": model_service.vision_cache.stats(),
+        "question_cache": model_service.question_cache.stats(),
+        "result_cache": await asyncio.to_thread(request.app.state.result_cache.stats),
+        "coalescing": request.app.state.single_flight.stats(),
+        "early_exit": model_service.get_early_exit_stats()
+    }
+    if model_service.fast_tier is not None:
+        stats["fast_tier"] = {
+            "model_id": model_service.fast_tier.model_id,
+            "vision_cache": model_service.fast_tier.vision_cache.stats(),
+            "question_cache": model_service.fast_tier.question_cache.stats(),
+            "early_exit": model_service.fast_tier.get_early_exit_stats()
+        }
+    return stats
+
+@router.get("/session/{session_id}", response_model=SessionResponse, response_model_exclude_none=True)
 async def get_session(
     request: Request,
     session_id: str
@@ -124,13 +459,13 @@ async def get_session(
         SessionResponse: The session information
     """
     # Get the session
-    session = session_service.get_session(session_id)
+    session = await asyncio.to_thread(session_service.get_session, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found or expired")
     
     return {
         "session_id": session.session_id,
-        "history": session.questions
+        "history": await asyncio.to_thread(session_service.get_questions, session)
     }
 
 @router.post("/session/{session_id}/complete")
@@ -148,12 +483,12 @@ async def complete_session(
         dict: Success message
     """
     # Check if session exists
-    session = session_service.get_session(session_id)
+    session = await asyncio.to_thread(session_service.get_session, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found or expired")
     
     # Complete the session (delete image but keep session data temporarily)
-    success = session_service.complete_session(session_id)
+    success = await asyncio.to_thread(session_service.complete_session, session_id)
     
     if success:
         return {"message": "Session completed successfully, resources cleaned up"}
@@ -175,11 +510,11 @@ async def reset_session(
         dict: Success message
     """
     # Check if session exists
-    session = session_service.get_session(session_id)
+    session = await asyncio.to_thread(session_service.get_session, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found or expired")
     
     # Remove the session
-    session_service._remove_session(session_id)
+    await asyncio.to_thread(session_service._remove_session, session_id)
     
     return {"message": "Session reset successfully"}
\ No newline at end of file
@@ -0,0 +1,120 @@
+"""
+Serve the API from several worker processes sharing one copy of the model
+
+`uvicorn --workers N` starts each worker as a fresh process that loads the model
+itself, so N workers hold N copies of ViT and BERT and start up N times. This
+launcher loads the model once, then forks the workers from the loaded process:
+the weights are shared copy-on-write (and artifact weights, memory-mapped from
+the safetensors file, share the page cache), and every worker is ready as soon
+as it is forked. Each worker gets its share of the CPU cores as torch threads,
+shared by its inference workers (see SERVER_WORKERS and INFERENCE_THREADS).
+
+Usage:
+    python -m app.serve [--workers N] [--host HOST] [--port PORT]
+"""
+import os
+import gc
+import signal
+import socket
+import argparse
+import logging
+
+import torch
+import uvicorn
+
+from app.config import settings
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    """Create the listening socket shared by all workers"""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+def run_worker(app, sock: socket.socket, num_threads: int):
+    """Serve requests in a forked worker until it is told to stop"""
+    torch.set_num_threads(num_threads)
+    config = uvicorn.Config(app, log_level="info", timeout_keep_alive=5)
+    uvicorn.Server(config).run(sockets=[sock])
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the API from workers sharing one copy of the model")
+    parser.add_argument("--workers", type=int, default=settings.SERVER_WORKERS)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    # Sessions kept in memory would only be visible to the worker that created them
+    if args.workers > 1 and settings.SESSION_STORE_BACKEND != "sqlite":
+        raise SystemExit("Running several workers needs SESSION_STORE_BACKEND=sqlite")
+
+    # The thread budget and the fast tokenizers' thread pool must be settled before forking
+    settings.SERVER_WORKERS = args.workers
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+    from app.main import app
+    from app.services.model_service import ModelService, get_thread_budget
+
+    # Load the model once, the lifespan of each worker reuses it
+    model_service = ModelService()
+    if not model_service.load_model():
+        raise SystemExit("Failed to load the model")
+    app.state.model_service = model_service
+
+    sock = bind_socket(args.host, args.port)
+    num_threads = get_thread_budget()
+    logger.info(
+        f"Starting {args.workers} workers on {args.host}:{args.port} "
+        f"with {num_threads} torch threads per process"
+    )
+
+    # Keep the garbage collector from touching (and so copying) the objects loaded so far
+    gc.collect()
+    gc.freeze()
+
+    workers = []
+    for _ in range(args.workers):
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                run_worker(app, sock, num_threads)
+            except BaseException:
+                logger.exception("Worker failed")
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        workers.append(pid)
+        logger.info(f"Started worker {pid}")
+
+    def stop_workers(signum, frame):
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop_workers)
+    signal.signal(signal.SIGINT, stop_workers)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        if pid in workers:
+            workers.remove(pid)
+            logger.info(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}")
+    sock.close()
+
+if __name__ == "__main__":
+    main()
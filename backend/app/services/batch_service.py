@@ -0,0 +1,352 @@
+"""
+Batching service for grouping concurrent VQA requests into single forward passes
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from app.config import settings
+from app.services.model_service import ModelService
+from app.utils.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Number of recent requests/batches kept for latency and batch-size statistics
+STATS_WINDOW = 10000
+
+QUEUED_REQUESTS = Counter("vqa_inference_requests_total", "Questions answered by the batch scheduler")
+REJECTED_REQUESTS = Counter("vqa_inference_rejected_total", "Questions rejected because the inference queue was full")
+BATCHES = Counter("vqa_inference_batches_total", "Batches run by the batch scheduler")
+QUEUE_WAIT = Histogram("vqa_queue_wait_seconds", "Time questions wait in the inference queue")
+BATCH_SIZE = Histogram(
+    "vqa_batch_size", "Questions per batch", buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+
+def _percentile(values, percentile: float) -> float:
+    """Nearest-rank percentile of a sequence of values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(percentile / 100 * len(ordered))) - 1))
+    return float(ordered[index])
+
+class QueueFullError(Exception):
+    """Raised when the inference queue is at capacity"""
+
+class PendingRequest:
+    """A request waiting in the batch queue"""
+    def __init__(
+        self,
+        image_path: str,
+        question: str,
+        cache_key: Optional[str],
+        future: asyncio.Future,
+        top_k: int = 1,
+        model_service: Optional[ModelService] = None
+    ):
+        self.image_path = image_path
+        self.question = question
+        self.cache_key = cache_key
+        self.future = future
+        self.top_k = top_k
+        self.model_service = model_service  # Model tier answering the request
+        self.enqueued_at = time.perf_counter()
+
+class BatchScheduler:
+    """Collects pending requests and runs them through the model in micro-batches"""
+
+    def __init__(
+        self,
+        model_service: ModelService,
+        max_batch_size: int = settings.BATCH_MAX_SIZE,
+        max_wait_ms: float = settings.BATCH_MAX_WAIT_MS,
+        max_workers: int = settings.INFERENCE_WORKERS,
+        max_queue_size: int = settings.INFERENCE_QUEUE_SIZE
+    ):
+        """
+        Initialize the batch scheduler
+
+        Args:
+            model_service (ModelService): The loaded model service
+            max_batch_size (int): Maximum number of requests per forward pass
+            max_wait_ms (float): Maximum time a request waits for a batch to fill
+            max_workers (int): Maximum number of batches running concurrently
+            max_queue_size (int): Maximum number of requests waiting for a batch
+        """
+        self.model_service = model_service
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.max_workers = max(1, max_workers)
+        self.max_queue_size = max_queue_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        # Statistics
+        self.total_requests = 0
+        self.total_batches = 0
+        self.total_rejected = 0
+        self.active_batches = 0
+        self.staged_calls = 0  # Calls submitted through run, waiting or running
+        self._queue_waits = deque(maxlen=STATS_WINDOW)
+        self._batch_sizes = deque(maxlen=STATS_WINDOW)
+
+    async def start(self):
+        """Start the inference worker pool and one batching loop per worker"""
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.max_workers)]
+        logger.info(
+            f"Batch scheduler started (max_batch_size={self.max_batch_size}, "
+            f"max_wait_ms={self.max_wait * 1000:g}, workers={self.max_workers}, "
+            f"max_queue_size={self.max_queue_size})"
+        )
+
+    async def stop(self):
+        """Stop the batching loops and fail any requests still queued"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+        while self._queue is not None and not self._queue.empty():
+            pending = self._queue.get_nowait()
+            if not pending.future.done():
+                pending.future.set_exception(RuntimeError("Batch scheduler stopped"))
+
+    async def submit(
+        self,
+        image_path: str,
+        question: str,
+        cache_key: Optional[str] = None,
+        top_k: int = 1,
+        model_service: Optional[ModelService] = None
+    ) -> Dict:
+        """
+        Queue a request and wait for its prediction
+
+        Args:
+            image_path (str): Path to the image file
+            question (str): Question about the image
+            cache_key (str, optional): Key under which the image embedding is cached
+            top_k (int): Number of answers to return
+            model_service (ModelService, optional): Model tier to answer with, the scheduler's model by default
+
+        Returns:
+            dict: Prediction results
+
+        Raises:
+            QueueFullError: If the inference queue is at capacity
+        """
+        if self._queue is None:
+            raise RuntimeError("Batch scheduler not started")
+
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait(PendingRequest(
+                image_path, question, cache_key, future, top_k, model_service or self.model_service
+            ))
+        except asyncio.QueueFull:
+            self.total_rejected += 1
+            REJECTED_REQUESTS.inc()
+            raise QueueFullError(f"Inference queue is full ({self.max_queue_size} pending requests)")
+        return await future
+
+    async def submit_many(
+        self,
+        image_path: str,
+        questions: List[str],
+        cache_key: Optional[str] = None,
+        top_k: int = 1,
+        model_service: Optional[ModelService] = None
+    ) -> List[Dict]:
+        """
+        Queue several questions about one image and wait for all their predictions
+
+        The requests are queued together, so they are normally answered in the same
+        forward pass and the image is encoded once.
+
+        Args:
+            image_path (str): Path to the image file
+            questions (List[str]): Questions about the image
+            cache_key (str, optional): Key under which the image embedding is cached
+            top_k (int): Number of answers to return per question
+            model_service (ModelService, optional): Model tier to answer with, the scheduler's model by default
+
+        Returns:
+            List[dict]: Prediction results, in the same order as the questions
+
+        Raises:
+            QueueFullError: If the inference queue cannot take all the questions
+        """
+        if self._queue is None:
+            raise RuntimeError("Batch scheduler not started")
+
+        if self._queue.maxsize > 0 and self._queue.qsize() + len(questions) > self._queue.maxsize:
+            self.total_rejected += len(questions)
+            REJECTED_REQUESTS.inc(len(questions))
+            raise QueueFullError(f"Inference queue is full ({self.max_queue_size} pending requests)")
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        for question in questions:
+            future = loop.create_future()
+            self._queue.put_nowait(PendingRequest(
+                image_path, question, cache_key, future, top_k, model_service or self.model_service
+            ))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    async def run(self, fn: Callable, *args):
+        """
+        Run a function on the inference worker pool, outside of micro-batching
+
+        Used for staged predictions, whose stages are reported as they finish. Like
+        queued requests, at most max_queue_size calls wait for or use the worker pool.
+
+        Args:
+            fn (Callable): The function to run
+            *args: Arguments for the function
+
+        Returns:
+            The function's return value
+
+        Raises:
+            QueueFullError: If max_queue_size calls are already pending
+        """
+        if self._executor is None:
+            raise RuntimeError("Batch scheduler not started")
+
+        if self.max_queue_size > 0 and self.staged_calls >= self.max_queue_size:
+            self.total_rejected += 1
+            REJECTED_REQUESTS.inc()
+            raise QueueFullError(f"Inference queue is full ({self.max_queue_size} pending staged calls)")
+
+        self.staged_calls += 1
+        self.active_batches += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.active_batches -= 1
+            self.staged_calls -= 1
+
+    async def _collect_batch(self) -> List[PendingRequest]:
+        """Wait for the first request, then gather more until the batch is full or the wait expires"""
+        batch = [await self._queue.get()]
+        deadline = batch[0].enqueued_at + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        """Batching loop"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+
+            # Skip requests whose callers have gone away
+            batch = [pending for pending in batch if not pending.future.done()]
+            if not batch:
+                continue
+
+            started_at = time.perf_counter()
+            self.total_requests += len(batch)
+            self.total_batches += 1
+            self._batch_sizes.append(len(batch))
+            self._queue_waits.extend(started_at - pending.enqueued_at for pending in batch)
+            QUEUED_REQUESTS.inc(len(batch))
+            BATCHES.inc()
+            BATCH_SIZE.observe(len(batch))
+            for pending in batch:
+                QUEUE_WAIT.observe(started_at - pending.enqueued_at)
+
+            # Requests for different model tiers run as separate forward passes
+            groups: Dict[int, List[PendingRequest]] = {}
+            for pending in batch:
+                groups.setdefault(id(pending.model_service), []).append(pending)
+            for group in groups.values():
+                await self._run_group(loop, group)
+
+    async def _run_group(self, loop: asyncio.AbstractEventLoop, batch: List[PendingRequest]):
+        """
+        Run a batch of requests for one model tier and resolve their futures
+
+        If the batch fails, its requests are retried one at a time, so a bad request
+        (e.g. an unreadable image) only fails itself and not the requests batched with it.
+        """
+        error = None
+        self.active_batches += 1
+        try:
+            results = await loop.run_in_executor(
+                self._executor,
+                batch[0].model_service.predict_batch,
+                [(pending.image_path, pending.question, pending.cache_key) for pending in batch],
+                [pending.top_k for pending in batch]
+            )
+        except Exception as e:
+            error = e
+        finally:
+            self.active_batches -= 1
+
+        if error is not None:
+            if len(batch) > 1:
+                logger.warning(f"Batch of {len(batch)} requests failed ({error}), running them one at a time")
+                for pending in batch:
+                    if not pending.future.done():
+                        await self._run_group(loop, [pending])
+                return
+            logger.error(f"Error running request: {error}")
+            if not batch[0].future.done():
+                batch[0].future.set_exception(error)
+            return
+
+        for pending, result in zip(batch, results):
+            if not pending.future.done():
+                pending.future.set_result(result)
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of questions waiting for a batch"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def get_stats(self) -> Dict:
+        """Get queue wait and batch size statistics"""
+        queue_waits = list(self._queue_waits)
+        batch_sizes = list(self._batch_sizes)
+        return {
+            "total_requests": self.total_requests,
+            "total_batches": self.total_batches,
+            "total_rejected": self.total_rejected,
+            "active_batches": self.active_batches,
+            "queue_depth": self.queue_depth,
+            "staged_calls": self.staged_calls,
+            "queue_wait_ms": {
+                "p50": _percentile(queue_waits, 50) * 1000,
+                "p99": _percentile(queue_waits, 99) * 1000,
+            },
+            "batch_size": {
+                "mean": sum(batch_sizes) / len(batch_sizes) if batch_sizes else 0.0,
+                "p50": _percentile(batch_sizes, 50),
+                "p99": _percentile(batch_sizes, 99),
+                "max": max(batch_sizes) if batch_sizes else 0,
+            },
+        }
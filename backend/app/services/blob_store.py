@@ -0,0 +1,244 @@
+"""
+Content-addressed storage for uploaded images, shared by the sessions that upload the same image
+"""
+import os
+import re
+import time
+import logging
+import threading
+from typing import Iterable, List, Optional
+
+from app.utils.metrics import Counter, directory_bytes
+
+logger = logging.getLogger(__name__)
+
+BLOB_DIR = "blobs"
+SESSION_DIR = "sessions"
+TEMP_DIR = "tmp"
+
+# Files changed more recently than this may belong to an upload still in progress in another worker
+RECONCILE_MIN_AGE = 60
+
+# Uploads stored directly in the upload directory before the blob store: {timestamp}_{session_id}{ext}
+LEGACY_UPLOAD_NAME = re.compile(r"^\d+_[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}(\.\w+)?$")
+
+DEDUPLICATED_UPLOADS = Counter("vqa_upload_deduplicated_total", "Uploads whose image was already stored")
+
+class BlobStore:
+    """
+    Uploaded images stored once per content hash, with a hardlink per session
+
+    A blob lives at blobs/<hash[:2]>/<hash><ext>, and each session using it has a
+    hardlink to it at sessions/<session_id><ext>. The blob's link count is its
+    reference count, shared by all workers on the host: when the last session link
+    is released, the blob is deleted. Uploads are written to tmp/ until stored.
+
+    The size of the stored blobs is counted as they are stored and released, so
+    reading it doesn't walk the directory. The count covers this process's changes
+    and is recomputed from the disk by reconcile.
+    """
+
+    def __init__(self, root: str):
+        """
+        Initialize the blob store
+
+        Args:
+            root (str): Directory holding the blobs, session links and partial uploads
+        """
+        self.root = root
+        self.blob_dir = os.path.join(root, BLOB_DIR)
+        self.session_dir = os.path.join(root, SESSION_DIR)
+        self.temp_dir = os.path.join(root, TEMP_DIR)
+        for directory in (self.blob_dir, self.session_dir, self.temp_dir):
+            os.makedirs(directory, exist_ok=True)
+        self._usage_bytes: Optional[int] = None  # Counted from the disk on first use
+        self._usage_lock = threading.Lock()
+
+    def temp_path(self, name: str) -> str:
+        """Path for writing an upload before it is stored"""
+        return os.path.join(self.temp_dir, name)
+
+    def blob_path(self, content_hash: str, extension: str) -> str:
+        """Path of the blob for a content hash"""
+        return os.path.join(self.blob_dir, content_hash[:2], content_hash + extension)
+
+    def _session_path(self, session_id: str, extension: str) -> str:
+        return os.path.join(self.session_dir, session_id + extension)
+
+    def acquire(self, content_hash: str, extension: str, session_id: str) -> Optional[str]:
+        """
+        Reference an already stored blob from a session
+
+        Args:
+            content_hash (str): Hash of the uploaded image
+            extension (str): Extension of the stored form, e.g. ".npy"
+            session_id (str): The session ID
+
+        Returns:
+            Optional[str]: The session's image path, or None if the blob is not stored
+        """
+        session_path = self._session_path(session_id, extension)
+        try:
+            os.link(self.blob_path(content_hash, extension), session_path)
+        except FileNotFoundError:
+            return None
+        DEDUPLICATED_UPLOADS.inc()
+        return session_path
+
+    def store(self, file_path: str, content_hash: str, extension: str, session_id: str) -> str:
+        """
+        Move a new file into the store as the blob for its content hash, referenced by a session
+
+        Args:
+            file_path (str): The file to store, moved into the store
+            content_hash (str): Hash of the uploaded image
+            extension (str): Extension of the stored form, e.g. ".npy"
+            session_id (str): The session ID
+
+        Returns:
+            str: The session's image path
+        """
+        blob_path = self.blob_path(content_hash, extension)
+        for attempt in range(2):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            try:
+                os.link(file_path, blob_path)
+                self._add_usage(os.path.getsize(blob_path))
+                break
+            except FileExistsError:
+                # Stored by a concurrent upload of the same image, this copy stays the session's own
+                break
+            except FileNotFoundError:
+                # The prefix directory was removed by a concurrent release, create it again
+                if attempt or not os.path.exists(file_path):
+                    raise
+        session_path = self._session_path(session_id, extension)
+        os.replace(file_path, session_path)
+        return session_path
+
+    def release(self, image_path: str, content_hash: Optional[str] = None) -> int:
+        """
+        Drop a session's reference to its image, deleting the blob if no other session uses it
+
+        Args:
+            image_path (str): The session's image path
+            content_hash (str, optional): Hash of the image, None for files outside the store
+
+        Returns:
+            int: Bytes freed on disk
+        """
+        try:
+            stat = os.stat(image_path)
+            os.remove(image_path)
+        except FileNotFoundError:
+            return 0
+        if stat.st_nlink <= 1:
+            return stat.st_size
+        if content_hash is None:
+            return 0
+
+        blob_path = self.blob_path(content_hash, os.path.splitext(image_path)[1])
+        try:
+            blob_stat = os.stat(blob_path)
+            if blob_stat.st_ino == stat.st_ino and blob_stat.st_nlink == 1:
+                os.remove(blob_path)
+                logger.info(f"Removed unreferenced image {blob_path}")
+                self._add_usage(-blob_stat.st_size)
+                _remove_empty_dir(os.path.dirname(blob_path))
+                return blob_stat.st_size
+        except FileNotFoundError:
+            pass
+        return 0
+
+    def usage_bytes(self) -> int:
+        """Size of the stored images, each counted once however many sessions use it"""
+        with self._usage_lock:
+            if self._usage_bytes is None:
+                self._usage_bytes = directory_bytes(self.blob_dir)
+            return self._usage_bytes
+
+    def _add_usage(self, size: int):
+        """Count bytes stored (or, if negative, freed) in the blob directory"""
+        with self._usage_lock:
+            if self._usage_bytes is not None:
+                self._usage_bytes += size
+
+    def reconcile(self, referenced_paths: Iterable[str]) -> int:
+        """
+        Remove files no session references, e.g. left behind by a crash or by sessions
+        kept in memory by a previous run
+
+        Session links, partial uploads and uploads stored by earlier versions directly
+        in the root directory that are not in referenced_paths are removed, then blobs
+        no remaining link points to. Other files in the root directory are left alone.
+        Files changed in the last RECONCILE_MIN_AGE seconds are kept, as they may
+        belong to uploads in progress in other workers.
+
+        Args:
+            referenced_paths (Iterable[str]): Image paths of the current sessions
+
+        Returns:
+            int: Number of files removed
+        """
+        cutoff = time.time() - RECONCILE_MIN_AGE
+        referenced = {os.path.abspath(path) for path in referenced_paths if path}
+        # Stat the blobs first: removing a link changes the ctime of the blob it points to
+        blobs = _list_files(self.blob_dir, recursive=True)
+
+        removed = 0
+        kept_inodes = set()
+        legacy_uploads = [
+            (path, stat) for path, stat in _list_files(self.root)
+            if LEGACY_UPLOAD_NAME.match(os.path.basename(path))
+        ]
+        for path, stat in _list_files(self.session_dir) + _list_files(self.temp_dir) + legacy_uploads:
+            if os.path.abspath(path) in referenced or stat.st_ctime >= cutoff:
+                kept_inodes.add(stat.st_ino)
+            elif _remove(path):
+                removed += 1
+        for path, stat in blobs:
+            if stat.st_ino not in kept_inodes and stat.st_ctime < cutoff and _remove(path):
+                removed += 1
+                _remove_empty_dir(os.path.dirname(path))
+
+        with self._usage_lock:
+            self._usage_bytes = directory_bytes(self.blob_dir)
+        if removed:
+            logger.info(f"Removed {removed} orphaned files from {self.root}")
+        return removed
+
+def _list_files(directory: str, recursive: bool = False) -> List:
+    """(path, stat) of the regular files in a directory"""
+    files = []
+    pending = [directory]
+    while pending:
+        try:
+            entries = list(os.scandir(pending.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        pending.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    files.append((entry.path, entry.stat(follow_symlinks=False)))
+            except OSError:
+                continue
+    return files
+
+def _remove_empty_dir(directory: str):
+    """Remove a directory if it is empty"""
+    try:
+        os.rmdir(directory)
+    except OSError:
+        pass
+
+def _remove(path: str) -> bool:
+    """Remove a file, returning whether it was removed"""
+    try:
+        os.remove(path)
+        return True
+    except OSError as e:
+        logger.warning(f"Could not remove {path}: {e}")
+        return False
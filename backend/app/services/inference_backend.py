@@ -0,0 +1,307 @@
+"""
+Inference backends for running the VQA model stages
+"""
+import os
+import logging
+from typing import Dict, List
+
+import torch
+import torch.nn as nn
+
+from app.models.vqa_model import VQAModel
+
+logger = logging.getLogger(__name__)
+
+# Names of the exported graphs, one per model stage
+STAGES = ("image_encoder", "question_encoder", "classifier")
+
+# File recording which model the exported graphs were built from
+MODEL_ID_FILENAME = "model_id.txt"
+
+class InferenceBackend:
+    """Runs the image encoder, question encoder and classifier stages of the model"""
+    name = "base"
+    # Whether fuse, classify_answerable and classify_answer can run the heads separately
+    supports_staging = False
+
+    def encode_image(self, image_encoding: Dict[str, torch.Tensor]) -> torch.Tensor:
+        """Encode preprocessed images into projected vision embeddings"""
+        raise NotImplementedError
+
+    def encode_question(self, question_encoding: Dict[str, torch.Tensor]) -> torch.Tensor:
+        """Encode tokenized questions into projected text embeddings"""
+        raise NotImplementedError
+
+    def classify(self, vision_embeds: torch.Tensor, text_embeds: torch.Tensor) -> Dict[str, torch.Tensor]:
+        """Fuse the embeddings and run the prediction heads"""
+        raise NotImplementedError
+
+    def fuse(self, vision_embeds: torch.Tensor, text_embeds: torch.Tensor) -> torch.Tensor:
+        """Fuse the embeddings, for running the heads separately"""
+        raise NotImplementedError
+
+    def classify_answerable(self, fused_features: torch.Tensor) -> torch.Tensor:
+        """Run the answerable head on fused features"""
+        raise NotImplementedError
+
+    def classify_answer(self, fused_features: torch.Tensor) -> torch.Tensor:
+        """Run the answer head on fused features"""
+        raise NotImplementedError
+
+class EagerBackend(InferenceBackend):
+    """Runs the PyTorch model directly"""
+    name = "eager"
+    supports_staging = True
+
+    def __init__(self, model: VQAModel):
+        self.model = model
+
+    def encode_image(self, image_encoding):
+        return self.model.encode_image(image_encoding)
+
+    def encode_question(self, question_encoding):
+        return self.model.encode_question(question_encoding)
+
+    def classify(self, vision_embeds, text_embeds):
+        return self.model.classify(vision_embeds, text_embeds)
+
+    def fuse(self, vision_embeds, text_embeds):
+        return self.model.fuse(vision_embeds, text_embeds)
+
+    def classify_answerable(self, fused_features):
+        return self.model.classify_answerable(fused_features)
+
+    def classify_answer(self, fused_features):
+        return self.model.classify_answer(fused_features)
+
+class _ImageEncoderStage(nn.Module):
+    """Image encoder stage with positional inputs, for export"""
+    def __init__(self, model: VQAModel):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model.encode_image({'pixel_values': pixel_values})
+
+class _QuestionEncoderStage(nn.Module):
+    """Question encoder stage with positional inputs, for export"""
+    def __init__(self, model: VQAModel, input_names: List[str]):
+        super().__init__()
+        self.model = model
+        self.input_names = input_names
+
+    def forward(self, *inputs):
+        return self.model.encode_question(dict(zip(self.input_names, inputs)))
+
+class _ClassifierStage(nn.Module):
+    """Fusion and prediction heads with tuple outputs, for export"""
+    def __init__(self, model: VQAModel):
+        super().__init__()
+        self.model = model
+
+    def forward(self, vision_embeds, text_embeds):
+        outputs = self.model.classify(vision_embeds, text_embeds)
+        return outputs['answer_logits'], outputs['answerable_logits'], outputs['fused_features']
+
+def _sample_inputs(model: VQAModel, image_size: Dict[str, int], input_names: List[str]):
+    """Build example inputs for each stage, with batch size 2 and sequence length 16"""
+    device = next(model.parameters()).device
+    pixel_values = torch.randn(2, 3, image_size['height'], image_size['width'], device=device)
+    question_inputs = []
+    for name in input_names:
+        if name == 'attention_mask':
+            question_inputs.append(torch.ones(2, 16, dtype=torch.long, device=device))
+        else:
+            question_inputs.append(torch.zeros(2, 16, dtype=torch.long, device=device))
+    hidden_size = model.config['hidden_size']
+    embeds = (torch.randn(2, hidden_size, device=device), torch.randn(2, hidden_size, device=device))
+    return {
+        "image_encoder": (pixel_values,),
+        "question_encoder": tuple(question_inputs),
+        "classifier": embeds,
+    }
+
+def _stages(model: VQAModel, input_names: List[str]) -> Dict[str, nn.Module]:
+    return {
+        "image_encoder": _ImageEncoderStage(model).eval(),
+        "question_encoder": _QuestionEncoderStage(model, input_names).eval(),
+        "classifier": _ClassifierStage(model).eval(),
+    }
+
+def export_torchscript(model: VQAModel, export_dir: str, image_size: Dict[str, int], input_names: List[str]):
+    """
+    Trace each model stage with TorchScript and save it to export_dir
+
+    Args:
+        model (VQAModel): The model to export
+        export_dir (str): Directory for the exported graphs
+        image_size (Dict[str, int]): Input image height and width
+        input_names (List[str]): Tokenizer output names, in the order they are passed
+    """
+    os.makedirs(export_dir, exist_ok=True)
+    sample_inputs = _sample_inputs(model, image_size, input_names)
+    with torch.no_grad():
+        for stage, module in _stages(model, input_names).items():
+            traced = torch.jit.trace(module, sample_inputs[stage], check_trace=False)
+            traced = torch.jit.freeze(traced)
+            traced.save(os.path.join(export_dir, f"{stage}.pt"))
+    logger.info(f"Exported TorchScript model to {export_dir}")
+
+def export_onnx(model: VQAModel, export_dir: str, image_size: Dict[str, int], input_names: List[str]):
+    """
+    Export each model stage to ONNX and save it to export_dir
+
+    Args:
+        model (VQAModel): The fp32 model to export, on CPU
+        export_dir (str): Directory for the exported graphs
+        image_size (Dict[str, int]): Input image height and width
+        input_names (List[str]): Tokenizer output names, in the order they are passed
+    """
+    os.makedirs(export_dir, exist_ok=True)
+    sample_inputs = _sample_inputs(model, image_size, input_names)
+    io_names = {
+        "image_encoder": (["pixel_values"], ["vision_embeds"]),
+        "question_encoder": (list(input_names), ["text_embeds"]),
+        "classifier": (["vision_embeds", "text_embeds"], ["answer_logits", "answerable_logits", "fused_features"]),
+    }
+    with torch.no_grad():
+        for stage, module in _stages(model, input_names).items():
+            stage_inputs, stage_outputs = io_names[stage]
+            dynamic_axes = {name: {0: "batch"} for name in stage_inputs + stage_outputs}
+            if stage == "question_encoder":
+                for name in stage_inputs:
+                    dynamic_axes[name][1] = "sequence"
+            torch.onnx.export(
+                module,
+                sample_inputs[stage],
+                os.path.join(export_dir, f"{stage}.onnx"),
+                input_names=stage_inputs,
+                output_names=stage_outputs,
+                dynamic_axes=dynamic_axes,
+                opset_version=14
+            )
+    logger.info(f"Exported ONNX model to {export_dir}")
+
+class TorchScriptBackend(InferenceBackend):
+    """Runs TorchScript graphs traced from the model"""
+    name = "torchscript"
+
+    def __init__(self, export_dir: str, input_names: List[str], device: torch.device):
+        self.input_names = input_names
+        self.modules = {
+            stage: torch.jit.load(os.path.join(export_dir, f"{stage}.pt"), map_location=device)
+            for stage in STAGES
+        }
+
+    def encode_image(self, image_encoding):
+        return self.modules["image_encoder"](image_encoding['pixel_values'])
+
+    def encode_question(self, question_encoding):
+        return self.modules["question_encoder"](*(question_encoding[name] for name in self.input_names))
+
+    def classify(self, vision_embeds, text_embeds):
+        answer_logits, answerable_logits, fused_features = self.modules["classifier"](vision_embeds, text_embeds)
+        return {
+            'answer_logits': answer_logits,
+            'answerable_logits': answerable_logits,
+            'fused_features': fused_features
+        }
+
+class ONNXBackend(InferenceBackend):
+    """Runs ONNX graphs exported from the model with ONNX Runtime on CPU"""
+    name = "onnx"
+
+    def __init__(self, export_dir: str, input_names: List[str], num_threads: int):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise RuntimeError("The onnx backend requires onnxruntime, install it with: pip install onnxruntime")
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.input_names = input_names
+        self.sessions = {
+            stage: onnxruntime.InferenceSession(
+                os.path.join(export_dir, f"{stage}.onnx"),
+                sess_options=options,
+                providers=["CPUExecutionProvider"]
+            )
+            for stage in STAGES
+        }
+
+    def _run(self, stage, inputs):
+        outputs = self.sessions[stage].run(None, {name: tensor.cpu().numpy() for name, tensor in inputs.items()})
+        return [torch.from_numpy(output) for output in outputs]
+
+    def encode_image(self, image_encoding):
+        return self._run("image_encoder", {'pixel_values': image_encoding['pixel_values']})[0]
+
+    def encode_question(self, question_encoding):
+        return self._run("question_encoder", {name: question_encoding[name] for name in self.input_names})[0]
+
+    def classify(self, vision_embeds, text_embeds):
+        answer_logits, answerable_logits, fused_features = self._run(
+            "classifier", {'vision_embeds': vision_embeds.float(), 'text_embeds': text_embeds.float()}
+        )
+        return {
+            'answer_logits': answer_logits,
+            'answerable_logits': answerable_logits,
+            'fused_features': fused_features
+        }
+
+def _export_is_current(export_dir: str, model_id: str, extension: str) -> bool:
+    """Check that all stages were exported from the given model"""
+    marker = os.path.join(export_dir, MODEL_ID_FILENAME)
+    if not os.path.exists(marker):
+        return False
+    with open(marker) as f:
+        if f.read().strip() != model_id:
+            return False
+    return all(os.path.exists(os.path.join(export_dir, f"{stage}{extension}")) for stage in STAGES)
+
+def create_backend(
+    name: str,
+    model: VQAModel,
+    model_id: str,
+    export_dir: str,
+    image_size: Dict[str, int],
+    input_names: List[str],
+    device: torch.device
+) -> InferenceBackend:
+    """
+    Create an inference backend, exporting the model first if needed
+
+    Args:
+        name (str): Backend name, one of eager, torchscript or onnx
+        model (VQAModel): The loaded model
+        model_id (str): Identifies the model, exports from other models are rebuilt
+        export_dir (str): Directory holding the exported graphs for this backend
+        image_size (Dict[str, int]): Input image height and width
+        input_names (List[str]): Tokenizer output names, in the order they are passed
+        device (torch.device): Device to run on
+
+    Returns:
+        InferenceBackend: The backend
+    """
+    if name == "eager":
+        return EagerBackend(model)
+
+    if name == "torchscript":
+        extension, exporter = ".pt", export_torchscript
+    elif name == "onnx":
+        if device.type != "cpu":
+            raise ValueError("The onnx backend only supports CPU inference")
+        extension, exporter = ".onnx", export_onnx
+    else:
+        raise ValueError(f"Unknown inference backend: {name}")
+
+    if not _export_is_current(export_dir, model_id, extension):
+        logger.info(f"Exporting model for the {name} backend to {export_dir}")
+        exporter(model, export_dir, image_size, input_names)
+        with open(os.path.join(export_dir, MODEL_ID_FILENAME), "w") as f:
+            f.write(model_id)
+
+    if name == "torchscript":
+        return TorchScriptBackend(export_dir, input_names, device)
+    return ONNXBackend(export_dir, input_names, torch.get_num_threads())
@@ -3,30 +3,103 @@ Model service for handling VQA model operations
 """
 import os
 import json
+import time
 import logging
+import contextlib
+import threading
+import numpy as np
 import torch
-from PIL import Image
-from transformers import AutoTokenizer, ViTImageProcessor
+import torch.nn as nn
+from transformers import AutoConfig, AutoTokenizer, ViTImageProcessor
+from transformers.modeling_utils import no_init_weights
 from huggingface_hub import hf_hub_download, login
+from safetensors.torch import load_file as load_safetensors
 
 from app.config import settings
 from app.models.vqa_model import VQAModel
+from app.services.inference_backend import create_backend
+from app.utils.cache import LRUCache
+from app.utils.metrics import Histogram
+from app.utils.preprocessing import ImagePreprocessor, PREPROCESSED_IMAGE_SUFFIX
 
 logger = logging.getLogger(__name__)
 
+# Files making up a converted model artifact (see app/convert.py)
+ARTIFACT_WEIGHTS = "model.safetensors"
+ARTIFACT_CONFIG = "vqa_config.json"
+ARTIFACT_VOCAB = "answer_vocab.json"
+
+# Time spent in each stage of a prediction, observed once per batch
+STAGE_DURATION = Histogram(
+    "vqa_stage_duration_seconds",
+    "Time spent in each stage of the inference path, per batch",
+    ("stage",)
+)
+
+def get_thread_budget():
+    """Torch intra-op threads per process, from INFERENCE_THREADS or the CPU count
+    
+    torch.set_num_threads is process-wide, so the inference workers of one process
+    share these threads and only the server processes split the CPU cores.
+    """
+    if settings.INFERENCE_THREADS:
+        return settings.INFERENCE_THREADS
+    return max(1, (os.cpu_count() or 1) // max(1, settings.SERVER_WORKERS))
+
+def _tensor_nbytes(tensor):
+    """Size of a tensor's data in bytes"""
+    return tensor.element_size() * tensor.nelement()
+
 class ModelService:
     """Service for loading and running the VQA model"""
     
     def __init__(self):
         """Initialize the model service"""
         self.model = None
+        self.backend = None
         self.processor = None
+        self.preprocessor = None
         self.tokenizer = None
         self.config = None
         self.answer_vocab = None
+        self.answer_list = None  # Answers indexed by class, built from answer_vocab at load time
+        self.model_id = None
+        self.precision = "fp32"
+        
+        # Model tier: "accurate" for the full model, which holds the "fast" tier if configured
+        self.quality = "accurate"
+        self.fast_tier = None
+        
+        # Early exit on unanswerable questions, and how often it skipped the answer head
+        self.early_exit_threshold = 0.0
+        self.answer_head_flops = 0  # Per question
+        self.early_exit_rows = 0
+        self.early_exits = 0
+        self._stats_lock = threading.Lock()
+        self.vision_cache = LRUCache(settings.VISION_CACHE_SIZE, sizeof=_tensor_nbytes)
+        self.question_cache = LRUCache(settings.QUESTION_CACHE_SIZE, sizeof=_tensor_nbytes)
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    
+    def _configure_process(self):
+        """
+        Set up the process for inference: torch threads and the Hugging Face login
+        
+        Runs once per process, when the model is loaded, and not for the fast tier
+        sharing the loaded model.
+        """
         logger.info(f"Using device: {self.device}")
         
+        # Split the CPU cores between the server processes, so they don't oversubscribe
+        num_threads = get_thread_budget()
+        torch.set_num_threads(num_threads)
+        logger.info(f"Using {num_threads} torch threads per process")
+        if settings.INTEROP_THREADS and torch.get_num_interop_threads() != settings.INTEROP_THREADS:
+            try:
+                torch.set_num_interop_threads(settings.INTEROP_THREADS)
+            except RuntimeError:
+                # Can only be set once per process, before any inter-op work
+                logger.warning("Could not set the number of torch inter-op threads, it is already in use")
+        
         # Try to login to Hugging Face if token is provided
         if settings.HUGGINGFACE_TOKEN:
             try:
@@ -66,41 +139,144 @@ class ModelService:
             logger.error(f"Error downloading model from Hugging Face Hub: {e}")
             return False
     
+    def _check_artifact_exists(self):
+        """Check if a converted model artifact exists locally"""
+        return all(
+            os.path.exists(os.path.join(settings.MODEL_ARTIFACT_DIR, filename))
+            for filename in (ARTIFACT_WEIGHTS, ARTIFACT_CONFIG, ARTIFACT_VOCAB)
+        )
+    
+    def _build_model(self, vision_config, text_config):
+        """Build the model from encoder configs, skipping weight initialization"""
+        with no_init_weights():
+            return VQAModel.from_config(
+                self.config, len(self.answer_vocab['answer_to_idx']), vision_config, text_config
+            )
+    
+    def _load_artifact(self):
+        """
+        Load the model from a converted artifact directory
+        
+        The weights are memory-mapped from the safetensors file, and the encoder
+        configs, tokenizer and processor are read from the directory, so no network
+        access or Hugging Face cache is needed.
+        
+        Returns:
+            Tuple[str, str]: Paths to load the processor and tokenizer from
+        """
+        artifact_dir = settings.MODEL_ARTIFACT_DIR
+        weights_path = os.path.join(artifact_dir, ARTIFACT_WEIGHTS)
+        logger.info(f"Loading model artifact from {artifact_dir}")
+        
+        with open(os.path.join(artifact_dir, ARTIFACT_CONFIG)) as f:
+            artifact_config = json.load(f)
+        with open(os.path.join(artifact_dir, ARTIFACT_VOCAB)) as f:
+            self.answer_vocab = json.load(f)
+        self.config = artifact_config['config']
+        
+        # Identify this artifact so cached results from other models are not reused
+        model_stat = os.stat(weights_path)
+        self.model_id = f"{os.path.basename(os.path.abspath(artifact_dir))}:{model_stat.st_size}:{int(model_stat.st_mtime)}"
+        
+        self.model = self._build_model(artifact_config['vision_config'], artifact_config['text_config'])
+        self.model.load_state_dict(load_safetensors(weights_path, device="cpu"), assign=True)
+        return artifact_dir, artifact_dir
+    
+    def _load_checkpoint(self):
+        """
+        Load the model from a training checkpoint, downloading it if not present
+        
+        Returns:
+            Optional[Tuple[str, str]]: Paths to load the processor and tokenizer from, or None on failure
+        """
+        # Check if model exists locally
+        if not self._check_model_exists():
+            logger.info(f"Model not found at {settings.MODEL_PATH}")
+            
+            # Download the model from Hugging Face Hub
+            if not self._download_model_from_hub():
+                logger.error("Failed to download model from Hugging Face Hub")
+                return None
+        
+        logger.info(f"Loading model from {settings.MODEL_PATH}")
+        checkpoint = torch.load(settings.MODEL_PATH, map_location=self.device)
+        
+        # Extract configuration
+        self.config = checkpoint['config']
+        
+        # Identify this checkpoint so cached results from other models are not reused
+        model_stat = os.stat(settings.MODEL_PATH)
+        self.model_id = f"{os.path.basename(settings.MODEL_PATH)}:{model_stat.st_size}:{int(model_stat.st_mtime)}"
+        
+        # Get vocabulary
+        if 'answer_vocab' in checkpoint:
+            self.answer_vocab = checkpoint['answer_vocab']
+            logger.info("Using vocabulary from model checkpoint")
+        else:
+            logger.error("Error: No vocabulary found in model checkpoint")
+            raise ValueError("No vocabulary found in model checkpoint")
+        
+        # Initialize model from the encoder configs only, the checkpoint holds all weights
+        self.model = self._build_model(
+            AutoConfig.from_pretrained(self.config['vision_model']),
+            AutoConfig.from_pretrained(self.config['text_model'])
+        )
+        self.model.load_state_dict(checkpoint['model_state_dict'], assign=True)
+        return self.config['vision_model'], self.config['text_model']
+    
     def load_model(self):
-        """Load the VQA model from the specified path or download it if not present"""
+        """Load the VQA model from the converted artifact, or from the checkpoint (downloading it if not present)"""
         try:
-            # Check if model exists locally
-            if not self._check_model_exists():
-                logger.info(f"Model not found at {settings.MODEL_PATH}")
-                
-                # Download the model from Hugging Face Hub
-                if not self._download_model_from_hub():
-                    logger.error("Failed to download model from Hugging Face Hub")
-                    return False
-            
-            logger.info(f"Loading model from {settings.MODEL_PATH}")
-            checkpoint = torch.load(settings.MODEL_PATH, map_location=self.device)
-            
-            # Extract configuration
-            self.config = checkpoint['config']
-            
-            # Get vocabulary
-            if 'answer_vocab' in checkpoint:
-                self.answer_vocab = checkpoint['answer_vocab']
-                logger.info("Using vocabulary from model checkpoint")
+            self._configure_process()
+            if self._check_artifact_exists():
+                paths = self._load_artifact()
             else:
-                logger.error("Error: No vocabulary found in model checkpoint")
-                raise ValueError("No vocabulary found in model checkpoint")
+                paths = self._load_checkpoint()
+            if paths is None:
+                return False
+            processor_path, tokenizer_path = paths
+            
+            idx_to_answer = self.answer_vocab['idx_to_answer']
+            self.answer_list = [idx_to_answer[str(idx)] for idx in range(len(idx_to_answer))]
             
-            # Initialize model
-            self.model = VQAModel(self.config, len(self.answer_vocab['answer_to_idx']))
-            self.model.load_state_dict(checkpoint['model_state_dict'])
             self.model.to(self.device)
             self.model.eval()
+            self._apply_precision()
+            self.model_id = f"{self.model_id}:{self.precision}"
+            self._apply_token_pruning()
             
             # Initialize preprocessors
-            self.processor = ViTImageProcessor.from_pretrained(self.config['vision_model'])
-            self.tokenizer = AutoTokenizer.from_pretrained(self.config['text_model'])
+            self.processor = ViTImageProcessor.from_pretrained(processor_path)
+            self.preprocessor = ImagePreprocessor.from_processor(self.processor, settings.PREPROCESS_WORKERS)
+            self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
+            
+            # Initialize the inference backend, exporting the model if needed
+            if settings.INFERENCE_BACKEND == "onnx" and self.precision != "fp32":
+                raise ValueError("The onnx backend requires INFERENCE_PRECISION=fp32")
+            self.backend = create_backend(
+                settings.INFERENCE_BACKEND,
+                self.model,
+                self.model_id,
+                os.path.join(settings.EXPORT_DIR, settings.INFERENCE_BACKEND),
+                self.processor.size,
+                self.tokenizer.model_input_names,
+                self.device
+            )
+            logger.info(f"Using {self.backend.name} inference backend")
+            
+            # Early exit runs the heads separately, which exported graphs can't do
+            self.early_exit_threshold = settings.EARLY_EXIT_THRESHOLD
+            if self.early_exit_threshold > 0 and not self.backend.supports_staging:
+                logger.warning(f"Early exit is not supported by the {self.backend.name} backend, disabling it")
+                self.early_exit_threshold = 0.0
+            self.answer_head_flops = sum(
+                2 * module.in_features * module.out_features
+                for module in self.model.classifier.modules()
+                if hasattr(module, 'in_features') and hasattr(module, 'out_features')
+            )
+            
+            if settings.FAST_IMAGE_SIZE or settings.FAST_VISION_LAYERS or settings.FAST_TEXT_LAYERS:
+                self.fast_tier = self._build_fast_tier()
             
             logger.info("Model loaded successfully")
             return True
@@ -109,69 +285,550 @@ class ModelService:
             logger.error(f"Error loading model: {e}")
             return False
     
+    def _apply_precision(self):
+        """Configure the model for the INFERENCE_PRECISION setting"""
+        precision = settings.INFERENCE_PRECISION
+        if precision not in ("fp32", "int8", "bf16"):
+            raise ValueError(f"Unknown inference precision: {precision}")
+        
+        if precision == "int8":
+            if self.device.type != "cpu":
+                logger.warning("Dynamic int8 quantization is only supported on CPU, using fp32")
+                precision = "fp32"
+            else:
+                # Quantize the weights of every linear layer (encoders and heads) to int8
+                self.model = torch.ao.quantization.quantize_dynamic(self.model, {nn.Linear}, dtype=torch.qint8)
+        elif precision == "bf16" and self.device.type == "cuda" and not torch.cuda.is_bf16_supported():
+            logger.warning("bf16 is not supported on this GPU, using fp32")
+            precision = "fp32"
+        elif precision == "bf16" and settings.INFERENCE_BACKEND != "eager":
+            logger.warning("bf16 autocast is only supported by the eager backend, using fp32")
+            precision = "fp32"
+        
+        self.precision = precision
+        logger.info(f"Using {precision} inference precision")
+    
+    def _apply_token_pruning(self):
+        """Configure token pruning and CLS-only final layers from the settings"""
+        layers = [int(layer) for layer in settings.TOKEN_PRUNE_LAYERS.split(",") if layer.strip()] or None
+        self.model.set_token_pruning(settings.TOKEN_PRUNE_RATIO, layers, settings.CLS_ONLY_FINAL_LAYER)
+        
+        # Pruning changes the answers, and both change the exported graphs
+        if settings.TOKEN_PRUNE_RATIO > 0:
+            layer_names = ",".join(str(layer) for layer in layers) if layers else "auto"
+            self.model_id = f"{self.model_id}:prune={settings.TOKEN_PRUNE_RATIO}@{layer_names}"
+            logger.info(f"Pruning {settings.TOKEN_PRUNE_RATIO:.0%} of patch tokens after vision layers {layer_names}")
+        if settings.CLS_ONLY_FINAL_LAYER:
+            self.model_id = f"{self.model_id}:cls_only"
+    
+    def _build_fast_tier(self):
+        """
+        Build the fast tier: the loaded model at a reduced resolution and/or depth
+        
+        The tier shares the model's weights, tokenizer and answers, and has its own
+        inference backend, preprocessor and embedding caches.
+        
+        Returns:
+            ModelService: Service running the reduced model
+        """
+        image_size = settings.FAST_IMAGE_SIZE
+        vision_layers = settings.FAST_VISION_LAYERS
+        text_layers = settings.FAST_TEXT_LAYERS
+        input_size = (
+            {'height': image_size, 'width': image_size} if image_size
+            else {'height': self.processor.size['height'], 'width': self.processor.size['width']}
+        )
+        
+        tier = ModelService()
+        tier.quality = "fast"
+        for name in (
+            'processor', 'tokenizer', 'config', 'answer_vocab', 'answer_list',
+            'precision', 'early_exit_threshold', 'answer_head_flops'
+        ):
+            setattr(tier, name, getattr(self, name))
+        tier.model = self.model.reduced(image_size or None, vision_layers or None, text_layers or None)
+        tier.model_id = (
+            f"{self.model_id}:fast={input_size['height']}x{input_size['width']},"
+            f"vision_layers={vision_layers or 'all'},text_layers={text_layers or 'all'}"
+        )
+        tier.preprocessor = ImagePreprocessor.from_processor(
+            self.processor, settings.PREPROCESS_WORKERS, size=(input_size['width'], input_size['height'])
+        )
+        tier.backend = create_backend(
+            settings.INFERENCE_BACKEND,
+            tier.model,
+            tier.model_id,
+            os.path.join(settings.EXPORT_DIR, settings.INFERENCE_BACKEND, "fast"),
+            input_size,
+            self.tokenizer.model_input_names,
+            self.device
+        )
+        logger.info(f"Fast tier: {tier.model_id}")
+        return tier
+    
+    def get_tier(self, quality):
+        """
+        Get the service for a model tier
+        
+        Args:
+            quality (str): "fast" or "accurate"
+            
+        Returns:
+            ModelService: The fast tier if requested and configured, this service otherwise
+        """
+        if quality == "fast" and self.fast_tier is not None:
+            return self.fast_tier
+        return self
+    
+    def _inference_context(self):
+        """Context manager for running the model: no autograd, plus bf16 autocast if enabled"""
+        stack = contextlib.ExitStack()
+        stack.enter_context(torch.no_grad())
+        if self.precision == "bf16":
+            stack.enter_context(torch.autocast(device_type=self.device.type, dtype=torch.bfloat16))
+        return stack
+    
     def is_model_loaded(self):
         """Check if the model is loaded"""
-        return self.model is not None and self.processor is not None and self.tokenizer is not None
+        return (
+            self.model is not None and self.backend is not None
+            and self.processor is not None and self.tokenizer is not None
+        )
+    
+    def preprocess_image(self, image_path):
+        """
+        Decode and resize an uploaded image once, storing it as a compact uint8 array
+        
+        The array is what encode_images would compute from the original file, so
+        questions about the image skip decoding and resizing the upload again.
+        JPEGs are decoded in draft mode at a reduced scale, which is much faster for
+        large photos at the cost of small pixel differences.
+        
+        Args:
+            image_path (str): Path to the uploaded image file
+            
+        Returns:
+            str: Path to the .npy array, next to the original file
+        """
+        image = self.preprocessor.load_image(image_path, draft=True)
+        output_path = os.path.splitext(image_path)[0] + PREPROCESSED_IMAGE_SUFFIX
+        np.save(output_path, image)
+        return output_path
+    
+    def encode_images(self, image_paths):
+        """
+        Compute projected vision embeddings for a batch of images
+        
+        Args:
+            image_paths (List[str]): Paths to the image files or preprocessed .npy arrays
+            
+        Returns:
+            torch.Tensor: Projected vision embeddings of shape (len(image_paths), hidden_size)
+        """
+        with STAGE_DURATION.time(("decode",)):
+            images = self.preprocessor.load_images(image_paths)
+        with STAGE_DURATION.time(("processor",)):
+            pixel_values = self.preprocessor.to_pixel_values(images)
+        return self.encode_pixel_values(pixel_values)
     
-    def predict(self, image_path, question):
+    def encode_pixel_values(self, pixel_values):
+        """
+        Compute projected vision embeddings for preprocessed images
+        
+        Args:
+            pixel_values (torch.Tensor): Normalized images of shape (batch_size, 3, height, width)
+            
+        Returns:
+            torch.Tensor: Projected vision embeddings of shape (batch_size, hidden_size)
+        """
+        image_encoding = {'pixel_values': pixel_values.to(self.device)}
+        
+        with STAGE_DURATION.time(("vision_encoder",)), self._inference_context():
+            return self.backend.encode_image(image_encoding)
+    
+    def get_image_embeddings(self, image_paths, cache_keys):
+        """
+        Get projected vision embeddings for a batch of images, using the cache if possible
+        
+        Images sharing a cache key are only encoded once.
+        
+        Args:
+            image_paths (List[str]): Paths to the image files
+            cache_keys (List[Optional[str]]): Keys identifying each image, e.g. the session ID
+            
+        Returns:
+            torch.Tensor: Projected vision embeddings of shape (len(image_paths), hidden_size)
+        """
+        embeddings = {}
+        missing = {}
+        for image_path, cache_key in zip(image_paths, cache_keys):
+            key = cache_key if cache_key is not None else image_path
+            if key in embeddings or key in missing:
+                continue
+            
+            vision_embeds = self.vision_cache.get(cache_key) if cache_key is not None else None
+            if vision_embeds is not None:
+                embeddings[key] = vision_embeds
+            else:
+                missing[key] = (image_path, cache_key)
+        
+        if missing:
+            encoded = self.encode_images([image_path for image_path, _ in missing.values()])
+            for i, (key, (_, cache_key)) in enumerate(missing.items()):
+                vision_embeds = encoded[i:i + 1].clone()
+                embeddings[key] = vision_embeds
+                if cache_key is not None:
+                    self.vision_cache.put(cache_key, vision_embeds)
+        
+        return torch.cat([
+            embeddings[cache_key if cache_key is not None else image_path]
+            for image_path, cache_key in zip(image_paths, cache_keys)
+        ], dim=0)
+    
+    def evict_image(self, cache_key):
+        """
+        Drop the cached vision embedding for an image
+        
+        Args:
+            cache_key (str): Key identifying the image, e.g. the session ID
+        """
+        self.vision_cache.pop(cache_key)
+        if self.fast_tier is not None:
+            self.fast_tier.evict_image(cache_key)
+    
+    def _encode_question_batch(self, question_encoding):
+        """Run the text encoder on a padded batch of tokenized questions"""
+        question_encoding = {k: v.to(self.device) for k, v in question_encoding.items()}
+        with STAGE_DURATION.time(("text_encoder",)), self._inference_context():
+            return self.backend.encode_question(question_encoding)
+    
+    def normalize_question(self, question):
+        """
+        Normalize a question for use as a cache key
+        
+        Whitespace is collapsed, and case is folded if the tokenizer lowercases anyway,
+        so questions that tokenize identically share a key.
+        
+        Args:
+            question (str): The question
+            
+        Returns:
+            str: The normalized question
+        """
+        question = " ".join(question.split())
+        if getattr(self.tokenizer, 'do_lower_case', False):
+            question = question.lower()
+        return question
+    
+    def encode_questions(self, questions, use_cache=True):
+        """
+        Compute projected text embeddings for a batch of questions
+        
+        Embeddings of previously seen questions are taken from the question cache;
+        only the remaining distinct questions are run through the text encoder.
+        
+        Args:
+            questions (List[str]): Questions to encode
+            use_cache (bool): Whether to use the question cache
+            
+        Returns:
+            torch.Tensor: Projected text embeddings of shape (len(questions), hidden_size)
+        """
+        if not use_cache:
+            return self._encode_questions(questions)
+        
+        keys = [self.normalize_question(question) for question in questions]
+        embeddings = {}
+        missing = []
+        for key in keys:
+            if key in embeddings or key in missing:
+                continue
+            text_embeds = self.question_cache.get(key)
+            if text_embeds is not None:
+                embeddings[key] = text_embeds
+            else:
+                missing.append(key)
+        
+        if missing:
+            encoded = self._encode_questions(missing)
+            for i, key in enumerate(missing):
+                text_embeds = encoded[i:i + 1].clone()
+                embeddings[key] = text_embeds
+                self.question_cache.put(key, text_embeds)
+        
+        return torch.cat([embeddings[key] for key in keys], dim=0)
+    
+    def _encode_questions(self, questions):
+        """
+        Run questions through the tokenizer and text encoder
+        
+        Questions are padded to the longest question in the batch rather than to
+        MAX_QUESTION_LENGTH. With QUESTION_LENGTH_BUCKET set, questions are further
+        grouped by token length and each group is padded and encoded separately.
+        
+        Args:
+            questions (List[str]): Questions to encode
+            
+        Returns:
+            torch.Tensor: Projected text embeddings of shape (len(questions), hidden_size)
+        """
+        bucket_width = settings.QUESTION_LENGTH_BUCKET
+        if bucket_width <= 0 or len(questions) == 1:
+            with STAGE_DURATION.time(("tokenize",)):
+                question_encoding = self.tokenizer(
+                    questions,
+                    padding='longest',
+                    truncation=True,
+                    max_length=settings.MAX_QUESTION_LENGTH,
+                    return_tensors='pt'
+                )
+            return self._encode_question_batch(question_encoding)
+        
+        # Group questions of similar length so each group carries little padding
+        with STAGE_DURATION.time(("tokenize",)):
+            lengths = [
+                len(input_ids) for input_ids in
+                self.tokenizer(questions, truncation=True, max_length=settings.MAX_QUESTION_LENGTH)['input_ids']
+            ]
+        buckets = {}
+        for i, length in enumerate(lengths):
+            buckets.setdefault((length - 1) // bucket_width, []).append(i)
+        
+        text_embeds = None
+        for indices in buckets.values():
+            with STAGE_DURATION.time(("tokenize",)):
+                question_encoding = self.tokenizer(
+                    [questions[i] for i in indices],
+                    padding='longest',
+                    truncation=True,
+                    max_length=settings.MAX_QUESTION_LENGTH,
+                    return_tensors='pt'
+                )
+            bucket_embeds = self._encode_question_batch(question_encoding)
+            if text_embeds is None:
+                text_embeds = bucket_embeds.new_empty((len(questions), bucket_embeds.shape[1]))
+            text_embeds[indices] = bucket_embeds
+        return text_embeds
+    
+    def predict(self, image_path, question, cache_key=None, top_k=1):
         """
         Make a prediction for the given image and question
         
         Args:
             image_path (str): Path to the image file
             question (str): Question about the image
+            cache_key (str, optional): Key under which the image embedding is cached
+            top_k (int): Number of answers to return, more than 1 adds top_answers
             
         Returns:
             dict: Prediction results
         """
+        return self.predict_batch([(image_path, question, cache_key)], top_k)[0]
+    
+    def predict_batch(self, requests, top_k=1):
+        """
+        Make predictions for a batch of (image, question) pairs in one forward pass
+        
+        Args:
+            requests (List[Tuple[str, str, Optional[str]]]): (image_path, question, cache_key) tuples
+            top_k (Union[int, List[int]]): Number of answers to return, for all requests or per request
+            
+        Returns:
+            List[dict]: Prediction results, in the same order as the requests
+        """
         if not self.is_model_loaded():
             logger.error("Model not loaded")
             raise RuntimeError("Model not loaded")
         
         try:
-            # Preprocess image
-            image = Image.open(image_path).convert('RGB')
-            image_encoding = self.processor(images=image, return_tensors="pt")
-            image_encoding = {k: v.to(self.device) for k, v in image_encoding.items()}
-            
-            # Preprocess question
-            question_encoding = self.tokenizer(
-                question,
-                padding='max_length',
-                truncation=True,
-                max_length=128,
-                return_tensors='pt'
-            )
-            question_encoding = {k: v.to(self.device) for k, v in question_encoding.items()}
+            image_paths, questions, cache_keys = (list(column) for column in zip(*requests))
+            
+            # Encode images (cached across questions about the same image)
+            vision_embeds = self.get_image_embeddings(image_paths, cache_keys)
+            
+            # Encode questions
+            text_embeds = self.encode_questions(questions)
             
             # Get predictions
-            with torch.no_grad():
-                outputs = self.model(image_encoding, question_encoding)
-                
-                answer_logits = outputs['answer_logits']
+            return self.predict_from_embeddings(vision_embeds, text_embeds, top_k)
+            
+        except Exception as e:
+            logger.error(f"Error during prediction: {e}")
+            raise
+    
+    def predict_answerable(self, image_path, question, cache_key=None):
+        """
+        Run the first stage of a staged prediction: whether the question is answerable
+        
+        The answer head is left to predict_answers, so the verdict can be reported
+        before the answers are decoded.
+        
+        Args:
+            image_path (str): Path to the image file
+            question (str): Question about the image
+            cache_key (str, optional): Key under which the image embedding is cached
+            
+        Returns:
+            Tuple[dict, dict]: The answerable verdict and confidence, and the state
+                to pass to predict_answers
+        """
+        if not self.is_model_loaded():
+            raise RuntimeError("Model not loaded")
+        
+        vision_embeds = self.get_image_embeddings([image_path], [cache_key])
+        text_embeds = self.encode_questions([question])
+        
+        with STAGE_DURATION.time(("heads",)), self._inference_context():
+            if self.backend.supports_staging:
+                fused_features = self.backend.fuse(vision_embeds, text_embeds)
+                answerable_logits = self.backend.classify_answerable(fused_features)
+                state = {'fused_features': fused_features}
+            else:
+                # Exported graphs run both heads at once, keep the answer logits for later
+                outputs = self.backend.classify(vision_embeds, text_embeds)
                 answerable_logits = outputs['answerable_logits']
+                state = {'answer_logits': outputs['answer_logits']}
+            
+            answerable_probs = torch.softmax(answerable_logits.float(), dim=1)[0]
+        
+        answerable_idx = int(torch.argmax(answerable_probs).item())
+        verdict = {
+            'is_answerable': bool(answerable_idx),
+            'answerable_confidence': float(answerable_probs[answerable_idx].item())
+        }
+        if self.early_exit_threshold > 0:
+            # Confidently unanswerable questions skip the answer head in predict_answers
+            state['early_exit'] = answerable_idx == 0 and verdict['answerable_confidence'] >= self.early_exit_threshold
+            state['answerable_confidence'] = verdict['answerable_confidence']
+            self._record_early_exits(1, int(state['early_exit']))
+        return verdict, state
+    
+    def predict_answers(self, state, top_k=1):
+        """
+        Run the second stage of a staged prediction: the most likely answers
+        
+        Args:
+            state (dict): State returned by predict_answerable
+            top_k (int): Number of answers to return
+            
+        Returns:
+            List[dict]: The top_k answers with their confidence, most likely first
+        """
+        if state.get('early_exit'):
+            return [{'answer': settings.EARLY_EXIT_ANSWER, 'confidence': state['answerable_confidence']}]
+        
+        with STAGE_DURATION.time(("heads",)), self._inference_context():
+            answer_logits = state.get('answer_logits')
+            if answer_logits is None:
+                answer_logits = self.backend.classify_answer(state['fused_features'])
+            answer_probs = torch.softmax(answer_logits.float(), dim=1)[0]
+            top_probs, top_indices = torch.topk(answer_probs, min(top_k, answer_probs.numel()))
+        
+        return [
+            {'answer': self.answer_list[answer_idx], 'confidence': confidence}
+            for answer_idx, confidence in zip(top_indices.tolist(), top_probs.tolist())
+        ]
+    
+    def predict_from_embeddings(self, vision_embeds, text_embeds, top_k=1):
+        """
+        Run the fusion and prediction heads on encoded images and questions
+        
+        Args:
+            vision_embeds (torch.Tensor): Projected vision embeddings, one row per pair
+            text_embeds (torch.Tensor): Projected text embeddings, one row per pair
+            top_k (Union[int, List[int]]): Number of answers to return, for all rows or per row
+            
+        Returns:
+            List[dict]: Prediction results, one per row; rows with top_k above 1 also
+                hold the answers and their confidence as top_answers
+        """
+        num_rows = vision_embeds.shape[0]
+        top_ks = top_k if isinstance(top_k, list) else [top_k] * num_rows
+        max_k = min(max(top_ks), len(self.answer_list))
+        
+        with STAGE_DURATION.time(("heads",)), self._inference_context():
+            if self.early_exit_threshold > 0:
+                fused_features = self.backend.fuse(vision_embeds, text_embeds)
+                answerable_probs = torch.softmax(self.backend.classify_answerable(fused_features).float(), dim=1)
+                answerable_confidence, answerable_indices = answerable_probs.max(dim=1)
                 
-                answer_idx = torch.argmax(answer_logits, dim=1).item()
-                answerable_idx = torch.argmax(answerable_logits, dim=1).item()
-                
-                # Convert string index to int for dictionary lookup
-                answer = self.answer_vocab['idx_to_answer'][str(answer_idx)]
-                is_answerable = bool(answerable_idx)
+                # Only questions not confidently unanswerable go through the answer head
+                exited = (answerable_indices == 0) & (answerable_confidence >= self.early_exit_threshold)
+                answered = (~exited).nonzero(as_tuple=True)[0]
+                top_probs = answerable_probs.new_zeros((num_rows, max_k))
+                top_indices = answerable_indices.new_zeros((num_rows, max_k))
+                if answered.numel() > 0:
+                    answer_logits = self.backend.classify_answer(fused_features[answered])
+                    answer_probs = torch.softmax(answer_logits.float(), dim=1)
+                    top_probs[answered], top_indices[answered] = torch.topk(answer_probs, max_k, dim=1)
+            else:
+                outputs = self.backend.classify(vision_embeds, text_embeds)
                 
                 # Get confidence scores
-                answer_probs = torch.softmax(answer_logits, dim=1)[0]
-                answerable_probs = torch.softmax(answerable_logits, dim=1)[0]
+                answer_probs = torch.softmax(outputs['answer_logits'].float(), dim=1)
+                answerable_probs = torch.softmax(outputs['answerable_logits'].float(), dim=1)
                 
-                answer_confidence = float(answer_probs[answer_idx].item())
-                answerable_confidence = float(answerable_probs[answerable_idx].item())
-            
-            return {
-                'answer': answer,
-                'answer_confidence': answer_confidence,
-                'is_answerable': is_answerable,
-                'answerable_confidence': answerable_confidence
-            }
+                top_probs, top_indices = torch.topk(answer_probs, max_k, dim=1)
+                answerable_confidence, answerable_indices = answerable_probs.max(dim=1)
+                exited = torch.zeros_like(answerable_indices, dtype=torch.bool)
             
-        except Exception as e:
-            logger.error(f"Error during prediction: {e}")
-            raise
\ No newline at end of file
+            # Pack everything that is decoded into one tensor, so it is copied to the host once
+            decoded = torch.cat([
+                top_probs.double(),
+                top_indices.double(),
+                exited.double().unsqueeze(1),
+                answerable_confidence.double().unsqueeze(1),
+                answerable_indices.double().unsqueeze(1)
+            ], dim=1).cpu().tolist()
+        
+        post_start = time.perf_counter()
+        results = []
+        for row, row_k in zip(decoded, top_ks):
+            if row[2 * max_k]:
+                # Early exit, the answerable head's confidence stands in for the answer's
+                answers, confidences = [settings.EARLY_EXIT_ANSWER], [row[-2]]
+            else:
+                answers = [self.answer_list[int(answer_idx)] for answer_idx in row[max_k:max_k + min(row_k, max_k)]]
+                confidences = row[:len(answers)]
+            result = {
+                'answer': answers[0],
+                'answer_confidence': confidences[0],
+                'is_answerable': bool(row[-1]),
+                'answerable_confidence': row[-2]
+            }
+            if row_k > 1:
+                result['top_answers'] = [
+                    {'answer': answer, 'confidence': confidence}
+                    for answer, confidence in zip(answers, confidences)
+                ]
+            results.append(result)
+        STAGE_DURATION.observe(time.perf_counter() - post_start, ("postprocess",))
+        
+        if self.early_exit_threshold > 0:
+            self._record_early_exits(num_rows, sum(int(row[2 * max_k]) for row in decoded))
+        return results
+    
+    def _record_early_exits(self, rows, early_exits):
+        """Count questions checked for early exit and how many skipped the answer head"""
+        with self._stats_lock:
+            self.early_exit_rows += rows
+            self.early_exits += early_exits
+    
+    def get_early_exit_stats(self):
+        """
+        Get early exit statistics
+        
+        Returns:
+            dict: How often the answer head was skipped and the compute this saved
+        """
+        with self._stats_lock:
+            rows, early_exits = self.early_exit_rows, self.early_exits
+        return {
+            "enabled": self.early_exit_threshold > 0,
+            "threshold": self.early_exit_threshold,
+            "questions": rows,
+            "early_exits": early_exits,
+            "early_exit_rate": early_exits / rows if rows else 0.0,
+            "answer_head_flops_per_question": self.answer_head_flops,
+            "answer_head_flops_saved": early_exits * self.answer_head_flops,
+        }
\ No newline at end of file
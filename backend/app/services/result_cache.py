@@ -0,0 +1,204 @@
+"""
+Result cache for memoizing answers by image content and question
+"""
+import os
+import json
+import asyncio
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import Dict, Optional
+
+from app.config import settings
+from app.utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+class ResultCache:
+    """In-memory result cache with TTL and size-bounded LRU eviction"""
+
+    def __init__(self, maxsize: int, ttl: Optional[float], namespace: str = ""):
+        """
+        Initialize the result cache
+
+        Args:
+            maxsize (int): Maximum number of cached results, 0 disables caching
+            ttl (float, optional): Seconds after which a result expires, None for no expiry
+            namespace (str): Identifies the model producing the results, so results
+                from a different model are never returned
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.namespace = namespace
+        self._cache = LRUCache(maxsize, ttl=ttl)
+
+    def make_key(self, image_hash: str, question: str, top_k: int = 1, tier: Optional[str] = None) -> str:
+        """
+        Build the cache key for an image and a normalized question
+
+        Args:
+            image_hash (str): SHA-256 hex digest of the uploaded image bytes
+            question (str): The normalized question
+            top_k (int): Number of answers in the result, results with top answers
+                are cached separately from plain results
+            tier (str, optional): Identifies the model tier if not the namespace's model,
+                e.g. the fast tier's model ID
+
+        Returns:
+            str: The cache key
+        """
+        variant = f"\0{top_k}" if top_k > 1 else ""
+        if tier is not None:
+            variant += f"\0{tier}"
+        digest = hashlib.sha256(f"{self.namespace}\0{question}{variant}".encode("utf-8")).hexdigest()
+        return f"{image_hash}:{digest}"
+
+    def get(self, image_hash: str, question: str, top_k: int = 1, tier: Optional[str] = None) -> Optional[Dict]:
+        """Get a cached result, or None if not present or expired"""
+        return self._cache.get(self.make_key(image_hash, question, top_k, tier))
+
+    def put(self, image_hash: str, question: str, result: Dict, top_k: int = 1, tier: Optional[str] = None):
+        """Cache a result"""
+        self._cache.put(self.make_key(image_hash, question, top_k, tier), result)
+
+    async def aget(self, image_hash: str, question: str, top_k: int = 1, tier: Optional[str] = None) -> Optional[Dict]:
+        """Get a cached result from the event loop"""
+        return self.get(image_hash, question, top_k, tier)
+
+    async def aput(self, image_hash: str, question: str, result: Dict, top_k: int = 1, tier: Optional[str] = None):
+        """Cache a result from the event loop"""
+        self.put(image_hash, question, result, top_k, tier)
+
+    def stats(self) -> Dict:
+        """Get cache statistics"""
+        return {"backend": "memory", **self._cache.stats()}
+
+class SQLiteResultCache(ResultCache):
+    """Result cache persisted to SQLite so it survives restarts"""
+
+    def __init__(self, path: str, maxsize: int, ttl: Optional[float], namespace: str = ""):
+        """
+        Initialize the result cache
+
+        Args:
+            path (str): Path to the SQLite database file
+            maxsize (int): Maximum number of cached results, 0 disables caching
+            ttl (float, optional): Seconds after which a result expires, None for no expiry
+            namespace (str): Identifies the model producing the results
+        """
+        super().__init__(maxsize, ttl, namespace)
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, result TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_accessed_at ON results (accessed_at)")
+            self._purge_expired()
+
+    def _purge_expired(self):
+        """Delete expired results, the caller must hold the lock"""
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM results WHERE created_at <= ?", (time.time() - self.ttl,))
+
+    def get(self, image_hash: str, question: str, top_k: int = 1, tier: Optional[str] = None) -> Optional[Dict]:
+        """Get a cached result, or None if not present, expired or unreadable"""
+        if self.maxsize <= 0:
+            return None
+
+        key = self.make_key(image_hash, question, top_k, tier)
+        now = time.time()
+        try:
+            with self._lock, self._conn:
+                row = self._conn.execute(
+                    "SELECT result, created_at FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None or (self.ttl is not None and row[1] <= now - self.ttl):
+                    self.misses += 1
+                    return None
+                self._conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+            result = json.loads(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            # A cache failure only costs a prediction
+            logger.warning(f"Error reading result cache, treating as a miss: {e}")
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return result
+
+    def put(self, image_hash: str, question: str, result: Dict, top_k: int = 1, tier: Optional[str] = None):
+        """Cache a result, evicting the least recently used results if full"""
+        if self.maxsize <= 0:
+            return
+
+        now = time.time()
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO results (key, result, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (self.make_key(image_hash, question, top_k, tier), json.dumps(result), now, now)
+                )
+                self._purge_expired()
+                self._conn.execute(
+                    "DELETE FROM results WHERE key IN ("
+                    "SELECT key FROM results ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.maxsize,)
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Error writing result cache, result not cached: {e}")
+
+    async def aget(self, image_hash: str, question: str, top_k: int = 1, tier: Optional[str] = None) -> Optional[Dict]:
+        """Get a cached result from the event loop, querying the database in a thread"""
+        return await asyncio.to_thread(self.get, image_hash, question, top_k, tier)
+
+    async def aput(self, image_hash: str, question: str, result: Dict, top_k: int = 1, tier: Optional[str] = None):
+        """Cache a result from the event loop, writing the database in a thread"""
+        await asyncio.to_thread(self.put, image_hash, question, result, top_k, tier)
+
+    def stats(self) -> Dict:
+        """Get cache statistics, with size None if the database can't be read"""
+        try:
+            with self._lock:
+                size = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        except sqlite3.Error as e:
+            logger.warning(f"Error reading result cache size: {e}")
+            size = None
+        lookups = self.hits + self.misses
+        return {
+            "backend": "sqlite",
+            "size": size,
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+        }
+
+def create_result_cache(namespace: str = "") -> ResultCache:
+    """
+    Create the result cache configured in the settings
+
+    Args:
+        namespace (str): Identifies the model producing the results
+
+    Returns:
+        ResultCache: The result cache
+    """
+    ttl = settings.RESULT_CACHE_TTL if settings.RESULT_CACHE_TTL > 0 else None
+    if settings.RESULT_CACHE_BACKEND == "sqlite":
+        logger.info(f"Using SQLite result cache at {settings.RESULT_CACHE_PATH}")
+        return SQLiteResultCache(settings.RESULT_CACHE_PATH, settings.RESULT_CACHE_SIZE, ttl, namespace)
+    if settings.RESULT_CACHE_BACKEND != "memory":
+        raise ValueError(f"Unknown result cache backend: {settings.RESULT_CACHE_BACKEND}")
+    return ResultCache(settings.RESULT_CACHE_SIZE, ttl, namespace)
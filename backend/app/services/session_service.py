@@ -1,87 +1,220 @@
 import os
 import uuid
+import asyncio
+import hashlib
 import logging
-import time
-from datetime import datetime, timedelta
-from typing import Dict, Optional, Tuple, List
+from typing import Callable, Dict, Optional, Tuple, List
+import aiofiles
 from fastapi import UploadFile
 from pathlib import Path
 
 from app.config import settings
+from app.services.blob_store import BlobStore
+from app.services.session_store import Session, SessionStore, create_session_store
+from app.utils.image_utils import detect_image_format
+from app.utils.metrics import Counter
+from app.utils.preprocessing import PREPROCESSED_IMAGE_SUFFIX
 
 logger = logging.getLogger(__name__)
 
-class Session:
-    """Object representing a user session"""
-    def __init__(self, session_id: str, image_path: str):
-        self.session_id = session_id
-        self.image_path = image_path
-        self.created_at = datetime.now()
-        self.last_accessed = datetime.now()
-        self.questions = []  # History of questions for this session
-    
-    def is_expired(self) -> bool:
-        """Check if the session has expired"""
-        expiry_time = self.last_accessed + timedelta(seconds=settings.MAX_SESSION_AGE)
-        return datetime.now() > expiry_time
-    
-    def update_access_time(self):
-        """Update the last accessed time"""
-        self.last_accessed = datetime.now()
-    
-    def add_question(self, question: str, answer: Dict):
-        """Add a question and its answer to the session history"""
-        self.questions.append({
-            "question": question,
-            "answer": answer,
-            "timestamp": datetime.now().isoformat()
-        })
-        self.update_access_time()
+# Number of leading bytes needed to recognize an image format
+IMAGE_HEADER_SIZE = 12
+
+QUOTA_EVICTED_SESSIONS = Counter(
+    "vqa_quota_evicted_sessions_total", "Sessions removed to keep the stored images within UPLOAD_QUOTA_BYTES"
+)
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds MAX_UPLOAD_SIZE"""
+
+class InvalidImageError(Exception):
+    """Raised when an upload is not a supported image"""
 
 class SessionService:
     """Service for managing user sessions"""
     
-    def __init__(self):
-        """Initialize the session service"""
-        self.sessions: Dict[str, Session] = {}
-        self.ensure_upload_dir()
+    def __init__(self, store: Optional[SessionStore] = None):
+        """
+        Initialize the session service
         
-        # Start a background cleanup task
-        self._cleanup_sessions()
+        Args:
+            store (SessionStore, optional): Where sessions are kept, the store configured
+                in the settings if not given
+        """
+        self.store = store if store is not None else create_session_store()
+        self._removal_callbacks: List[Callable[[str], None]] = []
+        self.ensure_upload_dir()
+        self.blobs = BlobStore(settings.UPLOAD_DIR)
     
     def ensure_upload_dir(self):
         """Ensure the upload directory exists"""
         os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
     
-    def create_session(self, file: UploadFile) -> str:
+    def reconcile_uploads(self) -> int:
+        """
+        Remove uploaded images no session references, e.g. left behind by a previous run
+        
+        Skipped when several workers share the upload directory but each keeps its own
+        sessions, as this worker can't tell their images from orphaned ones.
+        
+        Returns:
+            int: Number of files removed
+        """
+        if not self.store.shared and settings.SERVER_WORKERS > 1:
+            logger.warning(
+                "Not removing orphaned uploads: each worker keeps its own sessions, "
+                "use SESSION_STORE_BACKEND=sqlite with several workers"
+            )
+            return 0
+        return self.blobs.reconcile(self.store.image_paths())
+    
+    def add_removal_callback(self, callback: Callable[[str], None]):
+        """
+        Register a callback invoked with the session ID when a session's image is released
+        
+        Args:
+            callback (Callable[[str], None]): The callback, e.g. to evict cached embeddings
+        """
+        self._removal_callbacks.append(callback)
+    
+    def _notify_removal(self, session_id: str):
+        """Invoke the removal callbacks for a session"""
+        for callback in self._removal_callbacks:
+            try:
+                callback(session_id)
+            except Exception as e:
+                logger.error(f"Error in session removal callback: {e}")
+    
+    async def create_session(
+        self,
+        file: UploadFile,
+        preprocess: Optional[Callable[[str], str]] = None
+    ) -> str:
         """
         Create a new session for the user
         
+        By the time this runs FastAPI has already received the whole upload into a
+        spooled temporary file; only UploadSizeLimitMiddleware acts while the body is
+        still arriving. The upload is copied into the upload directory in chunks, so
+        at most one chunk is held in memory, and the copy stops at the first chunk
+        that shows it is not an image or exceeds MAX_UPLOAD_SIZE.
+        Images are stored once per content hash: an image that is already stored
+        for another session is shared instead of being preprocessed and stored again.
+        
         Args:
             file (UploadFile): The uploaded image file
+            preprocess (Callable[[str], str], optional): Converts the uploaded file into the
+                form used for inference (a .npy array) and returns its path; the original
+                file is then removed
             
         Returns:
             str: The session ID
+            
+        Raises:
+            InvalidImageError: If the upload is not a supported image
+            UploadTooLargeError: If the upload exceeds MAX_UPLOAD_SIZE
         """
         # Generate a unique session ID
         session_id = str(uuid.uuid4())
         
         # Create a unique filename
-        timestamp = int(time.time())
         file_extension = Path(file.filename).suffix
-        filename = f"{timestamp}_{session_id}{file_extension}"
+        filename = f"{session_id}{file_extension}"
         
-        # Save the uploaded file
-        file_path = os.path.join(settings.UPLOAD_DIR, filename)
-        with open(file_path, "wb") as f:
-            f.write(file.file.read())
+        # Copy the spooled upload into the upload directory, hashing it as it is written
+        file_path = self.blobs.temp_path(filename)
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            async with aiofiles.open(file_path, "wb") as f:
+                header = b""
+                while True:
+                    chunk = await file.read(settings.UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    
+                    size += len(chunk)
+                    if size > settings.MAX_UPLOAD_SIZE:
+                        raise UploadTooLargeError(
+                            f"Upload exceeds the maximum size of {settings.MAX_UPLOAD_SIZE} bytes"
+                        )
+                    
+                    if len(header) < IMAGE_HEADER_SIZE:
+                        header += chunk[:IMAGE_HEADER_SIZE - len(header)]
+                        if len(header) >= IMAGE_HEADER_SIZE and detect_image_format(header) is None:
+                            raise InvalidImageError("File is not a supported image")
+                    
+                    hasher.update(chunk)
+                    await f.write(chunk)
+            
+            image_format = detect_image_format(header)
+            if image_format is None:
+                raise InvalidImageError("File is not a supported image")
+            
+            # Share the stored image if another session uploaded the same one
+            image_hash = hasher.hexdigest()
+            extension = PREPROCESSED_IMAGE_SUFFIX if preprocess is not None else f".{image_format}"
+            image_path = self.blobs.acquire(image_hash, extension, session_id)
+            if image_path is not None:
+                os.remove(file_path)
+            else:
+                if preprocess is not None:
+                    # Decode off the event loop, the original upload is no longer needed afterwards
+                    try:
+                        preprocessed_path = await asyncio.to_thread(preprocess, file_path)
+                    except Exception as e:
+                        raise InvalidImageError(f"Could not decode image: {e}")
+                    os.remove(file_path)
+                    file_path = preprocessed_path
+                
+                await asyncio.to_thread(self._make_room, os.path.getsize(file_path))
+                image_path = self.blobs.store(file_path, image_hash, extension, session_id)
+        except Exception:
+            # Don't leave partial uploads behind
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            raise
         
-        # Create and store the session
-        self.sessions[session_id] = Session(session_id, file_path)
+        # Create and store the session, recording the image content hash
+        await asyncio.to_thread(self.store.add, Session(session_id, image_path, image_hash))
         
-        logger.info(f"Created new session {session_id} with image {file_path}")
+        logger.info(f"Created new session {session_id} with image {image_path} ({size} bytes)")
         return session_id
     
+    def _make_room(self, size: int):
+        """
+        Remove the least recently used sessions until an image of the given size fits in UPLOAD_QUOTA_BYTES
+        
+        Removing a session frees its image only if no other session shares it, so
+        sessions are removed until enough space is actually freed.
+        
+        Args:
+            size (int): Size of the image about to be stored, in bytes
+            
+        Raises:
+            UploadTooLargeError: If the image alone is larger than the quota
+        """
+        if settings.UPLOAD_QUOTA_BYTES <= 0:
+            return
+        if size > settings.UPLOAD_QUOTA_BYTES:
+            # No amount of eviction makes room, keep the existing sessions
+            raise UploadTooLargeError(
+                f"Image of {size} bytes exceeds the upload quota of {settings.UPLOAD_QUOTA_BYTES} bytes"
+            )
+        
+        usage = self.blobs.usage_bytes()
+        evicted = 0
+        while usage + size > settings.UPLOAD_QUOTA_BYTES:
+            sessions = self.store.pop_least_recent()
+            if not sessions:
+                break
+            usage -= self._release_session(sessions[0])
+            evicted += 1
+        
+        if evicted:
+            QUOTA_EVICTED_SESSIONS.inc(evicted)
+            logger.info(f"Removed {evicted} least recently used sessions to stay within the upload quota")
+    
     def get_session(self, session_id: str) -> Optional[Session]:
         """
         Get a session by ID
@@ -92,7 +225,7 @@ class SessionService:
         Returns:
             Optional[Session]: The session, or None if not found or expired
         """
-        session = self.sessions.get(session_id)
+        session = self.store.get(session_id)
         
         if session is None:
             return None
@@ -102,8 +235,32 @@ class SessionService:
             return None
         
         session.update_access_time()
+        self.store.touch(session_id)
         return session
     
+    def add_question(self, session: Session, question: str, answer: Dict):
+        """
+        Add a question and its answer to a session's history
+        
+        Args:
+            session (Session): The session
+            question (str): The question
+            answer (Dict): The prediction result
+        """
+        self.store.add_question(session.session_id, question, answer)
+    
+    def get_questions(self, session: Session) -> List[Dict]:
+        """
+        Get a session's question history
+        
+        Args:
+            session (Session): The session
+            
+        Returns:
+            List[Dict]: The questions and their answers, oldest first
+        """
+        return self.store.get_questions(session.session_id)
+    
     def complete_session(self, session_id: str) -> bool:
         """
         Mark a session as complete and remove its resources
@@ -114,21 +271,23 @@ class SessionService:
         Returns:
             bool: True if successful, False otherwise
         """
-        session = self.sessions.get(session_id)
+        session = self.store.get(session_id)
         if not session:
             logger.warning(f"Cannot complete nonexistent session: {session_id}")
             return False
         
         logger.info(f"Completing session {session_id}")
+        self._notify_removal(session_id)
         
         try:
-            # Remove the image file but keep session data temporarily for any final operations
+            # Release the image but keep session data temporarily for any final operations
             if session.image_path and os.path.exists(session.image_path):
-                os.remove(session.image_path)
+                self.blobs.release(session.image_path, session.image_hash)
                 logger.info(f"Removed image file for completed session {session.image_path}")
                 
                 # Set the image path to None to indicate it's been removed
                 session.image_path = None
+                self.store.update(session)
                 return True
             return True  # No image to remove or already removed
         except Exception as e:
@@ -142,25 +301,51 @@ class SessionService:
         Args:
             session_id (str): The session ID
         """
-        session = self.sessions.pop(session_id, None)
+        session = self.store.remove(session_id)
         if session:
-            try:
-                # Remove the image file
-                if session.image_path and os.path.exists(session.image_path):
-                    os.remove(session.image_path)
-                    logger.info(f"Removed session file {session.image_path}")
-            except Exception as e:
-                logger.error(f"Error removing session file: {e}")
+            self._release_session(session)
+    
+    def _release_session(self, session: Session) -> int:
+        """
+        Release the resources of a session removed from the store
+        
+        Args:
+            session (Session): The removed session
+            
+        Returns:
+            int: Bytes freed on disk (0 if its image is still used by other sessions)
+        """
+        self._notify_removal(session.session_id)
+        try:
+            # Release the image, removing it if no other session uses it
+            if session.image_path and os.path.exists(session.image_path):
+                freed = self.blobs.release(session.image_path, session.image_hash)
+                logger.info(f"Removed session file {session.image_path}")
+                return freed
+        except Exception as e:
+            logger.error(f"Error removing session file: {e}")
+        return 0
     
     def _cleanup_sessions(self):
         """Clean up expired sessions"""
-        expired_sessions = [
-            session_id for session_id, session in self.sessions.items()
-            if session.is_expired()
-        ]
+        expired_sessions = self.store.pop_expired(settings.MAX_SESSION_AGE)
         
-        for session_id in expired_sessions:
-            self._remove_session(session_id)
+        for session in expired_sessions:
+            self._release_session(session)
         
         if expired_sessions:
-            logger.info(f"Cleaned up {len(expired_sessions)} expired sessions")
\ No newline at end of file
+            logger.info(f"Cleaned up {len(expired_sessions)} expired sessions")
+    
+    async def run_sweeper(self, interval: float):
+        """
+        Periodically clean up expired sessions until cancelled
+        
+        Args:
+            interval (float): Seconds between sweeps
+        """
+        while True:
+            try:
+                await asyncio.to_thread(self._cleanup_sessions)
+            except Exception as e:
+                logger.error(f"Error cleaning up sessions: {e}")
+            await asyncio.sleep(interval)
\ No newline at end of file
@@ -0,0 +1,351 @@
+"""
+Session stores, keeping sessions in memory or in SQLite shared between workers
+"""
+import os
+import json
+import sqlite3
+import logging
+import threading
+import contextlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+class Session:
+    """Object representing a user session"""
+    def __init__(self, session_id: str, image_path: str, image_hash: Optional[str] = None):
+        self.session_id = session_id
+        self.image_path = image_path
+        self.image_hash = image_hash  # SHA-256 of the uploaded image bytes
+        self.created_at = datetime.now()
+        self.last_accessed = datetime.now()
+        self.questions = []  # History of questions for this session
+
+    def is_expired(self) -> bool:
+        """Check if the session has expired"""
+        expiry_time = self.last_accessed + timedelta(seconds=settings.MAX_SESSION_AGE)
+        return datetime.now() > expiry_time
+
+    def update_access_time(self):
+        """Update the last accessed time"""
+        self.last_accessed = datetime.now()
+
+    def add_question(self, question: str, answer: Dict):
+        """Add a question and its answer to the session history"""
+        self.questions.append({
+            "question": question,
+            "answer": answer,
+            "timestamp": datetime.now().isoformat()
+        })
+        self.update_access_time()
+
+class SessionStore(ABC):
+    """Stores sessions and finds expired ones without scanning every session"""
+
+    # Whether every worker on the host sees the same sessions
+    shared = False
+
+    @abstractmethod
+    def add(self, session: Session):
+        """Add a new session"""
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[Session]:
+        """Get a session by ID, expired or not, without updating its access time; its history may not be loaded"""
+
+    @abstractmethod
+    def get_questions(self, session_id: str) -> List[Dict]:
+        """Get a session's question history, oldest first"""
+
+    @abstractmethod
+    def update(self, session: Session):
+        """Save changes to a session's image and access time"""
+
+    @abstractmethod
+    def touch(self, session_id: str):
+        """Update a session's access time"""
+
+    @abstractmethod
+    def add_question(self, session_id: str, question: str, answer: Dict):
+        """Append a question and its answer to a session's history and update its access time"""
+
+    @abstractmethod
+    def remove(self, session_id: str) -> Optional[Session]:
+        """Remove a session, returning it if this call removed it"""
+
+    @abstractmethod
+    def pop_expired(self, max_age: float) -> List[Session]:
+        """Remove and return sessions not accessed for more than max_age seconds"""
+
+    @abstractmethod
+    def pop_least_recent(self, count: int = 1) -> List[Session]:
+        """Remove and return up to count sessions, least recently accessed first"""
+
+    @abstractmethod
+    def image_paths(self) -> List[str]:
+        """Image paths of all sessions that still have an image"""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Number of sessions"""
+
+class MemorySessionStore(SessionStore):
+    """
+    In-process session store
+
+    Sessions are kept in an ordered dict in order of last access, so the sessions
+    that expire first are always at the front and a sweep only visits expired sessions.
+    """
+
+    def __init__(self):
+        self._sessions: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, session: Session):
+        with self._lock:
+            self._sessions[session.session_id] = session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def get_questions(self, session_id: str) -> List[Dict]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return list(session.questions) if session is not None else []
+
+    def update(self, session: Session):
+        with self._lock:
+            if session.session_id in self._sessions:
+                self._sessions[session.session_id] = session
+                self._sessions.move_to_end(session.session_id)
+
+    def touch(self, session_id: str):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.update_access_time()
+                self._sessions.move_to_end(session_id)
+
+    def add_question(self, session_id: str, question: str, answer: Dict):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.add_question(question, answer)
+                self._sessions.move_to_end(session_id)
+
+    def remove(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            return self._sessions.pop(session_id, None)
+
+    def pop_expired(self, max_age: float) -> List[Session]:
+        cutoff = datetime.now() - timedelta(seconds=max_age)
+        expired = []
+        with self._lock:
+            while self._sessions:
+                session = next(iter(self._sessions.values()))
+                if session.last_accessed > cutoff:
+                    break
+                expired.append(self._sessions.popitem(last=False)[1])
+        return expired
+
+    def pop_least_recent(self, count: int = 1) -> List[Session]:
+        with self._lock:
+            return [self._sessions.popitem(last=False)[1] for _ in range(min(count, len(self._sessions)))]
+
+    def image_paths(self) -> List[str]:
+        with self._lock:
+            return [session.image_path for session in self._sessions.values() if session.image_path]
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Session store in a SQLite database, shared by all workers on a host
+
+    Sessions are indexed by last access time for sweeping. Removal runs in a write
+    transaction, so when several workers sweep or complete the same session only
+    one of them gets it back and deletes its image.
+    """
+
+    shared = True
+
+    def __init__(self, path: str):
+        """
+        Initialize the session store
+
+        Args:
+            path (str): Path to the SQLite database file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._connection_pid: Optional[int] = None
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, image_path TEXT, image_hash TEXT, "
+                "created_at REAL NOT NULL, last_accessed REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_accessed ON sessions (last_accessed)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS session_questions ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, entry TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS session_questions_session_id ON session_questions (session_id)"
+            )
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """Connection of the current process, reopened in workers forked after the store was created"""
+        if self._connection_pid != os.getpid():
+            # Autocommit mode, transactions are started explicitly where needed
+            self._connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """Run statements in a write transaction, holding the lock"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _load(self, row) -> Session:
+        """Build a session from a sessions row, without its question history (see get_questions)"""
+        session = Session(row[0], row[1], row[2])
+        session.created_at = datetime.fromtimestamp(row[3])
+        session.last_accessed = datetime.fromtimestamp(row[4])
+        return session
+
+    def _delete(self, session_ids: List[str]):
+        """Delete sessions and their history, the caller must hold a transaction"""
+        self._conn.executemany("DELETE FROM sessions WHERE session_id = ?", [(sid,) for sid in session_ids])
+        self._conn.executemany("DELETE FROM session_questions WHERE session_id = ?", [(sid,) for sid in session_ids])
+
+    def add(self, session: Session):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (session_id, image_path, image_hash, created_at, last_accessed) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    session.session_id, session.image_path, session.image_hash,
+                    session.created_at.timestamp(), session.last_accessed.timestamp()
+                )
+            )
+
+    def get(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT session_id, image_path, image_hash, created_at, last_accessed "
+                "FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            return self._load(row) if row is not None else None
+
+    def get_questions(self, session_id: str) -> List[Dict]:
+        with self._lock:
+            return [
+                json.loads(entry) for (entry,) in self._conn.execute(
+                    "SELECT entry FROM session_questions WHERE session_id = ? ORDER BY id", (session_id,)
+                )
+            ]
+
+    def update(self, session: Session):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE sessions SET image_path = ?, image_hash = ?, last_accessed = ? WHERE session_id = ?",
+                (session.image_path, session.image_hash, session.last_accessed.timestamp(), session.session_id)
+            )
+
+    def touch(self, session_id: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE sessions SET last_accessed = ? WHERE session_id = ?",
+                (datetime.now().timestamp(), session_id)
+            )
+
+    def add_question(self, session_id: str, question: str, answer: Dict):
+        now = datetime.now()
+        entry = {"question": question, "answer": answer, "timestamp": now.isoformat()}
+        with self._transaction():
+            self._conn.execute(
+                "INSERT INTO session_questions (session_id, entry) VALUES (?, ?)",
+                (session_id, json.dumps(entry))
+            )
+            self._conn.execute(
+                "UPDATE sessions SET last_accessed = ? WHERE session_id = ?", (now.timestamp(), session_id)
+            )
+
+    def remove(self, session_id: str) -> Optional[Session]:
+        with self._transaction():
+            row = self._conn.execute(
+                "SELECT session_id, image_path, image_hash, created_at, last_accessed "
+                "FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            session = self._load(row)
+            self._delete([session_id])
+        return session
+
+    def pop_expired(self, max_age: float) -> List[Session]:
+        cutoff = (datetime.now() - timedelta(seconds=max_age)).timestamp()
+        with self._transaction():
+            rows = self._conn.execute(
+                "SELECT session_id, image_path, image_hash, created_at, last_accessed "
+                "FROM sessions WHERE last_accessed <= ?", (cutoff,)
+            ).fetchall()
+            sessions = [self._load(row) for row in rows]
+            self._delete([session.session_id for session in sessions])
+        return sessions
+
+    def pop_least_recent(self, count: int = 1) -> List[Session]:
+        with self._transaction():
+            rows = self._conn.execute(
+                "SELECT session_id, image_path, image_hash, created_at, last_accessed "
+                "FROM sessions ORDER BY last_accessed LIMIT ?", (count,)
+            ).fetchall()
+            sessions = [self._load(row) for row in rows]
+            self._delete([session.session_id for session in sessions])
+        return sessions
+
+    def image_paths(self) -> List[str]:
+        with self._lock:
+            return [
+                image_path for (image_path,) in self._conn.execute(
+                    "SELECT image_path FROM sessions WHERE image_path IS NOT NULL"
+                )
+            ]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+def create_session_store() -> SessionStore:
+    """
+    Create the session store configured in the settings
+
+    Returns:
+        SessionStore: The session store
+    """
+    if settings.SESSION_STORE_BACKEND == "sqlite":
+        logger.info(f"Using SQLite session store at {settings.SESSION_STORE_PATH}")
+        return SQLiteSessionStore(settings.SESSION_STORE_PATH)
+    if settings.SESSION_STORE_BACKEND != "memory":
+        raise ValueError(f"Unknown session store backend: {settings.SESSION_STORE_BACKEND}")
+    return MemorySessionStore()
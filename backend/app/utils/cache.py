@@ -0,0 +1,117 @@
+"""
+Caching utilities
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+class LRUCache:
+    """Thread-safe, size-bounded least-recently-used cache"""
+
+    def __init__(
+        self,
+        maxsize: int,
+        sizeof: Optional[Callable[[Any], int]] = None,
+        ttl: Optional[float] = None
+    ):
+        """
+        Initialize the cache
+
+        Args:
+            maxsize (int): Maximum number of entries, 0 disables caching
+            sizeof (Callable[[Any], int], optional): Returns the size of a value in bytes,
+                used to report the memory footprint of the cache
+            ttl (float, optional): Seconds after which an entry expires, None for no expiry
+        """
+        self.maxsize = maxsize
+        self.sizeof = sizeof
+        self.ttl = ttl
+        self.nbytes = 0
+        self._data: OrderedDict = OrderedDict()
+        self._expires_at: Dict[Hashable, float] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Get a value from the cache
+
+        Args:
+            key (Hashable): The cache key
+
+        Returns:
+            Optional[Any]: The cached value, or None if not present
+        """
+        with self._lock:
+            if key in self._expires_at and self._expires_at[key] <= time.monotonic():
+                self._remove(key)
+            if key not in self._data:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key]
+
+    def put(self, key: Hashable, value: Any):
+        """
+        Add a value to the cache, evicting the least recently used entry if full
+
+        Args:
+            key (Hashable): The cache key
+            value (Any): The value to cache
+        """
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._remove(key)
+            self._data[key] = value
+            self.nbytes += self._size(value)
+            if self.ttl is not None:
+                self._expires_at[key] = time.monotonic() + self.ttl
+            while len(self._data) > self.maxsize:
+                self._remove(next(iter(self._data)))
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        """Remove an entry from the cache and return it"""
+        with self._lock:
+            return self._remove(key)
+
+    def clear(self):
+        """Remove all entries from the cache"""
+        with self._lock:
+            self._data.clear()
+            self._expires_at.clear()
+            self.nbytes = 0
+
+    def _remove(self, key: Hashable) -> Optional[Any]:
+        """Remove an entry, the caller must hold the lock"""
+        self._expires_at.pop(key, None)
+        value = self._data.pop(key, None)
+        if value is not None:
+            self.nbytes -= self._size(value)
+        return value
+
+    def _size(self, value: Any) -> int:
+        """Size of a value in bytes, or 0 if no sizeof function was given"""
+        return self.sizeof(value) if self.sizeof is not None else 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache statistics"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "bytes": self.nbytes,
+        }
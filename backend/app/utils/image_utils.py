@@ -10,6 +10,34 @@ from typing import Tuple, Optional
 
 logger = logging.getLogger(__name__)
 
+# Leading bytes of the image formats accepted for upload
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"BM", "bmp"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+]
+
+def detect_image_format(header: bytes) -> Optional[str]:
+    """
+    Detect an image format from the first bytes of a file
+    
+    Args:
+        header (bytes): The first bytes of the file (at least 12)
+        
+    Returns:
+        Optional[str]: The image format, or None if not a supported image
+    """
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    for signature, image_format in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return image_format
+    return None
+
 def validate_image(image_path: str) -> bool:
     """
     Validate if a file is a valid image
@@ -62,6 +90,36 @@ def resize_image(image_path: str, max_size: Tuple[int, int] = (1024, 1024)) -> O
         logger.error(f"Image resizing failed: {e}")
         return None
 
+def load_resized_image(
+    image_path: str,
+    size: Tuple[int, int],
+    resample: int = Image.BILINEAR,
+    draft: bool = True
+) -> Image.Image:
+    """
+    Load an image as RGB, resized to exactly the given size
+    
+    With draft enabled, JPEGs are decoded directly at a reduced scale (the smallest
+    DCT scale still at least as large as the target), which is much faster for
+    large phone photos than decoding at full resolution and resizing.
+    
+    Args:
+        image_path (str): Path to the image file
+        size (Tuple[int, int]): Target width and height
+        resample (int): PIL resampling filter
+        draft (bool): Whether to use JPEG draft mode decoding
+        
+    Returns:
+        Image.Image: The resized RGB image
+    """
+    with Image.open(image_path) as img:
+        if draft and img.format == "JPEG":
+            img.draft("RGB", size)
+        img = img.convert("RGB")
+        if img.size != size:
+            img = img.resize(size, resample)
+        return img
+
 def image_to_base64(image_path: str) -> Optional[str]:
     """
     Convert an image to base64 string
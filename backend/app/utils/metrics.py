@@ -0,0 +1,293 @@
+"""
+Metrics exported in the Prometheus text format
+"""
+import os
+import math
+import time
+import bisect
+import logging
+import threading
+import contextlib
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Content type of the Prometheus text exposition format (the response adds the charset)
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Latency buckets in seconds, from sub-millisecond stages to slow requests
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value: str) -> str:
+    """Escape a label value"""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence) -> str:
+    """Format label names and values as {name="value",...}"""
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+def _format_value(value: float) -> str:
+    """Format a sample value"""
+    if isinstance(value, int) or (isinstance(value, float) and value.is_integer()):
+        return str(int(value))
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics: Dict[str, "Metric"] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: "Metric"):
+        """Register a metric, replacing any metric of the same name"""
+        with self._lock:
+            self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """
+        Render all metrics
+
+        Returns:
+            str: The metrics in the Prometheus text format
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                samples = metric.collect()
+            except Exception as e:
+                logger.warning(f"Could not collect metric {metric.name}: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+# Default registry, rendered by the /metrics endpoint
+REGISTRY = Registry()
+
+class Metric:
+    """
+    A counter or gauge, with one value per combination of label values
+
+    Values are either updated by the application, or read from fn when the metrics
+    are rendered. fn returns a single value, a mapping of label value tuples to
+    values, or None when there is nothing to report.
+    """
+
+    type_name = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        fn: Optional[Callable] = None,
+        registry: Optional[Registry] = REGISTRY
+    ):
+        """
+        Initialize the metric
+
+        Args:
+            name (str): Metric name
+            documentation (str): Help text
+            labelnames (Sequence[str]): Label names
+            fn (Callable, optional): Returns the current value(s) when the metrics are rendered
+            registry (Registry, optional): Registry to add the metric to
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _add(self, amount: float, labels: Tuple):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self) -> List[str]:
+        """Format the current values as sample lines"""
+        if self.fn is not None:
+            values = self.fn()
+            if values is None:
+                return []
+            if not isinstance(values, dict):
+                values = {(): values}
+        else:
+            with self._lock:
+                values = dict(self._values)
+            if not values and not self.labelnames:
+                values = {(): 0}
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in values.items()
+        ]
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, labels: Tuple = ()):
+        """Increase the count for the given label values"""
+        self._add(amount, labels)
+
+class Gauge(Metric):
+    """Value that goes up and down"""
+
+    type_name = "gauge"
+
+    def set(self, value: float, labels: Tuple = ()):
+        """Set the value for the given label values"""
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, amount: float = 1, labels: Tuple = ()):
+        """Increase the value for the given label values"""
+        self._add(amount, labels)
+
+    def dec(self, amount: float = 1, labels: Tuple = ()):
+        """Decrease the value for the given label values"""
+        self._add(-amount, labels)
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets, with their sum and count"""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+        registry: Optional[Registry] = REGISTRY
+    ):
+        """
+        Initialize the histogram
+
+        Args:
+            name (str): Metric name
+            documentation (str): Help text
+            labelnames (Sequence[str]): Label names
+            buckets (Sequence[float]): Upper bounds of the buckets, in increasing order
+            registry (Registry, optional): Registry to add the histogram to
+        """
+        super().__init__(name, documentation, labelnames, registry=registry)
+        self.buckets = tuple(sorted(buckets))
+        # Per label values: observations per bucket (plus +Inf), sum
+        self._series: Dict[Tuple, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, labels: Tuple = ()):
+        """Record an observation for the given label values"""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    @contextlib.contextmanager
+    def time(self, labels: Tuple = ()):
+        """Observe the time spent in the with block, in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, labels)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            series = {labels: (list(counts), total[0]) for labels, (counts, total) in self._series.items()}
+        if not series and not self.labelnames:
+            series = {(): ([0] * (len(self.buckets) + 1), 0.0)}
+
+        lines = []
+        labelnames = self.labelnames + ("le",)
+        for labels, (counts, total) in series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(labelnames, labels + (_format_value(bound),))} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+def process_rss_bytes() -> Optional[int]:
+    """Resident set size of the current process, or None where /proc is not available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def directory_bytes(path: str) -> int:
+    """Total size of the files under a directory"""
+    total = 0
+    pending = [path]
+    while pending:
+        try:
+            entries = list(os.scandir(pending.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    total += entry.stat(follow_symlinks=False).st_size
+            except OSError:
+                continue
+    return total
+
+HTTP_REQUESTS = Counter(
+    "vqa_http_requests_total", "HTTP requests by method, route and status code", ("method", "route", "status")
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "vqa_http_request_duration_seconds", "HTTP request latency by method and route", ("method", "route")
+)
+
+class RequestMetricsMiddleware:
+    """
+    Count HTTP requests and time them by route
+
+    Requests are labelled with the route's path template (e.g. /api/vqa/session/{session_id}),
+    so session IDs don't each get their own time series; unmatched paths share one label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUESTS.inc(labels=(scope["method"], route_path, str(status)))
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, (scope["method"], route_path))
@@ -0,0 +1,63 @@
+"""
+Coalescing of identical concurrent requests
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+class SingleFlight:
+    """
+    Run at most one call per key at a time, sharing its result with concurrent callers of the same key
+
+    The call runs in its own task, so a caller that is cancelled (e.g. a client that
+    disconnects) doesn't cancel it for the others. An exception is raised to every
+    caller waiting on the call. Results are not kept once the call finishes.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run fn, or wait for the call already running for the same key
+
+        Args:
+            key (Hashable): Identifies identical requests
+            fn (Callable[[], Awaitable[Any]]): Computes the result
+
+        Returns:
+            Any: The result of the call, shared by all callers of the key
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        """Forget a finished call"""
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Don't log "exception was never retrieved" when every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get coalescing statistics
+
+        Returns:
+            Dict[str, Any]: Calls run, requests that waited on a running call, and calls running now
+        """
+        total = self.calls + self.coalesced
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "coalesced_rate": self.coalesced / total if total else 0.0,
+            "in_flight": len(self._calls),
+        }
@@ -0,0 +1,95 @@
+"""
+Middleware enforcing the upload size limit while the request body arrives
+"""
+import json
+import logging
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+# Allowance for multipart boundaries and part headers around the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+class _BodyTooLarge(Exception):
+    """Raised from receive() once the body exceeds the limit"""
+
+class UploadSizeLimitMiddleware:
+    """
+    Reject request bodies larger than max_size on the given paths with 413
+
+    Requests declaring a larger Content-Length are rejected before any of the body
+    is read; chunked or understated bodies are cut off as soon as they pass the limit.
+    """
+
+    def __init__(self, app, max_size: int, paths: Iterable[str]):
+        """
+        Initialize the middleware
+
+        Args:
+            app: The ASGI application
+            max_size (int): Maximum size of the uploaded file in bytes
+            paths (Iterable[str]): Request paths the limit applies to
+        """
+        self.app = app
+        self.max_size = max_size
+        self.max_body_size = max_size + MULTIPART_OVERHEAD
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", []))
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_body_size:
+            await self._reject(send)
+            return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    exceeded = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                if exceeded:
+                    # The app turned the aborted body into an error response, replace it with 413
+                    await self._reject(send)
+                    response_started = True
+                    return
+                response_started = True
+            elif exceeded:
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except _BodyTooLarge:
+            if not response_started:
+                await self._reject(send)
+
+    async def _reject(self, send):
+        """Send a 413 response"""
+        logger.warning("Rejecting upload larger than the maximum size")
+        body = json.dumps({"detail": f"Upload exceeds the maximum size of {self.max_size} bytes"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,91 @@
+"""
+Compare the eager, TorchScript and ONNX Runtime inference backends
+
+For each backend this measures the one-off export time, the startup time of
+load_model with the export in place, single-request latency and batched
+throughput, with the embedding caches disabled. Answers are compared with the
+eager backend. With --tiny the model is a small randomly initialized one (see
+benchmarks.tiny_model), so the benchmark runs without a checkpoint.
+
+Usage:
+    python -m benchmarks.bench_backends [--tiny] [--images IMG ...] [--backends eager torchscript onnx]
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+
+from app.config import settings
+from benchmarks.common import SAMPLE_QUESTIONS, load_images, load_model_service, time_fn
+from benchmarks.tiny_model import use_tiny_model
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tiny", action="store_true", help="Use a tiny randomly initialized model")
+    parser.add_argument("--images", nargs="*", help="Images to use (random images if omitted)")
+    parser.add_argument("--backends", nargs="+", default=["eager", "torchscript", "onnx"])
+    parser.add_argument("--batch-size", type=int, default=16, help="Batch size for the throughput measurement")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    # Measure uncached inference
+    settings.VISION_CACHE_SIZE = 0
+    settings.QUESTION_CACHE_SIZE = 0
+
+    results = []
+    reference = None
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.tiny:
+            use_tiny_model(os.path.join(tmp_dir, "model"))
+        settings.EXPORT_DIR = os.path.join(tmp_dir, "exports")
+        image_paths = []
+        for i, image in enumerate(load_images(args.images, args.batch_size)):
+            image_paths.append(os.path.join(tmp_dir, f"{i}.png"))
+            image.save(image_paths[-1])
+        requests = [
+            (image_path, SAMPLE_QUESTIONS[i % len(SAMPLE_QUESTIONS)], None)
+            for i, image_path in enumerate(image_paths)
+        ]
+
+        for backend in args.backends:
+            settings.INFERENCE_BACKEND = backend
+
+            # The first load exports the model, the second measures startup with the export in place
+            start = time.perf_counter()
+            load_model_service()
+            export_s = time.perf_counter() - start
+            start = time.perf_counter()
+            model_service = load_model_service()
+            startup_s = time.perf_counter() - start
+
+            latency = time_fn(lambda: model_service.predict_batch(requests[:1]), args.repeat)
+            batch = time_fn(lambda: model_service.predict_batch(requests), args.repeat)
+            answers = [result['answer'] for result in model_service.predict_batch(requests)]
+            if reference is None:
+                reference = answers
+
+            result = {
+                "backend": backend,
+                "export_s": export_s - startup_s if backend != "eager" else 0.0,
+                "startup_s": startup_s,
+                "latency_p50_ms": latency["p50_ms"],
+                "batch_p50_ms": batch["p50_ms"],
+                "throughput_qps": args.batch_size / (batch["p50_ms"] / 1000),
+                "answer_agreement": sum(a == r for a, r in zip(answers, reference)) / len(answers),
+            }
+            results.append(result)
+            print(
+                f"{backend:<12} export={result['export_s']:6.2f} s  startup={result['startup_s']:6.2f} s  "
+                f"latency_p50={result['latency_p50_ms']:8.2f} ms  "
+                f"throughput={result['throughput_qps']:8.1f} q/s  "
+                f"answer_agreement={result['answer_agreement']:.3f}"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Accuracy-parity check of reduced-precision inference modes against fp32
+
+For each precision mode the model is loaded fresh and every (image, question) pair
+in the sample set is answered one request at a time, with the embedding caches
+disabled. Answer agreement with fp32 is reported along with latency, model size
+and the resident memory added by loading the model. With --tiny the model is a
+small randomly initialized one (see benchmarks.tiny_model), so the benchmark runs
+without a checkpoint; its answer agreement says nothing about the real model.
+
+Usage:
+    python -m benchmarks.bench_precision [--tiny] [--images IMG ...] [--modes fp32 int8 bf16] [--samples 64]
+"""
+import io
+import gc
+import os
+import json
+import argparse
+import tempfile
+import statistics
+import time
+
+import torch
+
+from app.config import settings
+from benchmarks.common import SAMPLE_QUESTIONS, get_rss_bytes, load_images, load_model_service
+from benchmarks.tiny_model import use_tiny_model
+
+def model_size_bytes(model) -> int:
+    """Serialized size of the model's state dict"""
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+def run_mode(precision, samples):
+    """Load the model in the given precision and answer every sample"""
+    settings.INFERENCE_PRECISION = precision
+    gc.collect()
+    rss_before = get_rss_bytes()
+    model_service = load_model_service()
+    rss_delta = get_rss_bytes() - rss_before
+
+    # Warm up, then time each request individually
+    model_service.predict(*samples[0])
+    answers, timings = [], []
+    for image_path, question in samples:
+        start = time.perf_counter()
+        result = model_service.predict(image_path, question)
+        timings.append((time.perf_counter() - start) * 1000)
+        answers.append((result['answer'], result['is_answerable']))
+
+    stats = {
+        "precision": model_service.precision,
+        "p50_ms": statistics.median(timings),
+        "mean_ms": statistics.mean(timings),
+        "model_mb": model_size_bytes(model_service.model) / 2**20,
+        "rss_delta_mb": rss_delta / 2**20,
+    }
+    del model_service
+    return stats, answers
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tiny", action="store_true", help="Use a tiny randomly initialized model")
+    parser.add_argument("--images", nargs="*", help="Sample images (random images if omitted)")
+    parser.add_argument("--modes", nargs="+", default=["fp32", "int8", "bf16"])
+    parser.add_argument("--samples", type=int, default=64, help="Number of (image, question) pairs")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    # Measure uncached inference
+    settings.VISION_CACHE_SIZE = 0
+    settings.QUESTION_CACHE_SIZE = 0
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.tiny:
+            use_tiny_model(os.path.join(tmp_dir, "model"))
+        image_paths = []
+        for i, image in enumerate(load_images(args.images, min(args.samples, 16))):
+            image_paths.append(os.path.join(tmp_dir, f"{i}.png"))
+            image.save(image_paths[-1])
+        samples = [
+            (image_paths[i % len(image_paths)], SAMPLE_QUESTIONS[(i // len(image_paths) + i) % len(SAMPLE_QUESTIONS)])
+            for i in range(args.samples)
+        ]
+
+        modes = ["fp32"] + [mode for mode in args.modes if mode != "fp32"]
+        reference, results = None, []
+        for mode in modes:
+            stats, answers = run_mode(mode, samples)
+            if reference is None:
+                reference_stats, reference = stats, answers
+            stats["answer_agreement"] = sum(a[0] == r[0] for a, r in zip(answers, reference)) / len(answers)
+            stats["answerable_agreement"] = sum(a[1] == r[1] for a, r in zip(answers, reference)) / len(answers)
+            stats["latency_delta"] = stats["p50_ms"] / reference_stats["p50_ms"] - 1
+            stats["model_size_delta"] = stats["model_mb"] / reference_stats["model_mb"] - 1
+            results.append(stats)
+            print(
+                f"{mode:<5} p50={stats['p50_ms']:8.2f} ms ({stats['latency_delta']:+.1%})  "
+                f"model={stats['model_mb']:8.1f} MB ({stats['model_size_delta']:+.1%})  "
+                f"rss_delta={stats['rss_delta_mb']:8.1f} MB  "
+                f"answer_agreement={stats['answer_agreement']:.3f}  "
+                f"answerable_agreement={stats['answerable_agreement']:.3f}"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
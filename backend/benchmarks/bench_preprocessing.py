@@ -0,0 +1,100 @@
+"""
+Compare batched image preprocessing against ViTImageProcessor
+
+Each variant starts from image files on disk, so decoding is included. The
+baselines call the processor once per image (as the server originally did) and
+once for the whole list; the batched variants use ImagePreprocessor with inline
+decoding and with a decoding thread pool. Pixel values are checked against the
+per-image processor output. With --tiny the image processor comes from a small
+randomly initialized model (see benchmarks.tiny_model), so the benchmark runs
+without a checkpoint.
+
+Usage:
+    python -m benchmarks.bench_preprocessing [--tiny] [--images IMG ...] [--batch-sizes 1 8 32 64] [--workers 4]
+"""
+import os
+import json
+import argparse
+import tempfile
+
+import torch
+from PIL import Image
+
+from app.utils.preprocessing import ImagePreprocessor
+from benchmarks.common import load_images, load_model_service, time_fn
+from benchmarks.tiny_model import use_tiny_model
+
+# Maximum absolute difference in pixel values accepted as matching the processor
+TOLERANCE = 1e-4
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tiny", action="store_true", help="Use a tiny randomly initialized model")
+    parser.add_argument("--images", nargs="*", help="Images to use (random 640x480 JPEGs if omitted)")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--workers", type=int, default=4, help="Decoding threads for the pooled variant")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.tiny:
+            use_tiny_model(os.path.join(tmp_dir, "model"))
+        processor = load_model_service().processor
+    inline = ImagePreprocessor.from_processor(processor, num_workers=1)
+    pooled = ImagePreprocessor.from_processor(processor, num_workers=args.workers)
+
+    def processor_per_image(paths):
+        return torch.cat([
+            processor(images=Image.open(path).convert('RGB'), return_tensors="pt")['pixel_values']
+            for path in paths
+        ])
+
+    def processor_batched(paths):
+        images = [Image.open(path).convert('RGB') for path in paths]
+        return processor(images=images, return_tensors="pt")['pixel_values']
+
+    variants = {
+        "processor_per_image": processor_per_image,
+        "processor_batched": processor_batched,
+        "preprocessor": inline,
+        f"preprocessor_{args.workers}_workers": pooled,
+    }
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        max_batch_size = max(args.batch_sizes)
+        image_paths = []
+        for i, image in enumerate(load_images(args.images, max_batch_size)):
+            image_paths.append(os.path.join(tmp_dir, f"{i}.jpg"))
+            image.save(image_paths[-1], quality=90)
+
+        for batch_size in args.batch_sizes:
+            paths = image_paths[:batch_size]
+            reference = processor_per_image(paths)
+            for name, fn in variants.items():
+                timing = time_fn(lambda: fn(paths), args.repeat)
+                max_diff = (fn(paths) - reference).abs().max().item()
+                result = {
+                    "batch_size": batch_size,
+                    "variant": name,
+                    **timing,
+                    "images_per_sec": batch_size / (timing["p50_ms"] / 1000),
+                    "max_abs_diff": max_diff,
+                    "matches": max_diff <= TOLERANCE,
+                }
+                results.append(result)
+                print(
+                    f"batch={batch_size:<3} {name:<24} p50={result['p50_ms']:8.2f} ms  "
+                    f"images/s={result['images_per_sec']:8.1f}  max_abs_diff={max_diff:.2e}"
+                )
+
+    inline.close()
+    pooled.close()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
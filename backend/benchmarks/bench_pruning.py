@@ -0,0 +1,126 @@
+"""
+Measure answer agreement and latency of token pruning against the full model
+
+Compares the full encoders with CLS-only final layers (which should agree
+exactly) and with patch token pruning at each ratio, as set by
+TOKEN_PRUNE_RATIO, TOKEN_PRUNE_LAYERS and CLS_ONLY_FINAL_LAYER. For each
+configuration this reports how often its answer and answerable verdict agree
+with the full model's, the largest change in the answer logits, and the vision
+encoder and end-to-end latency with the embedding caches disabled. The eager
+backend is used so the configurations can be switched without re-exporting.
+
+Usage:
+    python -m benchmarks.bench_pruning [--tiny] [--images IMG ...] [--ratios 0.1 0.25 0.5] [--layers 3 6 9]
+"""
+import os
+import argparse
+import tempfile
+
+import torch
+
+from app.config import settings
+from benchmarks.common import SAMPLE_QUESTIONS, load_images, load_model_service, report_baseline, time_fn
+from benchmarks.tiny_model import use_tiny_model
+
+def answer_logits(model_service, pixel_values, question_encoding):
+    """Answer logits for a batch, bypassing the caches"""
+    with model_service._inference_context():
+        vision_embeds = model_service.encode_pixel_values(pixel_values)
+        text_embeds = model_service._encode_question_batch(question_encoding)
+        return model_service.backend.classify(vision_embeds, text_embeds)['answer_logits'].float()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tiny", action="store_true", help="Use a tiny randomly initialized model")
+    parser.add_argument("--images", nargs="*", help="Sample images (random images if omitted)")
+    parser.add_argument("--ratios", nargs="+", type=float, default=[0.1, 0.25, 0.5], help="Prune ratios to compare")
+    parser.add_argument("--layers", nargs="+", type=int, help="Vision layers to prune after (default: auto)")
+    parser.add_argument("--samples", type=int, default=64, help="Number of (image, question) pairs")
+    parser.add_argument("--batch-size", type=int, default=16, help="Batch size for the throughput measurement")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--output", help="Write results as JSON to this path, e.g. to use as a baseline")
+    parser.add_argument("--baseline", help="Compare with results saved by an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    # Measure uncached inference, switching configurations on the loaded model
+    settings.VISION_CACHE_SIZE = 0
+    settings.QUESTION_CACHE_SIZE = 0
+    settings.INFERENCE_BACKEND = "eager"
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.tiny:
+            # Smaller patches than the default tiny model, so there are tokens worth pruning
+            use_tiny_model(os.path.join(tmp_dir, "model"), num_layers=4, patch_size=16)
+        model_service = load_model_service()
+        model = model_service.model
+
+        image_paths = []
+        for i, image in enumerate(load_images(args.images, args.samples)):
+            image_paths.append(os.path.join(tmp_dir, f"{i}.jpg"))
+            image.save(image_paths[-1])
+        requests = [
+            (image_path, SAMPLE_QUESTIONS[i % len(SAMPLE_QUESTIONS)], None)
+            for i, image_path in enumerate(image_paths)
+        ]
+        batch = requests[:args.batch_size]
+        batch_pixel_values = model_service.preprocessor.to_pixel_values(
+            model_service.preprocessor.load_images([image_path for image_path, _, _ in batch])
+        )
+
+        configs = [("full", 0.0, False), ("cls_only", 0.0, True)] + [
+            (f"prune={ratio}", ratio, True) for ratio in args.ratios
+        ]
+        reference = None
+        results = {"model_id": model_service.model_id, "layers": args.layers or "auto", "configs": {}}
+        for name, ratio, cls_only in configs:
+            model.set_token_pruning(ratio, args.layers, cls_only)
+            predictions, logits = [], []
+            for offset in range(0, len(requests), args.batch_size):
+                chunk = requests[offset:offset + args.batch_size]
+                predictions.extend(model_service.predict_batch(chunk))
+                pixel_values = model_service.preprocessor.to_pixel_values(
+                    model_service.preprocessor.load_images([image_path for image_path, _, _ in chunk])
+                )
+                question_encoding = model_service.tokenizer(
+                    [question for _, question, _ in chunk], padding='longest', truncation=True,
+                    max_length=settings.MAX_QUESTION_LENGTH, return_tensors='pt'
+                )
+                logits.append(answer_logits(model_service, pixel_values, question_encoding))
+            logits = torch.cat(logits)
+            if reference is None:
+                reference = (predictions, logits)
+
+            vision = time_fn(lambda: model_service.encode_pixel_values(batch_pixel_values), args.repeat)
+            latency = time_fn(lambda: model_service.predict_batch(batch[:1]), args.repeat)
+            throughput = time_fn(lambda: model_service.predict_batch(batch), args.repeat)
+            results["configs"][name] = {
+                "answer_agreement": sum(
+                    p['answer'] == r['answer'] for p, r in zip(predictions, reference[0])
+                ) / len(predictions),
+                "answerable_agreement": sum(
+                    p['is_answerable'] == r['is_answerable'] for p, r in zip(predictions, reference[0])
+                ) / len(predictions),
+                "max_logit_diff": float((logits - reference[1]).abs().max()),
+                "vision_encoder_p50_ms": vision["p50_ms"],
+                "latency_p50_ms": latency["p50_ms"],
+                "batch_p50_ms": throughput["p50_ms"],
+                "questions_per_sec": len(batch) / (throughput["p50_ms"] / 1000),
+            }
+
+        full = results["configs"]["full"]
+        for name, result in results["configs"].items():
+            print(
+                f"{name:<12} answer_agreement={result['answer_agreement']:.3f}  "
+                f"answerable_agreement={result['answerable_agreement']:.3f}  "
+                f"max_logit_diff={result['max_logit_diff']:.2e}  "
+                f"vision_encoder={result['vision_encoder_p50_ms']:8.2f} ms  "
+                f"latency_p50={result['latency_p50_ms']:8.2f} ms  "
+                f"speedup={full['batch_p50_ms'] / result['batch_p50_ms']:.2f}x"
+            )
+
+    if not report_baseline(results, args.output, args.baseline, args.tolerance):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Micro-benchmark each stage of ModelService.predict
+
+Times image decoding, pixel normalization, tokenization, the vision and text
+encoders, the fusion and prediction heads (including decoding the answers) and
+the full uncached predict_batch, at each batch size. With --tiny the model is a
+small randomly initialized one (see benchmarks.tiny_model), so the benchmark
+runs anywhere without a checkpoint or network.
+
+Usage:
+    python -m benchmarks.bench_stages [--tiny] [--batch-sizes 1 8 32] [--output stages.json] [--baseline stages.json]
+"""
+import os
+import argparse
+import tempfile
+
+from app.config import settings
+from benchmarks.common import (
+    SAMPLE_QUESTIONS, get_peak_rss_bytes, load_images, load_model_service, report_baseline, time_fn
+)
+from benchmarks.tiny_model import use_tiny_model
+
+def bench_batch(model_service, image_paths, questions, repeat):
+    """Time every stage for one batch of (image, question) pairs"""
+    images = model_service.preprocessor.load_images(image_paths)
+    pixel_values = model_service.preprocessor.to_pixel_values(images)
+    question_encoding = model_service.tokenizer(
+        questions, padding='longest', truncation=True, max_length=settings.MAX_QUESTION_LENGTH, return_tensors='pt'
+    )
+    vision_embeds = model_service.encode_pixel_values(pixel_values)
+    text_embeds = model_service._encode_question_batch(question_encoding)
+    requests = [(image_path, question, None) for image_path, question in zip(image_paths, questions)]
+
+    stages = {
+        "decode": lambda: model_service.preprocessor.load_images(image_paths),
+        "processor": lambda: model_service.preprocessor.to_pixel_values(images),
+        "tokenize": lambda: model_service.tokenizer(
+            questions, padding='longest', truncation=True, max_length=settings.MAX_QUESTION_LENGTH,
+            return_tensors='pt'
+        ),
+        "vision_encoder": lambda: model_service.encode_pixel_values(pixel_values),
+        "text_encoder": lambda: model_service._encode_question_batch(question_encoding),
+        "heads": lambda: model_service.predict_from_embeddings(vision_embeds, text_embeds),
+        "predict": lambda: model_service.predict_batch(requests),
+    }
+    return {name: time_fn(fn, repeat) for name, fn in stages.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tiny", action="store_true", help="Use a tiny randomly initialized model")
+    parser.add_argument("--images", nargs="*", help="Images to use (random 640x480 JPEGs if omitted)")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--output", help="Write results as JSON to this path, e.g. to use as a baseline")
+    parser.add_argument("--baseline", help="Compare with results saved by an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    # Measure uncached inference
+    settings.VISION_CACHE_SIZE = 0
+    settings.QUESTION_CACHE_SIZE = 0
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.tiny:
+            use_tiny_model(os.path.join(tmp_dir, "model"))
+        model_service = load_model_service()
+
+        image_paths = []
+        for i, image in enumerate(load_images(args.images, max(args.batch_sizes))):
+            image_paths.append(os.path.join(tmp_dir, f"{i}.jpg"))
+            image.save(image_paths[-1])
+
+        results = {"model_id": model_service.model_id, "batch_sizes": {}}
+        for batch_size in args.batch_sizes:
+            questions = [SAMPLE_QUESTIONS[i % len(SAMPLE_QUESTIONS)] for i in range(batch_size)]
+            stages = bench_batch(model_service, image_paths[:batch_size], questions, args.repeat)
+            results["batch_sizes"][str(batch_size)] = {
+                **stages,
+                "questions_per_sec": batch_size / (stages["predict"]["p50_ms"] / 1000),
+            }
+
+            print(f"batch_size={batch_size}")
+            for name, timing in stages.items():
+                print(f"  {name:<15} p50={timing['p50_ms']:9.3f} ms  per_item={timing['p50_ms'] / batch_size:8.3f} ms")
+        results["peak_rss_bytes"] = get_peak_rss_bytes()
+        print(f"peak_rss={results['peak_rss_bytes'] / 2**20:.1f} MiB")
+
+    if not report_baseline(results, args.output, args.baseline, args.tolerance):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Measure the accuracy/latency trade-off of fast model tiers against the full model
+
+Each tier is given as SIZE:VISION_LAYERS:TEXT_LAYERS (0 keeps the full model's
+value), as set by FAST_IMAGE_SIZE, FAST_VISION_LAYERS and FAST_TEXT_LAYERS. For
+each tier this reports how often its answer and answerable verdict agree with
+the full model's, and its single-request latency and batched throughput with
+the embedding caches disabled.
+
+Usage:
+    python -m benchmarks.bench_tiers [--tiny] [--images IMG ...] [--tiers 224:0:0 0:6:0 224:6:6]
+"""
+import os
+import argparse
+import tempfile
+
+from app.config import settings
+from benchmarks.common import SAMPLE_QUESTIONS, load_images, load_model_service, report_baseline, time_fn
+from benchmarks.tiny_model import use_tiny_model
+
+def default_tiers(model_service):
+    """Reduced resolution, half depth, and both, for the loaded model"""
+    vision_config = model_service.model.vision_config
+    patch_size = vision_config.patch_size
+    image_size = 224 if vision_config.image_size > 224 else max(patch_size, vision_config.image_size // 2 // patch_size * patch_size)
+    vision_layers = max(1, vision_config.num_hidden_layers // 2)
+    text_layers = max(1, model_service.model.text_config.num_hidden_layers // 2)
+    return [f"{image_size}:0:0", f"0:{vision_layers}:0", f"{image_size}:{vision_layers}:{text_layers}"]
+
+def build_tier(model_service, spec):
+    """Build a fast tier from a SIZE:VISION_LAYERS:TEXT_LAYERS spec"""
+    settings.FAST_IMAGE_SIZE, settings.FAST_VISION_LAYERS, settings.FAST_TEXT_LAYERS = (
+        int(value) for value in spec.split(":")
+    )
+    return model_service._build_fast_tier()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tiny", action="store_true", help="Use a tiny randomly initialized model")
+    parser.add_argument("--images", nargs="*", help="Sample images (random images if omitted)")
+    parser.add_argument("--tiers", nargs="+", help="Tiers as SIZE:VISION_LAYERS:TEXT_LAYERS (0 = full)")
+    parser.add_argument("--samples", type=int, default=64, help="Number of (image, question) pairs")
+    parser.add_argument("--batch-size", type=int, default=16, help="Batch size for the throughput measurement")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--output", help="Write results as JSON to this path, e.g. to use as a baseline")
+    parser.add_argument("--baseline", help="Compare with results saved by an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    # Measure uncached inference
+    settings.VISION_CACHE_SIZE = 0
+    settings.QUESTION_CACHE_SIZE = 0
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.tiny:
+            use_tiny_model(os.path.join(tmp_dir, "model"))
+        settings.EXPORT_DIR = os.path.join(tmp_dir, "exports")
+        model_service = load_model_service()
+
+        image_paths = []
+        for i, image in enumerate(load_images(args.images, args.samples)):
+            image_paths.append(os.path.join(tmp_dir, f"{i}.jpg"))
+            image.save(image_paths[-1])
+        requests = [
+            (image_path, SAMPLE_QUESTIONS[i % len(SAMPLE_QUESTIONS)], None)
+            for i, image_path in enumerate(image_paths)
+        ]
+        batch = requests[:args.batch_size]
+
+        tiers = [("full", model_service)] + [
+            (spec, build_tier(model_service, spec)) for spec in (args.tiers or default_tiers(model_service))
+        ]
+        reference = None
+        results = {"model_id": model_service.model_id, "tiers": {}}
+        for name, tier in tiers:
+            predictions = []
+            for offset in range(0, len(requests), args.batch_size):
+                predictions.extend(tier.predict_batch(requests[offset:offset + args.batch_size]))
+            if reference is None:
+                reference = predictions
+
+            latency = time_fn(lambda: tier.predict_batch(batch[:1]), args.repeat)
+            throughput = time_fn(lambda: tier.predict_batch(batch), args.repeat)
+            result = {
+                "answer_agreement": sum(
+                    p['answer'] == r['answer'] for p, r in zip(predictions, reference)
+                ) / len(predictions),
+                "answerable_agreement": sum(
+                    p['is_answerable'] == r['is_answerable'] for p, r in zip(predictions, reference)
+                ) / len(predictions),
+                "latency_p50_ms": latency["p50_ms"],
+                "batch_p50_ms": throughput["p50_ms"],
+                "questions_per_sec": len(batch) / (throughput["p50_ms"] / 1000),
+            }
+            results["tiers"][name] = result
+
+        full = results["tiers"]["full"]
+        for name, result in results["tiers"].items():
+            print(
+                f"{name:<12} answer_agreement={result['answer_agreement']:.3f}  "
+                f"answerable_agreement={result['answerable_agreement']:.3f}  "
+                f"latency_p50={result['latency_p50_ms']:8.2f} ms  "
+                f"throughput={result['questions_per_sec']:8.1f} q/s  "
+                f"speedup={full['batch_p50_ms'] / result['batch_p50_ms']:.2f}x"
+            )
+
+    if not report_baseline(results, args.output, args.baseline, args.tolerance):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark fixed-length (max_length=128) against dynamic-length question tokenization
+
+With --tiny the model is a small randomly initialized one (see benchmarks.tiny_model),
+so the benchmark runs without a checkpoint; its answer agreement says nothing about
+the real model.
+
+Usage:
+    python -m benchmarks.bench_tokenization [--tiny] [--images IMG ...] [--batch-sizes 1 8 16] [--bucket 8]
+"""
+import os
+import argparse
+import json
+import tempfile
+
+import torch
+
+from app.config import settings
+from benchmarks.common import SAMPLE_QUESTIONS, load_images, load_model_service, time_fn
+from benchmarks.tiny_model import use_tiny_model
+
+FIXED_LENGTH = 128
+
+def encode_fixed(model_service, questions):
+    """Encode questions the original way, padding every question to 128 tokens"""
+    question_encoding = model_service.tokenizer(
+        questions,
+        padding='max_length',
+        truncation=True,
+        max_length=FIXED_LENGTH,
+        return_tensors='pt'
+    )
+    return model_service._encode_question_batch(question_encoding)
+
+def encode_dynamic(model_service, questions, bucket_width=0):
+    """Encode questions padded to the longest question, optionally bucketed by length"""
+    previous = settings.QUESTION_LENGTH_BUCKET
+    settings.QUESTION_LENGTH_BUCKET = bucket_width
+    try:
+        return model_service.encode_questions(questions, use_cache=False)
+    finally:
+        settings.QUESTION_LENGTH_BUCKET = previous
+
+def predict_from_embeddings(model_service, vision_embeds, text_embeds):
+    """Run the fusion and heads, returning answer/answerable indices and probabilities"""
+    with torch.no_grad():
+        outputs = model_service.model.classify(vision_embeds, text_embeds)
+    answer_probs = torch.softmax(outputs['answer_logits'], dim=1)
+    answerable_probs = torch.softmax(outputs['answerable_logits'], dim=1)
+    return answer_probs.argmax(dim=1), answerable_probs.argmax(dim=1), answer_probs
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tiny", action="store_true", help="Use a tiny randomly initialized model")
+    parser.add_argument("--images", nargs="*", help="Images to use (random images if omitted)")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8, 16])
+    parser.add_argument("--bucket", type=int, default=8, help="Bucket width in tokens for the bucketed variant")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.tiny:
+            use_tiny_model(os.path.join(tmp_dir, "model"))
+        model_service = load_model_service()
+        results = []
+
+        for batch_size in args.batch_sizes:
+            questions = [SAMPLE_QUESTIONS[i % len(SAMPLE_QUESTIONS)] for i in range(batch_size)]
+            images = load_images(args.images, batch_size)
+            image_encoding = model_service.processor(images=images, return_tensors="pt")
+            image_encoding = {k: v.to(model_service.device) for k, v in image_encoding.items()}
+            with torch.no_grad():
+                vision_embeds = model_service.model.encode_image(image_encoding)
+
+            variants = {
+                "fixed_128": lambda: encode_fixed(model_service, questions),
+                "dynamic": lambda: encode_dynamic(model_service, questions),
+                f"bucketed_{args.bucket}": lambda: encode_dynamic(model_service, questions, args.bucket),
+            }
+
+            reference = predict_from_embeddings(model_service, vision_embeds, variants["fixed_128"]())
+            for name, encode in variants.items():
+                timing = time_fn(
+                    lambda: predict_from_embeddings(model_service, vision_embeds, encode()), args.repeat
+                )
+                answers, answerable, answer_probs = predict_from_embeddings(model_service, vision_embeds, encode())
+                result = {
+                    "batch_size": batch_size,
+                    "variant": name,
+                    **timing,
+                    "answer_agreement": (answers == reference[0]).float().mean().item(),
+                    "answerable_agreement": (answerable == reference[1]).float().mean().item(),
+                    "max_prob_diff": (answer_probs - reference[2]).abs().max().item(),
+                }
+                results.append(result)
+                print(
+                    f"batch={batch_size:<3} {name:<12} p50={result['p50_ms']:8.2f} ms  "
+                    f"answer_agreement={result['answer_agreement']:.3f}  "
+                    f"answerable_agreement={result['answerable_agreement']:.3f}  "
+                    f"max_prob_diff={result['max_prob_diff']:.2e}"
+                )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
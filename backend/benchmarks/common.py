@@ -0,0 +1,200 @@
+"""
+Shared helpers for the benchmark scripts
+"""
+import os
+import json
+import math
+import time
+import resource
+import statistics
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from PIL import Image
+
+from app.services.model_service import ModelService
+
+# Representative VizWiz-style questions of varying length
+SAMPLE_QUESTIONS = [
+    "What is this?",
+    "What color is this?",
+    "Can you read this label?",
+    "What is in this bottle?",
+    "What does this say?",
+    "Is this a can of soup or a can of beans?",
+    "What kind of cereal is in this box, and what is the expiration date?",
+    "Which button on the microwave should I press to start it?",
+    "How many calories are in one serving of this?",
+    "Is the light on in this room?",
+    "What is the temperature on the thermostat?",
+    "Can you tell me what flavor of tea this is please?",
+    "What is the name of the book?",
+    "Is this shirt blue or green?",
+    "What denomination is this bill?",
+    "Please describe what you see in this picture in as much detail as possible.",
+]
+
+def get_rss_bytes() -> int:
+    """Current resident set size of this process in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Not on Linux, fall back to the peak RSS (reported in KiB on Linux, bytes on macOS)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def get_peak_rss_bytes() -> int:
+    """Peak resident set size of this process in bytes"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+def load_model_service() -> ModelService:
+    """Load the model service using the application settings"""
+    model_service = ModelService()
+    if not model_service.load_model():
+        raise RuntimeError("Failed to load model, check MODEL_PATH")
+    return model_service
+
+def load_images(image_paths: Optional[List[str]], count: int, size=(640, 480)) -> List[Image.Image]:
+    """
+    Load benchmark images, generating random ones if no paths are given
+
+    Args:
+        image_paths (Optional[List[str]]): Paths to images to cycle through
+        count (int): Number of images to return
+        size (Tuple[int, int]): Size of generated images
+
+    Returns:
+        List[Image.Image]: RGB images
+    """
+    if image_paths:
+        images = [Image.open(path).convert('RGB') for path in image_paths]
+    else:
+        rng = np.random.default_rng(0)
+        images = [
+            Image.fromarray(rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8))
+            for _ in range(min(count, 8))
+        ]
+    return [images[i % len(images)] for i in range(count)]
+
+def time_fn(fn: Callable, repeat: int = 10, warmup: int = 2) -> Dict[str, float]:
+    """
+    Time a function call
+
+    Args:
+        fn (Callable): Function to time, called without arguments
+        repeat (int): Number of timed calls
+        warmup (int): Number of untimed calls made first
+
+    Returns:
+        Dict[str, float]: Mean, median and minimum latency in milliseconds
+    """
+    for _ in range(warmup):
+        fn()
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "mean_ms": statistics.mean(timings),
+        "p50_ms": statistics.median(timings),
+        "min_ms": min(timings),
+    }
+
+def latency_percentiles(timings_ms: Sequence[float]) -> Dict[str, float]:
+    """
+    Summarize latencies
+
+    Args:
+        timings_ms (Sequence[float]): Latencies in milliseconds
+
+    Returns:
+        Dict[str, float]: Mean and nearest-rank p50, p95 and p99 latency in milliseconds
+    """
+    if not timings_ms:
+        return {"mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0}
+    ordered = sorted(timings_ms)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))]
+
+    return {
+        "mean_ms": statistics.mean(ordered),
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+    }
+
+def _flatten(results: Dict, prefix: str = "") -> Dict[str, float]:
+    """Flatten nested results into dotted metric names"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+def compare_to_baseline(results: Dict, baseline_path: str, tolerance: float = 0.1) -> List[str]:
+    """
+    Compare results with a baseline saved by an earlier run
+
+    Latencies (*_ms) and memory (*_bytes) are better lower, throughputs (*_per_sec)
+    better higher; other values are not compared.
+
+    Args:
+        results (Dict): Results of this run
+        baseline_path (str): Path to the baseline JSON file
+        tolerance (float): Relative change allowed before a metric counts as a regression
+
+    Returns:
+        List[str]: Descriptions of the metrics that regressed
+    """
+    with open(baseline_path) as f:
+        baseline = _flatten(json.load(f))
+
+    regressions = []
+    for name, value in _flatten(results).items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        change = (value - reference) / reference
+        if name.endswith("_per_sec"):
+            change = -change
+        elif not name.endswith(("_ms", "_bytes")):
+            continue
+        if change > tolerance:
+            regressions.append(f"{name}: {reference:.4g} -> {value:.4g} ({change:+.1%} worse)")
+    return regressions
+
+def report_baseline(results: Dict, output: Optional[str], baseline: Optional[str], tolerance: float) -> bool:
+    """
+    Save results as a baseline and/or compare them with one, printing any regressions
+
+    Args:
+        results (Dict): Results of this run
+        output (str, optional): Path to write the results to as JSON
+        baseline (str, optional): Path to a baseline to compare with
+        tolerance (float): Relative change allowed before a metric counts as a regression
+
+    Returns:
+        bool: Whether no metric regressed
+    """
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+    if not baseline:
+        return True
+
+    regressions = compare_to_baseline(results, baseline, tolerance)
+    if regressions:
+        print(f"Regressions against {baseline} (tolerance {tolerance:.0%}):")
+        for regression in regressions:
+            print(f"  {regression}")
+    else:
+        print(f"No regressions against {baseline} (tolerance {tolerance:.0%})")
+    return not regressions
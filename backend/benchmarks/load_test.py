@@ -0,0 +1,230 @@
+"""
+Load test the API with concurrent upload -> ask x N -> complete session flows
+
+Each virtual user repeatedly uploads an image, asks questions about it one after
+another and completes the session. Throughput, p50/p95/p99 latency per request
+type and the peak RSS of the server are reported.
+
+Without --url the server is started in a subprocess (with --tiny, on a small
+randomly initialized model, so no checkpoint or network is needed) and its peak
+RSS is read from /proc. With --url the peak is sampled from /metrics, which
+covers only the worker that answers each scrape.
+
+Usage:
+    python -m benchmarks.load_test [--tiny] [--url URL] [--concurrency 8] [--sessions 64] [--questions 4]
+        [--output load.json] [--baseline load.json]
+"""
+import io
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+from PIL import Image
+
+from benchmarks.common import SAMPLE_QUESTIONS, latency_percentiles, report_baseline
+from benchmarks.tiny_model import build_tiny_artifact
+
+RSS_METRIC = "vqa_process_resident_memory_bytes"
+
+def make_uploads(image_paths: Optional[List[str]], count: int) -> List[bytes]:
+    """
+    JPEG bytes to upload, one per session
+
+    Generated images are all distinct, so every session misses the result cache.
+    """
+    if image_paths:
+        files = []
+        for path in image_paths:
+            with open(path, "rb") as f:
+                files.append(f.read())
+        return [files[i % len(files)] for i in range(count)]
+
+    rng = np.random.default_rng(0)
+    uploads = []
+    for _ in range(count):
+        buffer = io.BytesIO()
+        Image.fromarray(rng.integers(0, 256, (480, 640, 3), dtype=np.uint8)).save(buffer, format="JPEG")
+        uploads.append(buffer.getvalue())
+    return uploads
+
+def free_port() -> int:
+    """Find a free local TCP port"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(port: int, env: Dict[str, str], timeout: float = 300) -> subprocess.Popen:
+    """Start the API in a subprocess and wait until it is healthy"""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port)],
+        env={**os.environ, **env},
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("Server did not become healthy in time")
+
+def process_peak_rss_bytes(pid: int) -> Optional[int]:
+    """Peak RSS of another process, from /proc (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+async def sample_rss(client: httpx.AsyncClient, peak: Dict[str, int], interval: float = 0.5):
+    """Keep the highest RSS reported by /metrics"""
+    while True:
+        try:
+            response = await client.get("/metrics")
+            for line in response.text.splitlines():
+                if line.startswith(RSS_METRIC + " "):
+                    peak["rss"] = max(peak.get("rss", 0), int(float(line.split()[1])))
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(interval)
+
+async def run_session(client: httpx.AsyncClient, upload: bytes, questions: List[str], timings, errors):
+    """Run one upload -> ask x N -> complete flow, recording the latency of each request"""
+    async def timed(kind, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            errors[f"{kind}:{type(e).__name__}"] += 1
+            return None
+        timings[kind].append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            errors[f"{kind}:{response.status_code}"] += 1
+            return None
+        return response
+
+    start = time.perf_counter()
+    response = await timed("upload", "POST", "/api/vqa/upload", files={"file": ("image.jpg", upload, "image/jpeg")})
+    if response is None:
+        return
+    session_id = response.json()["session_id"]
+    for question in questions:
+        await timed("ask", "POST", "/api/vqa/ask", json={"session_id": session_id, "question": question})
+    await timed("complete", "POST", f"/api/vqa/session/{session_id}/complete")
+    timings["session"].append((time.perf_counter() - start) * 1000)
+
+async def run_load(url: str, uploads: List[bytes], num_questions: int, concurrency: int, sample_metrics: bool):
+    """Drive the session flows from concurrent virtual users"""
+    timings = defaultdict(list)
+    errors = defaultdict(int)
+    peak = {}
+    pending = iter(enumerate(uploads))
+
+    async def user(client):
+        for index, upload in pending:
+            questions = [SAMPLE_QUESTIONS[(index + i) % len(SAMPLE_QUESTIONS)] for i in range(num_questions)]
+            await run_session(client, upload, questions, timings, errors)
+
+    limits = httpx.Limits(max_connections=concurrency + 1)
+    async with httpx.AsyncClient(base_url=url, timeout=120, limits=limits) as client:
+        sampler = asyncio.create_task(sample_rss(client, peak)) if sample_metrics else None
+        start = time.perf_counter()
+        await asyncio.gather(*(user(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        if sampler is not None:
+            sampler.cancel()
+    return timings, errors, elapsed, peak.get("rss")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Load test a running server instead of starting one")
+    parser.add_argument("--tiny", action="store_true", help="Start the server on a tiny randomly initialized model")
+    parser.add_argument("--images", nargs="*", help="Images to upload (distinct random JPEGs if omitted)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent virtual users")
+    parser.add_argument("--sessions", type=int, default=64, help="Total sessions to run")
+    parser.add_argument("--questions", type=int, default=4, help="Questions asked per session")
+    parser.add_argument("--output", help="Write results as JSON to this path, e.g. to use as a baseline")
+    parser.add_argument("--baseline", help="Compare with results saved by an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    uploads = make_uploads(args.images, args.sessions)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        server = None
+        url = args.url
+        if url is None:
+            env = {"UPLOAD_DIR": os.path.join(tmp_dir, "uploads")}
+            if args.tiny:
+                env["MODEL_ARTIFACT_DIR"] = build_tiny_artifact(os.path.join(tmp_dir, "model"))
+            port = free_port()
+            server = start_server(port, env)
+            url = f"http://127.0.0.1:{port}"
+
+        try:
+            timings, errors, elapsed, sampled_rss = asyncio.run(
+                run_load(url, uploads, args.questions, args.concurrency, sample_metrics=server is None)
+            )
+            peak_rss = process_peak_rss_bytes(server.pid) if server is not None else sampled_rss
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    completed = len(timings["session"])
+    results = {
+        "config": {
+            "concurrency": args.concurrency,
+            "sessions": args.sessions,
+            "questions": args.questions,
+            "tiny": args.tiny,
+        },
+        "elapsed_s": elapsed,
+        "completed_sessions": completed,
+        "errors": dict(errors),
+        "sessions_per_sec": completed / elapsed,
+        "questions_per_sec": len(timings["ask"]) / elapsed,
+        "requests_per_sec": sum(len(timings[kind]) for kind in ("upload", "ask", "complete")) / elapsed,
+        "latency": {kind: latency_percentiles(timings[kind]) for kind in ("upload", "ask", "complete", "session")},
+    }
+    if peak_rss is not None:
+        results["peak_rss_bytes"] = peak_rss
+
+    print(
+        f"{completed}/{args.sessions} sessions in {elapsed:.1f} s at concurrency {args.concurrency}: "
+        f"{results['sessions_per_sec']:.2f} sessions/s, {results['questions_per_sec']:.1f} questions/s"
+    )
+    for kind, latency in results["latency"].items():
+        print(
+            f"  {kind:<9} p50={latency['p50_ms']:9.1f} ms  p95={latency['p95_ms']:9.1f} ms  "
+            f"p99={latency['p99_ms']:9.1f} ms"
+        )
+    if errors:
+        print(f"  errors: {dict(errors)}")
+    if peak_rss is not None:
+        print(f"  peak_rss={peak_rss / 2**20:.1f} MiB")
+
+    if not report_baseline(results, args.output, args.baseline, args.tolerance):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Build a tiny randomly initialized model artifact for benchmarking without a network
+
+The artifact has the same layout as the one written by app.convert (safetensors
+weights, configs, answer vocabulary, tokenizer and image processor files), so
+the server loads it through the normal artifact path. The encoders are small
+ViT and BERT models, and the tokenizer has a word-level vocabulary built from
+the sample questions, so answers are meaningless but every stage of inference
+runs with realistic shapes.
+
+Usage:
+    python -m benchmarks.tiny_model OUTPUT_DIR [--hidden-size 64] [--layers 2]
+    MODEL_ARTIFACT_DIR=OUTPUT_DIR uvicorn app.main:app
+"""
+import os
+import json
+import argparse
+
+import torch
+from safetensors.torch import save_file
+from transformers import BertConfig, BertTokenizerFast, ViTConfig, ViTImageProcessor
+
+from app.config import settings
+from app.models.vqa_model import VQAModel
+from app.services.model_service import ARTIFACT_CONFIG, ARTIFACT_VOCAB, ARTIFACT_WEIGHTS
+from benchmarks.common import SAMPLE_QUESTIONS
+
+SPECIAL_TOKENS = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+
+def build_tiny_artifact(
+    output_dir: str,
+    hidden_size: int = 64,
+    num_layers: int = 2,
+    image_size: int = 224,
+    patch_size: int = 32,
+    num_answers: int = 1000,
+    seed: int = 0
+) -> str:
+    """
+    Write a tiny randomly initialized model artifact
+
+    Args:
+        output_dir (str): Directory to write the artifact to
+        hidden_size (int): Hidden size of both encoders and the fusion layers
+        num_layers (int): Transformer layers per encoder
+        image_size (int): Input image size
+        patch_size (int): ViT patch size
+        num_answers (int): Size of the answer vocabulary
+        seed (int): Seed for the random weights
+
+    Returns:
+        str: The artifact directory
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    torch.manual_seed(seed)
+
+    # Word-level vocabulary covering the sample questions, plus characters for anything else
+    words = sorted({
+        word for question in SAMPLE_QUESTIONS
+        for word in question.lower().replace("?", " ? ").replace(",", " , ").replace(".", " . ").split()
+    })
+    vocab = SPECIAL_TOKENS + list("abcdefghijklmnopqrstuvwxyz0123456789?.,!'") + words
+    vocab_path = os.path.join(output_dir, "vocab.txt")
+    with open(vocab_path, "w") as f:
+        f.write("\n".join(dict.fromkeys(vocab)))
+    tokenizer = BertTokenizerFast(vocab_file=vocab_path)
+    tokenizer.save_pretrained(output_dir)
+    ViTImageProcessor(size={"height": image_size, "width": image_size}).save_pretrained(output_dir)
+
+    encoder_kwargs = {
+        "hidden_size": hidden_size,
+        "num_hidden_layers": num_layers,
+        "num_attention_heads": max(1, hidden_size // 32),
+        "intermediate_size": 4 * hidden_size,
+    }
+    vision_config = ViTConfig(image_size=image_size, patch_size=patch_size, **encoder_kwargs)
+    text_config = BertConfig(
+        vocab_size=len(tokenizer), max_position_embeddings=settings.MAX_QUESTION_LENGTH, **encoder_kwargs
+    )
+    config = {
+        "vision_model": "tiny-vit",
+        "text_model": "tiny-bert",
+        "hidden_size": hidden_size,
+        "dropout": 0.1,
+    }
+    answers = ["unanswerable", "unsuitable", "yes", "no"] + [f"answer {i}" for i in range(4, num_answers)]
+
+    model = VQAModel.from_config(config, len(answers), vision_config, text_config)
+    state_dict = {k: v.detach().clone().contiguous() for k, v in model.state_dict().items()}
+    save_file(state_dict, os.path.join(output_dir, ARTIFACT_WEIGHTS))
+    with open(os.path.join(output_dir, ARTIFACT_CONFIG), "w") as f:
+        json.dump({
+            "config": config,
+            "vision_config": vision_config.to_dict(),
+            "text_config": text_config.to_dict(),
+        }, f, indent=2)
+    with open(os.path.join(output_dir, ARTIFACT_VOCAB), "w") as f:
+        json.dump({
+            "answer_to_idx": {answer: i for i, answer in enumerate(answers)},
+            "idx_to_answer": {str(i): answer for i, answer in enumerate(answers)},
+        }, f)
+    return output_dir
+
+def use_tiny_model(output_dir: str, **kwargs) -> str:
+    """
+    Build a tiny model artifact and point the settings at it
+
+    Args:
+        output_dir (str): Directory to write the artifact to
+        **kwargs: Passed to build_tiny_artifact
+
+    Returns:
+        str: The artifact directory
+    """
+    settings.MODEL_ARTIFACT_DIR = build_tiny_artifact(output_dir, **kwargs)
+    return settings.MODEL_ARTIFACT_DIR
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output", help="Directory to write the artifact to")
+    parser.add_argument("--hidden-size", type=int, default=64)
+    parser.add_argument("--layers", type=int, default=2)
+    parser.add_argument("--image-size", type=int, default=224)
+    parser.add_argument("--answers", type=int, default=1000)
+    args = parser.parse_args()
+    build_tiny_artifact(
+        args.output,
+        hidden_size=args.hidden_size,
+        num_layers=args.layers,
+        image_size=args.image_size,
+        num_answers=args.answers
+    )
+    print(f"Wrote tiny model artifact to {args.output}")
+
+if __name__ == "__main__":
+    main()
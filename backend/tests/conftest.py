@@ -0,0 +1,45 @@
+"""
+Shared fixtures for the backend tests
+"""
+import io
+import os
+import tempfile
+
+import pytest
+from PIL import Image
+
+# Keep the directories the app creates at import out of the working tree
+os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="vqa-test-uploads-"))
+
+@pytest.fixture
+def make_png():
+    """Encode a solid color image as PNG"""
+    def make(color=(255, 0, 0), size=(8, 8)) -> bytes:
+        buffer = io.BytesIO()
+        Image.new("RGB", size, color).save(buffer, format="PNG")
+        return buffer.getvalue()
+    return make
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    """Point UPLOAD_DIR at a fresh directory"""
+    from app.config import settings
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    return tmp_path / "uploads"
+
+@pytest.fixture(scope="session")
+def tiny_model_service(tmp_path_factory):
+    """Model service running a tiny randomly initialized model on the eager backend"""
+    from app.config import settings
+    from app.services.model_service import ModelService
+    from benchmarks.tiny_model import build_tiny_artifact
+
+    saved = (settings.MODEL_ARTIFACT_DIR, settings.INFERENCE_BACKEND)
+    settings.MODEL_ARTIFACT_DIR = build_tiny_artifact(str(tmp_path_factory.mktemp("model")), num_answers=8)
+    settings.INFERENCE_BACKEND = "eager"
+    try:
+        model_service = ModelService()
+        assert model_service.load_model()
+    finally:
+        settings.MODEL_ARTIFACT_DIR, settings.INFERENCE_BACKEND = saved
+    return model_service
@@ -0,0 +1,63 @@
+import json
+import sys
+
+import pytest
+
+from app import batch
+
+@pytest.fixture
+def dataset(tmp_path, make_png):
+    """Two images and a JSONL manifest with three questions about them"""
+    (tmp_path / "red.png").write_bytes(make_png((255, 0, 0)))
+    (tmp_path / "blue.png").write_bytes(make_png((0, 0, 255)))
+    manifest = tmp_path / "manifest.jsonl"
+    manifest.write_text(
+        json.dumps({"id": "a", "image": "red.png", "question": "What color is it?"}) + "\n"
+        + json.dumps({"id": "b", "image": "blue.png", "question": "What color is it?"}) + "\n"
+        + json.dumps({"image": "red.png", "question": "Is it a square?"}) + "\n"
+    )
+    return tmp_path, manifest
+
+def run_cli(monkeypatch, model_service, manifest, output, image_dir):
+    monkeypatch.setattr(batch, "ModelService", lambda: model_service)
+    monkeypatch.setattr(model_service, "load_model", lambda: True)
+    monkeypatch.setattr(sys, "argv", [
+        "app.batch", str(manifest), "--output", str(output), "--image-dir", str(image_dir), "--workers", "0"
+    ])
+    batch.main()
+
+def read_output(output):
+    return [json.loads(line) for line in output.read_text().splitlines()]
+
+def test_rows_without_an_id_use_their_position(dataset):
+    _, manifest = dataset
+    assert [row["id"] for row in batch.read_manifest(str(manifest))] == ["a", "b", "2"]
+
+def test_read_completed_drops_a_truncated_last_line(tmp_path):
+    output = tmp_path / "results.jsonl"
+    complete = json.dumps({"id": "a", "answer": "red"}) + "\n"
+    output.write_text(complete + '{"id": "b", "ans')
+
+    assert batch.read_completed(str(output)) == {"a"}
+    assert output.read_text() == complete
+
+def test_scores_every_row_once(monkeypatch, tiny_model_service, dataset):
+    image_dir, manifest = dataset
+    output = image_dir / "results.jsonl"
+    run_cli(monkeypatch, tiny_model_service, manifest, output, image_dir)
+
+    rows = read_output(output)
+    assert sorted(row["id"] for row in rows) == ["2", "a", "b"]
+    assert all("answer" in row for row in rows)
+
+def test_resume_skips_rows_already_scored(monkeypatch, tiny_model_service, dataset):
+    image_dir, manifest = dataset
+    output = image_dir / "results.jsonl"
+    scored = json.dumps({"id": "a", "image": "red.png", "question": "What color is it?", "answer": "kept"}) + "\n"
+    output.write_text(scored + '{"id": "b", "ima')
+    run_cli(monkeypatch, tiny_model_service, manifest, output, image_dir)
+
+    rows = read_output(output)
+    assert [row["id"] for row in rows].count("a") == 1
+    assert rows[0]["answer"] == "kept"
+    assert sorted(row["id"] for row in rows[1:]) == ["2", "b"]
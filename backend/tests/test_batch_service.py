@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services.batch_service import BatchScheduler, QueueFullError
+
+class FakeModelService:
+    """Answers with the question, and fails whole batches containing a request without an image"""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def predict_batch(self, requests, top_ks):
+        self.batch_sizes.append(len(requests))
+        if any(image_path is None for image_path, _, _ in requests):
+            raise ValueError("No image")
+        return [{"answer": question} for _, question, _ in requests]
+
+def test_failing_request_only_fails_itself():
+    model_service = FakeModelService()
+
+    async def main():
+        scheduler = BatchScheduler(model_service, max_batch_size=8, max_wait_ms=50, max_workers=1, max_queue_size=16)
+        await scheduler.start()
+        try:
+            return await asyncio.gather(
+                scheduler.submit("a.png", "first"),
+                scheduler.submit(None, "second"),
+                scheduler.submit("c.png", "third"),
+                return_exceptions=True
+            )
+        finally:
+            await scheduler.stop()
+
+    first, second, third = asyncio.run(main())
+    assert first == {"answer": "first"}
+    assert isinstance(second, ValueError)
+    assert third == {"answer": "third"}
+    assert model_service.batch_sizes == [3, 1, 1, 1]
+
+def test_staged_calls_are_bounded_by_queue_size():
+    async def main():
+        scheduler = BatchScheduler(FakeModelService(), max_workers=1, max_queue_size=1)
+        await scheduler.start()
+        try:
+            return await asyncio.gather(
+                scheduler.run(time.sleep, 0.05),
+                scheduler.run(time.sleep, 0.05),
+                return_exceptions=True
+            ), scheduler.total_rejected
+        finally:
+            await scheduler.stop()
+
+    results, rejected = asyncio.run(main())
+    assert results[0] is None
+    assert isinstance(results[1], QueueFullError)
+    assert rejected == 1
+
+def test_submit_many_rejects_what_does_not_fit():
+    async def main():
+        scheduler = BatchScheduler(FakeModelService(), max_queue_size=2)
+        await scheduler.start()
+        try:
+            with pytest.raises(QueueFullError):
+                await scheduler.submit_many("a.png", ["one", "two", "three"])
+            return await scheduler.submit_many("a.png", ["one", "two"])
+        finally:
+            await scheduler.stop()
+
+    assert asyncio.run(main()) == [{"answer": "one"}, {"answer": "two"}]
@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+from app.services import blob_store
+from app.services.blob_store import BlobStore
+
+HASH = "ab" + "0" * 62
+
+@pytest.fixture
+def blobs(tmp_path):
+    return BlobStore(str(tmp_path))
+
+def write_temp(blobs, name, data=b"image bytes"):
+    path = blobs.temp_path(name)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+def test_store_and_acquire_share_one_blob(blobs):
+    first = blobs.store(write_temp(blobs, "a.png"), HASH, ".png", "session-a")
+    second = blobs.acquire(HASH, ".png", "session-b")
+
+    assert os.path.samefile(first, second)
+    assert os.path.samefile(first, blobs.blob_path(HASH, ".png"))
+    assert os.stat(first).st_nlink == 3
+    assert blobs.usage_bytes() == len(b"image bytes")
+
+def test_acquire_unknown_blob(blobs):
+    assert blobs.acquire(HASH, ".png", "session-a") is None
+
+def test_release_deletes_blob_with_last_reference(blobs):
+    first = blobs.store(write_temp(blobs, "a.png"), HASH, ".png", "session-a")
+    second = blobs.acquire(HASH, ".png", "session-b")
+
+    assert blobs.release(first, HASH) == 0
+    assert os.path.exists(blobs.blob_path(HASH, ".png"))
+
+    assert blobs.release(second, HASH) == len(b"image bytes")
+    assert not os.path.exists(blobs.blob_path(HASH, ".png"))
+    assert blobs.usage_bytes() == 0
+
+def test_usage_is_counted_without_walking_the_store(blobs, monkeypatch):
+    assert blobs.usage_bytes() == 0
+    monkeypatch.setattr(blob_store, "directory_bytes", None)
+    other_hash = "cd" + "0" * 62
+
+    first = blobs.store(write_temp(blobs, "a.png", b"12345"), HASH, ".png", "session-a")
+    blobs.acquire(HASH, ".png", "session-b")
+    second = blobs.store(write_temp(blobs, "b.png", b"123"), other_hash, ".png", "session-c")
+    assert blobs.usage_bytes() == 8
+
+    blobs.release(first, HASH)
+    assert blobs.usage_bytes() == 8
+    blobs.release(second, other_hash)
+    assert blobs.usage_bytes() == 5
+
+def test_release_removes_empty_prefix_directory(blobs):
+    session_path = blobs.store(write_temp(blobs, "a.png"), HASH, ".png", "session-a")
+    prefix_dir = os.path.dirname(blobs.blob_path(HASH, ".png"))
+
+    blobs.release(session_path, HASH)
+
+    assert not os.path.exists(prefix_dir)
+    assert blobs.store(write_temp(blobs, "b.png"), HASH, ".png", "session-b")
+    assert os.path.exists(blobs.blob_path(HASH, ".png"))
+
+def test_release_missing_file(blobs, tmp_path):
+    assert blobs.release(str(tmp_path / "missing.png"), HASH) == 0
+
+def test_reconcile_removes_unreferenced_files(blobs, tmp_path, monkeypatch):
+    monkeypatch.setattr(blob_store, "RECONCILE_MIN_AGE", -1)
+    other_hash = "cd" + "0" * 62
+    kept = blobs.store(write_temp(blobs, "a.png"), HASH, ".png", "session-a")
+    orphan = blobs.store(write_temp(blobs, "b.png"), other_hash, ".png", "session-b")
+    partial = write_temp(blobs, "c.png")
+    legacy = tmp_path / "1700000000_12345678-1234-1234-1234-123456789abc.jpg"
+    legacy.write_bytes(b"old upload")
+    unrelated = tmp_path / "notes.txt"
+    unrelated.write_text("not an upload")
+
+    assert blobs.reconcile([kept]) == 4
+    assert blobs.usage_bytes() == len(b"image bytes")
+    assert os.listdir(blobs.blob_dir) == [HASH[:2]]
+
+    assert os.path.exists(kept)
+    assert os.path.exists(blobs.blob_path(HASH, ".png"))
+    for path in (orphan, partial, legacy, blobs.blob_path(other_hash, ".png")):
+        assert not os.path.exists(path)
+    assert unrelated.exists()
+
+def test_reconcile_keeps_recent_files(blobs):
+    orphan = blobs.store(write_temp(blobs, "a.png"), HASH, ".png", "session-a")
+
+    assert blobs.reconcile([]) == 0
+    assert os.path.exists(orphan)
+    assert os.path.exists(blobs.blob_path(HASH, ".png"))
@@ -0,0 +1,75 @@
+from fastapi.testclient import TestClient
+
+from app.utils.metrics import CONTENT_TYPE, Counter, Gauge, Histogram, Registry
+
+def test_counter_renders_help_type_and_labelled_samples():
+    registry = Registry()
+    counter = Counter("requests_total", "Requests", ("route",), registry=registry)
+    counter.inc(labels=("/a",))
+    counter.inc(2, labels=("/a",))
+    counter.inc(labels=('say "hi"\n',))
+
+    assert registry.render() == (
+        "# HELP requests_total Requests\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{route="/a"} 3\n'
+        'requests_total{route="say \\"hi\\"\\n"} 1\n'
+    )
+
+def test_unlabelled_metric_renders_zero_before_use():
+    registry = Registry()
+    Gauge("in_flight", "In flight", registry=registry)
+
+    assert registry.render().splitlines()[-1] == "in_flight 0"
+
+def test_gauge_set_inc_dec():
+    registry = Registry()
+    gauge = Gauge("depth", "Queue depth", registry=registry)
+    gauge.set(5)
+    gauge.inc()
+    gauge.dec(2.5)
+
+    assert "depth 3.5" in registry.render().splitlines()
+
+def test_callback_metric_reads_values_when_rendered():
+    registry = Registry()
+    values = {"hits": None}
+    Counter("hits_total", "Hits", fn=lambda: values["hits"], registry=registry)
+    Gauge("size", "Size", ("cache",), fn=lambda: {("vision",): 2, ("question",): 7}, registry=registry)
+
+    lines = registry.render().splitlines()
+    assert not any(line.startswith("hits_total ") for line in lines)
+    assert 'size{cache="vision"} 2' in lines
+    assert 'size{cache="question"} 7' in lines
+
+    values["hits"] = 4
+    assert "hits_total 4" in registry.render().splitlines()
+
+def test_failing_callback_is_skipped():
+    registry = Registry()
+    Gauge("broken", "Broken", fn=lambda: 1 / 0, registry=registry)
+    Gauge("working", "Working", fn=lambda: 1, registry=registry)
+
+    assert registry.render() == "# HELP working Working\n# TYPE working gauge\nworking 1\n"
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = Histogram("latency_seconds", "Latency", ("stage",), buckets=(0.1, 1.0), registry=registry)
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value, ("vision",))
+
+    assert registry.render().splitlines()[2:] == [
+        'latency_seconds_bucket{stage="vision",le="0.1"} 2',
+        'latency_seconds_bucket{stage="vision",le="1"} 3',
+        'latency_seconds_bucket{stage="vision",le="+Inf"} 4',
+        'latency_seconds_sum{stage="vision"} 2.65',
+        'latency_seconds_count{stage="vision"} 4'
+    ]
+
+def test_metrics_endpoint_serves_the_text_format():
+    from app.main import app
+
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith(CONTENT_TYPE)
+    assert "# TYPE vqa_http_requests_total counter" in response.text
@@ -0,0 +1,92 @@
+import pydantic
+import pytest
+import torch
+
+from app.config import settings
+from app.routers.vqa import QuestionRequest
+
+@pytest.fixture
+def embeddings(tiny_model_service):
+    torch.manual_seed(0)
+    hidden_size = tiny_model_service.config["hidden_size"]
+    return torch.randn(3, hidden_size), torch.randn(3, hidden_size)
+
+def answer_probs(model_service, vision_embeds, text_embeds):
+    with torch.no_grad():
+        logits = model_service.backend.classify(vision_embeds, text_embeds)["answer_logits"]
+    return torch.softmax(logits.float(), dim=1)
+
+def test_top_answers_are_ordered_per_row(tiny_model_service, embeddings):
+    results = tiny_model_service.predict_from_embeddings(*embeddings, top_k=[1, 3, 5])
+    probs = answer_probs(tiny_model_service, *embeddings)
+
+    assert "top_answers" not in results[0]
+    for row, (result, k) in enumerate(zip(results, [1, 3, 5])):
+        expected_probs, expected_indices = torch.topk(probs[row], k)
+        answers = result.get("top_answers") or [
+            {"answer": result["answer"], "confidence": result["answer_confidence"]}
+        ]
+        assert [answer["answer"] for answer in answers] == [
+            tiny_model_service.answer_list[i] for i in expected_indices.tolist()
+        ]
+        assert [answer["confidence"] for answer in answers] == pytest.approx(expected_probs.tolist(), abs=1e-6)
+        assert answers[0]["answer"] == result["answer"]
+
+def test_top_k_is_clamped_to_the_answers(tiny_model_service, embeddings):
+    num_answers = len(tiny_model_service.answer_list)
+    results = tiny_model_service.predict_from_embeddings(*embeddings, top_k=num_answers + 5)
+
+    assert all(len(result["top_answers"]) == num_answers for result in results)
+
+def test_top_k_is_limited_to_max_top_k():
+    QuestionRequest(session_id="a", question="what?", top_k=settings.MAX_TOP_K)
+    with pytest.raises(pydantic.ValidationError):
+        QuestionRequest(session_id="a", question="what?", top_k=settings.MAX_TOP_K + 1)
+
+@pytest.fixture
+def confidently_unanswerable(tiny_model_service):
+    """Make the answerable head predict unanswerable with near certainty"""
+    bias = tiny_model_service.model.answerable_classifier[-1].bias
+    saved = bias.detach().clone()
+    with torch.no_grad():
+        bias.copy_(torch.tensor([20.0, -20.0]))
+    yield
+    with torch.no_grad():
+        bias.copy_(saved)
+
+def test_zero_threshold_never_exits(tiny_model_service, embeddings, confidently_unanswerable, monkeypatch):
+    monkeypatch.setattr(tiny_model_service, "early_exit_threshold", 0.0)
+    probs = answer_probs(tiny_model_service, *embeddings)
+    exits = tiny_model_service.early_exits
+
+    results = tiny_model_service.predict_from_embeddings(*embeddings)
+
+    assert [result["answer"] for result in results] == [
+        tiny_model_service.answer_list[i] for i in probs.argmax(dim=1).tolist()
+    ]
+    assert tiny_model_service.early_exits == exits
+
+def test_threshold_below_confidence_always_exits(tiny_model_service, embeddings, confidently_unanswerable, monkeypatch):
+    monkeypatch.setattr(tiny_model_service, "early_exit_threshold", 0.9)
+    monkeypatch.setattr(settings, "EARLY_EXIT_ANSWER", "early exit")
+    rows, exits = tiny_model_service.early_exit_rows, tiny_model_service.early_exits
+
+    results = tiny_model_service.predict_from_embeddings(*embeddings, top_k=3)
+
+    for result in results:
+        assert result["answer"] == "early exit"
+        assert not result["is_answerable"]
+        assert result["answer_confidence"] == result["answerable_confidence"] > 0.9
+        assert result["top_answers"] == [{"answer": "early exit", "confidence": result["answer_confidence"]}]
+    assert tiny_model_service.early_exit_rows - rows == len(results)
+    assert tiny_model_service.early_exits - exits == len(results)
+
+def test_threshold_above_confidence_answers(tiny_model_service, embeddings, monkeypatch):
+    monkeypatch.setattr(tiny_model_service, "early_exit_threshold", 1.0)
+    probs = answer_probs(tiny_model_service, *embeddings)
+
+    results = tiny_model_service.predict_from_embeddings(*embeddings)
+
+    assert [result["answer"] for result in results] == [
+        tiny_model_service.answer_list[i] for i in probs.argmax(dim=1).tolist()
+    ]
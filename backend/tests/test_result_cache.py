@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from app.services import result_cache as result_cache_module
+from app.services.result_cache import ResultCache, SQLiteResultCache
+from app.utils import cache as cache_module
+from app.utils.cache import LRUCache
+
+class FakeClock:
+    """Stands in for the time module, advanced by hand"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    monkeypatch.setattr(result_cache_module, "time", clock)
+    return clock
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_cache(request, tmp_path):
+    def make(maxsize=10, ttl=None, namespace="model"):
+        if request.param == "sqlite":
+            return SQLiteResultCache(str(tmp_path / "results.sqlite3"), maxsize, ttl, namespace)
+        return ResultCache(maxsize, ttl, namespace)
+    return make
+
+def test_lru_cache_expires_entries(clock):
+    cache = LRUCache(10, ttl=60)
+    cache.put("a", 1)
+
+    clock.now += 59
+    assert cache.get("a") == 1
+    clock.now += 1
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+def test_results_are_keyed_by_image_question_top_k_and_tier(make_cache):
+    cache = make_cache()
+    cache.put("image", "what is this?", {"answer": "cat"})
+
+    assert cache.get("image", "what is this?") == {"answer": "cat"}
+    assert cache.get("other image", "what is this?") is None
+    assert cache.get("image", "what is that?") is None
+    assert cache.get("image", "what is this?", top_k=3) is None
+    assert cache.get("image", "what is this?", tier="fast") is None
+
+def test_results_of_another_model_are_not_returned(make_cache):
+    make_cache(namespace="model").put("image", "what is this?", {"answer": "cat"})
+
+    assert make_cache(namespace="other model").get("image", "what is this?") is None
+
+def test_results_expire(make_cache, clock):
+    cache = make_cache(ttl=60)
+    cache.put("image", "what is this?", {"answer": "cat"})
+
+    clock.now += 61
+    assert cache.get("image", "what is this?") is None
+
+def test_results_are_evicted_beyond_maxsize(make_cache, clock):
+    cache = make_cache(maxsize=2)
+    for question in ("a", "b", "c"):
+        clock.now += 1
+        cache.put("image", question, {"answer": question})
+
+    assert cache.get("image", "a") is None
+    assert cache.get("image", "c") == {"answer": "c"}
+    assert cache.stats()["size"] == 2
+
+def test_async_access(make_cache):
+    cache = make_cache()
+
+    async def main():
+        await cache.aput("image", "what is this?", {"answer": "cat"})
+        return await cache.aget("image", "what is this?")
+
+    assert asyncio.run(main()) == {"answer": "cat"}
+
+def test_sqlite_results_survive_restarts(tmp_path):
+    path = str(tmp_path / "results.sqlite3")
+    SQLiteResultCache(path, 10, None, "model").put("image", "what is this?", {"answer": "cat"})
+
+    assert SQLiteResultCache(path, 10, None, "model").get("image", "what is this?") == {"answer": "cat"}
+
+def test_sqlite_errors_are_misses(tmp_path):
+    cache = SQLiteResultCache(str(tmp_path / "results.sqlite3"), 10, None, "model")
+    cache.put("image", "what is this?", {"answer": "cat"})
+    cache._conn.execute("DROP TABLE results")
+
+    assert cache.get("image", "what is this?") is None
+    cache.put("image", "what is this?", {"answer": "cat"})
+    stats = cache.stats()
+    assert stats["size"] is None
+    assert stats["misses"] == 1
@@ -0,0 +1,48 @@
+import io
+import asyncio
+
+import pytest
+from fastapi import UploadFile
+
+from app.config import settings
+from app.services.session_service import InvalidImageError, SessionService, UploadTooLargeError
+from app.services.session_store import MemorySessionStore
+
+def upload(service, data, filename="image.png"):
+    return asyncio.run(service.create_session(UploadFile(io.BytesIO(data), filename=filename)))
+
+def test_identical_uploads_share_one_image(upload_dir, make_png):
+    service = SessionService(MemorySessionStore())
+    first = upload(service, make_png())
+    second = upload(service, make_png())
+
+    assert service.get_session(first).image_hash == service.get_session(second).image_hash
+    assert service.blobs.usage_bytes() == len(make_png())
+
+def test_rejects_non_images(upload_dir):
+    service = SessionService(MemorySessionStore())
+
+    with pytest.raises(InvalidImageError):
+        upload(service, b"not an image at all", "image.png")
+    assert len(service.store) == 0
+
+def test_quota_evicts_least_recently_used(upload_dir, monkeypatch, make_png):
+    monkeypatch.setattr(settings, "UPLOAD_QUOTA_BYTES", len(make_png()) + 10)
+    service = SessionService(MemorySessionStore())
+    first = upload(service, make_png((255, 0, 0)))
+    second = upload(service, make_png((0, 255, 0)))
+
+    assert service.get_session(first) is None
+    assert service.get_session(second) is not None
+    assert service.blobs.usage_bytes() <= settings.UPLOAD_QUOTA_BYTES
+
+def test_image_larger_than_quota_keeps_existing_sessions(upload_dir, monkeypatch, make_png):
+    monkeypatch.setattr(settings, "UPLOAD_QUOTA_BYTES", len(make_png()) + 10)
+    service = SessionService(MemorySessionStore())
+    existing = upload(service, make_png())
+
+    with pytest.raises(UploadTooLargeError):
+        upload(service, make_png(size=(256, 256)))
+    assert service.get_session(existing) is not None
+    assert len(service.store) == 1
+    assert service.blobs.usage_bytes() == len(make_png())
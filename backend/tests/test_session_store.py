@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services.session_store import MemorySessionStore, Session, SessionStore, SQLiteSessionStore
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"))
+    return MemorySessionStore()
+
+def test_incomplete_store_cannot_be_created():
+    class IncompleteStore(SessionStore):
+        def add(self, session):
+            pass
+
+    with pytest.raises(TypeError):
+        IncompleteStore()
+
+def test_add_and_get(store):
+    store.add(Session("a", "/uploads/a.png", "hash-a"))
+
+    session = store.get("a")
+    assert (session.session_id, session.image_path, session.image_hash) == ("a", "/uploads/a.png", "hash-a")
+    assert store.get("missing") is None
+    assert len(store) == 1
+
+def test_add_question(store):
+    store.add(Session("a", "/uploads/a.png"))
+    store.add_question("a", "what is this?", {"answer": "cat"})
+
+    questions = store.get_questions("a")
+    assert [(entry["question"], entry["answer"]) for entry in questions] == [("what is this?", {"answer": "cat"})]
+    assert store.get_questions("missing") == []
+
+def test_remove_returns_session_once(store):
+    store.add(Session("a", "/uploads/a.png"))
+
+    assert store.remove("a").session_id == "a"
+    assert store.remove("a") is None
+    assert len(store) == 0
+    assert store.get_questions("a") == []
+
+def test_pop_expired(store):
+    old = Session("old", "/uploads/old.png")
+    old.last_accessed = datetime.now() - timedelta(hours=1)
+    store.add(old)
+    store.add(Session("new", "/uploads/new.png"))
+
+    assert [session.session_id for session in store.pop_expired(60)] == ["old"]
+    assert store.get("old") is None
+    assert store.get("new") is not None
+
+def test_pop_least_recent(store):
+    for session_id in ("a", "b", "c"):
+        store.add(Session(session_id, f"/uploads/{session_id}.png"))
+    store.touch("a")
+
+    assert [session.session_id for session in store.pop_least_recent(2)] == ["b", "c"]
+    assert [session.session_id for session in store.pop_least_recent(2)] == ["a"]
+    assert store.pop_least_recent() == []
+
+def test_image_paths(store):
+    store.add(Session("a", "/uploads/a.png"))
+    completed = Session("b", "/uploads/b.png")
+    store.add(completed)
+    completed.image_path = None
+    store.update(completed)
+
+    assert store.image_paths() == ["/uploads/a.png"]
+
+def test_sqlite_store_is_shared(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    SQLiteSessionStore(path).add(Session("a", "/uploads/a.png"))
+
+    assert SQLiteSessionStore(path).get("a") is not None
+    assert SQLiteSessionStore.shared and not MemorySessionStore.shared
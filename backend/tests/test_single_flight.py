@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from app.utils.single_flight import SingleFlight
+
+def test_concurrent_calls_share_one_result():
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def main():
+        flight = SingleFlight()
+        results = await asyncio.gather(*(flight.run("key", fn) for _ in range(4)))
+        return flight, results
+
+    flight, results = asyncio.run(main())
+    assert results == ["answer"] * 4
+    assert len(calls) == 1
+    assert flight.stats() == {"calls": 1, "coalesced": 3, "coalesced_rate": 0.75, "in_flight": 0}
+
+def test_different_keys_run_separately():
+    async def main():
+        flight = SingleFlight()
+        return await asyncio.gather(
+            flight.run("a", lambda: asyncio.sleep(0, "a")),
+            flight.run("b", lambda: asyncio.sleep(0, "b"))
+        )
+
+    assert asyncio.run(main()) == ["a", "b"]
+
+def test_exception_reaches_every_caller_and_is_not_kept():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("bad request")
+
+    async def main():
+        flight = SingleFlight()
+        results = await asyncio.gather(flight.run("key", fail), flight.run("key", fail), return_exceptions=True)
+        retry = await flight.run("key", lambda: asyncio.sleep(0, "ok"))
+        return results, retry
+
+    results, retry = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert retry == "ok"
+
+def test_cancelled_caller_does_not_cancel_others():
+    async def fn():
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def main():
+        flight = SingleFlight()
+        first = asyncio.ensure_future(flight.run("key", fn))
+        second = asyncio.ensure_future(flight.run("key", fn))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == "answer"
@@ -0,0 +1,57 @@
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.main import app
+from app.utils.upload_limits import MULTIPART_OVERHEAD, UploadSizeLimitMiddleware
+
+def test_oversized_upload_gets_cors_headers():
+    client = TestClient(app)
+    response = client.post(
+        "/api/vqa/upload",
+        files={"file": ("image.png", b"\0" * (settings.MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD + 1), "image/png")},
+        headers={"Origin": "http://localhost:3000"}
+    )
+
+    assert response.status_code == 413
+    assert "access-control-allow-origin" in response.headers
+
+def limited_client(calls):
+    """Client for an app echoing the body size, limited to 100 bytes of file on /upload"""
+    async def echo(scope, receive, send):
+        calls.append(scope["path"])
+        size = 0
+        while True:
+            message = await receive()
+            size += len(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": str(size).encode()})
+
+    return TestClient(UploadSizeLimitMiddleware(echo, max_size=100, paths=["/upload"]))
+
+def chunks(size, chunk_size=8192):
+    """Body streamed without a Content-Length"""
+    for offset in range(0, size, chunk_size):
+        yield b"\0" * min(chunk_size, size - offset)
+
+def test_declared_length_over_limit_is_rejected_before_reading():
+    calls = []
+    response = limited_client(calls).post("/upload", content=b"\0" * (100 + MULTIPART_OVERHEAD + 1))
+
+    assert response.status_code == 413
+    assert calls == []
+
+def test_chunked_body_over_limit_is_cut_off():
+    calls = []
+    response = limited_client(calls).post("/upload", content=chunks(100 + MULTIPART_OVERHEAD + 1))
+
+    assert response.status_code == 413
+    assert response.json() == {"detail": "Upload exceeds the maximum size of 100 bytes"}
+
+def test_body_within_limit_passes():
+    calls = []
+    client = limited_client(calls)
+
+    assert client.post("/upload", content=chunks(1000)).text == "1000"
+    assert client.post("/other", content=b"\0" * (100 + MULTIPART_OVERHEAD + 1)).status_code == 200
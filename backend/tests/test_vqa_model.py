@@ -0,0 +1,79 @@
+import pytest
+import torch
+from transformers import BertConfig, ViTConfig
+
+from app.models.vqa_model import VQAModel, _encode_bert_cls, _encode_vit_cls, _prune_tokens
+
+TOLERANCE = 1e-5
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    encoder_kwargs = {"hidden_size": 32, "num_hidden_layers": 3, "num_attention_heads": 2, "intermediate_size": 64}
+    model = VQAModel.from_config(
+        {"vision_model": "tiny-vit", "text_model": "tiny-bert", "hidden_size": 32, "dropout": 0.1},
+        8,
+        ViTConfig(image_size=64, patch_size=16, **encoder_kwargs),
+        BertConfig(vocab_size=100, max_position_embeddings=32, **encoder_kwargs)
+    )
+    return model.eval()
+
+@pytest.fixture(scope="module")
+def pixel_values():
+    torch.manual_seed(1)
+    return torch.randn(2, 3, 64, 64)
+
+@torch.no_grad()
+def test_vit_cls_only_final_layer_matches_full_encoder(model, pixel_values):
+    full = model.vision_encoder(pixel_values=pixel_values).last_hidden_state[:, 0]
+    cls_only = _encode_vit_cls(model.vision_encoder, pixel_values, 0.0, None, True)
+
+    assert torch.allclose(cls_only, full, atol=TOLERANCE)
+
+@torch.no_grad()
+def test_bert_cls_only_final_layer_matches_full_encoder(model):
+    # The second question is padded, so the attention mask matters
+    input_ids = torch.tensor([[2, 10, 11, 12, 13, 3], [2, 20, 21, 3, 0, 0]])
+    attention_mask = (input_ids != 0).long()
+    token_type_ids = torch.zeros_like(input_ids)
+
+    full = model.text_encoder(
+        input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids
+    ).last_hidden_state[:, 0]
+    cls_only = _encode_bert_cls(model.text_encoder, input_ids, attention_mask, token_type_ids)
+
+    assert torch.allclose(cls_only, full, atol=TOLERANCE)
+
+@torch.no_grad()
+def test_cls_only_model_embeddings_match(model, pixel_values):
+    full = model.encode_image({"pixel_values": pixel_values})
+    model.set_token_pruning(cls_only_final_layer=True)
+    try:
+        cls_only = model.encode_image({"pixel_values": pixel_values})
+    finally:
+        model.set_token_pruning()
+
+    assert torch.allclose(cls_only, full, atol=TOLERANCE)
+
+@torch.no_grad()
+def test_zero_prune_ratio_keeps_every_token(model, pixel_values):
+    full = model.vision_encoder(pixel_values=pixel_values).last_hidden_state[:, 0]
+    unpruned = _encode_vit_cls(model.vision_encoder, pixel_values, 0.0, [0, 1], False)
+    assert torch.allclose(unpruned, full, atol=TOLERANCE)
+
+    hidden_states = torch.randn(2, 17, 32)
+    attention_probs = torch.softmax(torch.randn(2, 2, 17, 17), dim=-1)
+    assert torch.equal(_prune_tokens(hidden_states, attention_probs, 0.0), hidden_states)
+
+def test_prune_keeps_cls_and_most_attended_patches():
+    hidden_states = torch.arange(5, dtype=torch.float).reshape(1, 5, 1).expand(1, 5, 4)
+    attention_probs = torch.zeros(1, 2, 5, 5)
+    attention_probs[0, :, 0] = torch.tensor([0.0, 0.1, 0.4, 0.2, 0.3])
+
+    pruned = _prune_tokens(hidden_states, attention_probs, 0.5)
+
+    assert pruned[0, :, 0].tolist() == [0, 2, 4]
+
+def test_prune_ratio_must_be_below_one(model):
+    with pytest.raises(ValueError):
+        model.set_token_pruning(1.0)